@@ -1,156 +1,189 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import requests
-from bs4 import BeautifulSoup, Tag
 from datetime import datetime
 import validators
-from dateutil import parser
 import urllib3
+from formatters import STYLES, SOURCE_TYPES, CitationMessage, compiled_preparer, format_source, format_many
+from fetch_engine import fetch_all
+import http_client
+import parse_pool
+from metadata_cache import metadata_cache
+from politeness import HostThrottled, SingleFlight
+from urls import cache_key, canonicalize, dedupe
+from config import Config
+from models import db, Citation
+import repository
+import migrations
+from auth import auth, token_required
+import exporters
+import importers
+import source_store
+import responses
+import resolver
+import normalization
+import instrumentation
+from instrumentation import timer
+import jobs
+import io
 import json
-from urllib.parse import urlparse
-from citation_rules import get_citation_rules, validate_citation, format_citation
+import logging
 import os
+import time
+from itertools import islice
+
+instrumentation.configure_logging()
+logger = logging.getLogger(__name__)
 
 # Disable SSL verification warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 app = Flask(__name__)
+app.config.from_object(Config)
+db.init_app(app)
+app.register_blueprint(auth, url_prefix='/auth')
+source_store.init_app(app)
+responses.init_app(app)
+
+with app.app_context():
+    repository.configure_engine(db.engine)
+    migrations.create_tables(db.engine)
+    migrations.upgrade(db.engine)
 CORS(app, resources={
     r"/api/*": {
         "origins": ["http://localhost:3000", "https://citationfrontend.onrender.com"],
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "methods": ["GET", "POST", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization"],
+        "expose_headers": ["X-Next-Cursor"]
     }
 })
 
+@app.before_request
+def start_request_timing():
+    g.request_started = time.perf_counter()
+    instrumentation.start_request()
+
+@app.after_request
+def record_request_timing(response):
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    instrumentation.observe('http_request_duration_seconds', elapsed,
+                            endpoint=endpoint, method=request.method, status=response.status_code)
+    timings = instrumentation.current_timings()
+    if instrumentation.SERVER_TIMING and timings is not None:
+        response.headers['Server-Timing'] = timings.header(total=elapsed)
+    return response
+
 # Add health check endpoint
 @app.route('/', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'http': http_client.connection_stats(),
+        'cache': metadata_cache.stats(),
+        'normalization': normalization.cache_stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
 def extract_metadata(url):
+    return extract_metadata_outcome(url)[0]
+
+def extract_metadata_outcome(url):
+    """Return (metadata, outcome) for url, counting the outcome."""
+    metadata, outcome = _extract_metadata(canonicalize(url))
+    instrumentation.inc('citation_extractions_total', result=outcome)
+    return metadata, outcome
+
+def _extract_metadata(url):
+    """Return (metadata, outcome); outcome labels how the result was obtained."""
     try:
         if not validators.url(url):
-            print(f"Invalid URL format: {url}")
-            return None
+            logger.info("Invalid URL format: %s", url)
+            return None, 'failure'
             
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Connection': 'keep-alive'
-        }
-        
-        print(f"Fetching URL: {url}")
-        response = requests.get(url, headers=headers, verify=False, timeout=10)
-        
-        if response.status_code != 200:
-            print(f"Request failed with status code: {response.status_code}")
-            return None
+        stored = source_store.lookup(url)
+        if stored and source_store.is_fresh(stored):
+            return stored['metadata'], 'stored'
             
-        print("Parsing content...")
-        soup = BeautifulSoup(response.text, 'html.parser')
+        logger.debug("Fetching URL: %s", url)
+        # DNS, connect, TLS and time to the response headers
+        with timer('connect'):
+            response = http_client.get(url, stream=True, headers=source_store.conditional_headers(stored))
+        page = http_client.StreamedPage(response)
         
-        metadata = {
-            'title': '',
-            'author': '',
-            'date': '',
-            'publisher': ''
-        }
-        
-        # Try JSON-LD first (most reliable when available)
-        json_ld = soup.find('script', {'type': 'application/ld+json'})
-        if json_ld:
-            try:
-                data = json.loads(json_ld.string)
-                if isinstance(data, list):
-                    data = data[0]
-                print("Found JSON-LD data")
+        try:
+            if response.status_code == 304 and stored:
+                source_store.mark_revalidated(url, response)
+                return stored['metadata'], 'revalidated'
                 
-                metadata['title'] = data.get('headline', '') or data.get('name', '')
-                metadata['date'] = data.get('datePublished', '') or data.get('dateCreated', '')
+            if response.status_code != 200:
+                logger.info("Request for %s failed with status code: %s", url, response.status_code)
+                return None, 'failure'
                 
-                author = data.get('author', {})
-                if isinstance(author, list):
-                    author = author[0]
-                metadata['author'] = author.get('name', '') if isinstance(author, dict) else str(author)
+            if not http_client.is_html(response):
+                logger.info("Skipping non-HTML content at %s: %s", url, response.headers.get('Content-Type'))
+                return None, 'failure'
                 
-                publisher = data.get('publisher', {})
-                metadata['publisher'] = publisher.get('name', '') if isinstance(publisher, dict) else str(publisher)
-            except Exception as e:
-                print(f"Error parsing JSON-LD: {e}")
+            metadata = parse_page(page, url)
+        finally:
+            page.close()
         
-        # Fallback to meta tags if needed
-        if not metadata['title']:
-            # Try meta tags first
-            meta_title = (
-                soup.find('meta', {'property': 'og:title'}) or
-                soup.find('meta', {'name': 'title'}) or
-                soup.find('meta', {'name': 'twitter:title'})
-            )
-            if meta_title:
-                metadata['title'] = meta_title.get('content', '')
-            # Fallback to title tag
-            elif soup.title:
-                metadata['title'] = soup.title.string
-            # Last resort: h1
-            elif soup.find('h1'):
-                metadata['title'] = soup.find('h1').get_text()
-        
-        if not metadata['author']:
-            meta_author = (
-                soup.find('meta', {'property': 'article:author'}) or
-                soup.find('meta', {'name': 'author'}) or
-                soup.find('meta', {'property': 'og:article:author'})
-            )
-            if meta_author:
-                metadata['author'] = meta_author.get('content', '')
-        
-        if not metadata['date']:
-            meta_date = (
-                soup.find('meta', {'property': 'article:published_time'}) or
-                soup.find('meta', {'name': 'date'}) or
-                soup.find('time', {'datetime': True})
-            )
-            if meta_date:
-                date_str = meta_date.get('content', '') or meta_date.get('datetime', '')
-                try:
-                    parsed_date = parser.parse(date_str)
-                    metadata['date'] = parsed_date.strftime('%Y, %B %d')
-                except Exception as e:
-                    print(f"Error parsing date: {e}")
-        
-        if not metadata['publisher']:
-            meta_publisher = (
-                soup.find('meta', {'property': 'og:site_name'}) or
-                soup.find('meta', {'name': 'publisher'})
-            )
-            if meta_publisher:
-                metadata['publisher'] = meta_publisher.get('content', '')
-            else:
-                # Use domain name as fallback
-                domain = urlparse(url).netloc
-                metadata['publisher'] = domain.replace('www.', '')
-        
-        # Clean up the metadata
-        for key in metadata:
-            if metadata[key]:
-                # Remove extra whitespace and newlines
-                metadata[key] = ' '.join(metadata[key].split())
-                # Remove common website suffixes from title
-                if key == 'title':
-                    parts = metadata[key].split(' - ')
-                    metadata[key] = parts[0].strip()
-                    # If we don't have a publisher and there's a suffix, use it
-                    if not metadata['publisher'] and len(parts) > 1:
-                        metadata['publisher'] = parts[-1].strip()
-        
-        print(f"Extracted metadata: {metadata}")
-        return metadata
+        logger.debug("Extracted metadata from %s: %s", url, metadata)
+        source_store.save(url, metadata, response)
+        return metadata, 'success'
         
+    except HostThrottled as e:
+        logger.info("Not fetching %s: %s", url, e)
+        return None, 'throttled'
     except Exception as e:
-        print(f"Error extracting metadata: {e}")
-        return None
+        logger.warning("Error extracting metadata from %s: %s", url, e)
+        return None, 'failure'
+
+def parse_page(page, url):
+    """
+    Parse metadata from a fetched page, reading past </head> only when the
+    head lacks a title or date. Downloading happens here; parsing itself is
+    the pure parse_metadata(html, url), run on the parsing pool for large pages.
+    """
+    if http_client.STREAM_HEAD:
+        with timer('download'):
+            html = page.read_head()
+        metadata = parse_pool.parse(html, url)
+        # The <h1>/<time> fallbacks (and body JSON-LD) need the rest of the page
+        if (metadata['title'] and metadata['date']) or page.complete:
+            return metadata
+    with timer('download'):
+        html = page.read_all()
+    return parse_pool.parse(html, url)
+
+# Concurrent requests for the same URL in this worker share one extraction
+extractions_in_flight = SingleFlight()
+
+def get_metadata(url):
+    """
+    Return (metadata, cache_hit) for url, extracting only on a cache miss.
+    A result shared from another request's in-flight extraction counts as a hit.
+    """
+    if not isinstance(url, str):
+        # Request bodies are JSON, so a batch can hold numbers, objects, ...
+        return None, False
+    found, metadata = metadata_cache.get(url)
+    if found:
+        return metadata, True
+    return extractions_in_flight.do(cache_key(url), lambda: extract_and_cache(url))
+
+def extract_and_cache(url):
+    metadata, outcome = extract_metadata_outcome(url)
+    # Our own back-off from the host says nothing about the page, so the
+    # next request should try again rather than hit a cached failure
+    if outcome != 'throttled':
+        metadata_cache.set(url, metadata)
+    return metadata
 
 @app.route('/api/extract-metadata', methods=['POST'])
 def extract_url_metadata():
@@ -161,18 +194,35 @@ def extract_url_metadata():
         if not url:
             return jsonify({'error': 'URL is required'}), 400
             
-        print(f"Processing URL: {url}")
-        metadata = extract_metadata(url)
+        metadata, cached = get_metadata(url)
+        cache_header = {'X-Cache': 'HIT' if cached else 'MISS'}
         
         if metadata is None:
-            return jsonify({'error': 'Failed to extract metadata. Please fill in the details manually.'}), 400
+            return jsonify({'error': 'Failed to extract metadata. Please fill in the details manually.'}), 400, cache_header
             
-        return jsonify(metadata)
+        return jsonify(metadata), 200, cache_header
         
     except Exception as e:
-        print(f"Error: {e}")
+        logger.warning("Error extracting metadata: %s", e)
         return jsonify({'error': str(e)}), 400
 
+def extract_result(url, value, error):
+    """Build one /api/batch-extract-metadata result from a fetch_all outcome."""
+    metadata, cached = value or (None, False)
+    if metadata:
+        return {
+            'url': url,
+            'metadata': metadata,
+            'cached': cached,
+            'success': True
+        }
+    return {
+        'url': url,
+        'error': error or 'Failed to extract metadata',
+        'cached': cached,
+        'success': False
+    }
+
 @app.route('/api/batch-extract-metadata', methods=['POST'])
 def batch_extract_metadata():
     try:
@@ -182,34 +232,49 @@ def batch_extract_metadata():
         if not urls:
             return jsonify({'error': 'No URLs provided'}), 400
             
-        results = []
-        for url in urls:
-            try:
-                metadata = extract_metadata(url)
-                if metadata:
-                    results.append({
-                        'url': url,
-                        'metadata': metadata,
-                        'success': True
-                    })
-                else:
-                    results.append({
-                        'url': url,
-                        'error': 'Failed to extract metadata',
-                        'success': False
-                    })
-            except Exception as e:
-                results.append({
-                    'url': url,
-                    'error': str(e),
-                    'success': False
-                })
+        # Fetch each resource once, then copy its result to every position it came from
+        unique, positions = dedupe(urls)
+        results = [None] * len(urls)
+        for indexes, (value, error) in zip(positions, fetch_all(unique, get_metadata)):
+            for index in indexes:
+                results[index] = extract_result(urls[index], value, error)
                 
-        return jsonify(results)
+        return responses.batch_response(results)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/resolve-identifier', methods=['POST'])
+def resolve_identifier():
+    data = request.get_json(silent=True) or {}
+    identifier = data.get('identifier')
+    
+    if not identifier:
+        return jsonify({'error': 'Identifier is required'}), 400
+        
+    record, error = resolver.resolve(identifier)
+    if error:
+        return jsonify({'error': error}), 404 if error == resolver.NOT_FOUND else 400
+    return jsonify(record)
+
+@app.route('/api/batch-resolve-identifiers', methods=['POST'])
+def batch_resolve_identifiers():
+    data = request.get_json(silent=True) or {}
+    identifiers = data.get('identifiers', [])
+    
+    if not identifiers or not isinstance(identifiers, list):
+        return jsonify({'error': 'No identifiers provided'}), 400
+    if len(identifiers) > resolver.MAX_IDENTIFIERS:
+        return jsonify({'error': f'At most {resolver.MAX_IDENTIFIERS} identifiers per request'}), 400
+        
+    results = []
+    for identifier, (record, error) in zip(identifiers, resolver.resolve_many(identifiers)):
+        if record:
+            results.append({'identifier': identifier, 'metadata': record, 'success': True})
+        else:
+            results.append({'identifier': identifier, 'error': error, 'success': False})
+    return responses.batch_response(results)
+
 @app.route('/api/generate-citation', methods=['POST'])
 def generate_citation():
     data = request.json
@@ -217,13 +282,8 @@ def generate_citation():
     style = data.get('style')
     
     try:
-        if source_type == 'book':
-            citation_text = format_book_citation(data, style)
-        elif source_type == 'website':
-            citation_text = format_website_citation(data, style)
-        elif source_type == 'journal':
-            citation_text = format_journal_citation(data, style)
-        else:
+        citation_text = format_source(data, style, source_type)
+        if citation_text is None:
             return jsonify({'error': 'Unsupported source type'}), 400
             
         return jsonify({
@@ -235,6 +295,18 @@ def generate_citation():
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+def generate_result(citation, error=None):
+    """Build one /api/batch-generate-citations result from a format_many outcome."""
+    if citation:
+        return {
+            'citation': citation,
+            'success': True
+        }
+    return {
+        'error': error or 'Failed to generate citation',
+        'success': False
+    }
+
 @app.route('/api/batch-generate-citations', methods=['POST'])
 def batch_generate_citations():
     try:
@@ -245,204 +317,309 @@ def batch_generate_citations():
         if not items:
             return jsonify({'error': 'No items provided'}), 400
             
-        results = []
-        for item in items:
-            try:
-                if item.get('sourceType') == 'website':
-                    citation = format_website_citation(item, style)
-                elif item.get('sourceType') == 'book':
-                    citation = format_book_citation(item, style)
-                elif item.get('sourceType') == 'journal':
-                    citation = format_journal_citation(item, style)
-                else:
-                    citation = None
-                    
-                if citation:
-                    results.append({
-                        'citation': citation,
-                        'success': True
-                    })
-                else:
-                    results.append({
-                        'error': 'Failed to generate citation',
-                        'success': False
-                    })
-            except Exception as e:
-                results.append({
-                    'error': str(e),
-                    'success': False
-                })
+        results = [generate_result(citation, error) for citation, error in format_many(items, style)]
                 
-        return jsonify(results)
+        return responses.batch_response(results)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
-def format_website_citation(data, style):
-    # Validate citation data
-    validation = validate_citation(data, style, 'website')
-    if not validation['valid']:
-        return f"Error: {', '.join(validation['errors'])}"
-
-    # Get citation rules
-    rules = get_citation_rules(style, 'website')
-    if not rules:
-        return "Citation style not supported"
-
-    # Clean and format data according to rules
-    formatted_data = {
-        'author': data.get('author', ''),
-        'date': data.get('date', ''),
-        'title': data.get('title', ''),
-        'publisher': data.get('publisher', ''),
-        'url': data.get('url', '')
+EXPORT_WINDOW = int(os.environ.get('EXPORT_WINDOW', 500))
+
+def serialize_citation(citation):
+    return {
+        'id': citation.id,
+        'source_type': citation.source_type,
+        'style': citation.style,
+        'citation_text': citation.citation_text,
+        'source_data': citation.source_data,
+        'created_at': citation.created_at.isoformat() if citation.created_at else None
     }
 
-    # Format author according to style
-    if formatted_data['author']:
-        if style == 'APA':
-            # APA: Last, F. M.
-            names = formatted_data['author'].split()
-            if len(names) > 1:
-                formatted_data['author'] = f"{names[-1]}, {' '.join(n[0] + '.' for n in names[:-1])}"
-        elif style == 'MLA':
-            # MLA: Last, First Middle
-            names = formatted_data['author'].split()
-            if len(names) > 1:
-                formatted_data['author'] = f"{names[-1]}, {' '.join(names[:-1])}"
-
-    # Format date according to style
-    if formatted_data['date']:
-        try:
-            date_obj = parser.parse(formatted_data['date'])
-            if style == 'APA':
-                formatted_data['date'] = date_obj.strftime('%Y')
-            elif style == 'MLA':
-                formatted_data['date'] = date_obj.strftime('%d %b. %Y')
-        except:
-            pass  # Keep original date format if parsing fails
-
-    # Format title according to style
-    if formatted_data['title']:
-        if style == 'APA':
-            # APA: Only capitalize first word
-            formatted_data['title'] = formatted_data['title'].capitalize()
-        elif style == 'MLA':
-            # MLA: Title case
-            formatted_data['title'] = ' '.join(word.capitalize() for word in formatted_data['title'].split())
-
-    # Use the citation formatter
-    citation = format_citation(formatted_data, style, 'website')
-    return citation if citation else "Error formatting citation"
-
-def format_book_citation(data, style):
-    authors = data.get('authors', [])
-    title = data.get('title', '')
-    year = data.get('year', '')
-    publisher = data.get('publisher', '')
-    
-    if style == 'APA':
-        # APA 7th edition format for books:
-        # Author, A. A. (Year). Title (in italics). Publisher.
+def serialize_bibliography(bibliography, citations=False):
+    result = {
+        'id': bibliography.id,
+        'name': bibliography.name,
+        'citation_count': getattr(bibliography, 'citation_count', 0),
+        'created_at': bibliography.created_at.isoformat() if bibliography.created_at else None,
+        'updated_at': bibliography.updated_at.isoformat() if bibliography.updated_at else None
+    }
+    if citations:
+        result['citations'] = [serialize_citation(citation) for citation in bibliography.citations]
+    return result
+
+def paginated(items, next_cursor):
+    """A JSON list response; the cursor for the next page travels in X-Next-Cursor."""
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@app.route('/api/bibliography', methods=['GET'])
+@token_required
+def list_bibliographies(user):
+    with_citations = request.args.get('include') == 'citations'
+    try:
+        bibliographies, next_cursor = repository.list_bibliographies(
+            user.id,
+            limit=request.args.get('limit', type=int),
+            cursor=request.args.get('cursor'),
+            with_citations=with_citations
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated([serialize_bibliography(b, citations=with_citations) for b in bibliographies], next_cursor)
+
+@app.route('/api/bibliography', methods=['POST'])
+@token_required
+def create_bibliography(user):
+    data = request.json or {}
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({'error': 'Bibliography name is required'}), 400
+        
+    bibliography = repository.create_bibliography(user.id, name[:100])
+    db.session.commit()
+    return jsonify(serialize_bibliography(bibliography)), 201
+
+@app.route('/api/bibliography/<int:bibliography_id>/citations', methods=['GET'])
+@token_required
+def list_citations(user, bibliography_id):
+    if repository.get_bibliography(user.id, bibliography_id) is None:
+        return jsonify({'error': 'Bibliography not found'}), 404
+    try:
+        citations, next_cursor = repository.list_citations(
+            bibliography_id,
+            limit=request.args.get('limit', type=int),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return paginated([serialize_citation(citation) for citation in citations], next_cursor)
+
+def export_rows(bibliography_id, style):
+    """Yield (source_type, source_data, citation_text) rows, re-rendering for a different style."""
+    for source_type, stored_style, citation_text, source_data in repository.iter_citation_rows(bibliography_id, EXPORT_WINDOW):
+        if style and style != stored_style and source_type in SOURCE_TYPES:
+            try:
+                prepare, render = compiled_preparer(style, source_type)
+                citation_text = render(prepare(source_data)) or citation_text
+            except CitationMessage:
+                # e.g. a field the new style requires is missing; the stored
+                # citation beats an error message in the export
+                pass
+        yield source_type, source_data, citation_text
+
+@app.route('/api/bibliography/<int:bibliography_id>/export', methods=['GET'])
+@token_required
+def export_bibliography(user, bibliography_id):
+    export_format = request.args.get('format', 'text')
+    if export_format not in exporters.EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported export format. Use one of: {', '.join(exporters.EXPORT_FORMATS)}"}), 400
+    style = request.args.get('style')
+    if style and style not in STYLES:
+        return jsonify({'error': f"Unsupported citation style. Use one of: {', '.join(STYLES)}"}), 400
+        
+    bibliography = repository.get_bibliography(user.id, bibliography_id)
+    if bibliography is None:
+        return jsonify({'error': 'Bibliography not found'}), 404
         
-        # Format authors
-        if len(authors) > 1:
-            authors_str = ', '.join(authors[:-1]) + ', & ' + authors[-1]
+    fmt = exporters.EXPORT_FORMATS[export_format]
+    filename = ''.join(c if c.isalnum() or c in '-_' else '_' for c in bibliography.name) or 'bibliography'
+    rows = export_rows(bibliography.id, style if fmt.uses_text else None)
+    body = exporters.stream(export_format, rows)
+    return Response(stream_with_context(body), mimetype=fmt.mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}.{fmt.extension}"'
+    })
+
+IMPORT_BATCH = int(os.environ.get('IMPORT_BATCH', 500))
+IMPORT_MAX_ERRORS = 50
+
+def import_records(records, bibliography_id, style):
+    """Format parsed records in batches and bulk-insert them; returns (imported, failed, errors)."""
+    imported = failed = 0
+    errors = []
+    numbered = enumerate(records, 1)
+    while True:
+        batch = list(islice(numbered, IMPORT_BATCH))
+        if not batch:
+            break
+        valid = []
+        for number, record in batch:
+            if isinstance(record, importers.InvalidRecord):
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({'entry': number, 'line': record.line, 'error': record.error})
+            else:
+                valid.append((number, record))
+                
+        rows = []
+        results = format_many([record for _, record in valid], style, messages_as_errors=True)
+        for (number, record), (citation, error) in zip(valid, results):
+            if not citation:
+                failed += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({'entry': number, 'error': error or 'Unsupported source type'})
+                continue
+            rows.append({
+                'source_type': record['sourceType'],
+                'style': style,
+                'citation_text': citation,
+                'source_data': record,
+                'bibliography_id': bibliography_id
+            })
+        if rows:
+            # One executemany per batch instead of a session.add per citation
+            db.session.execute(Citation.__table__.insert(), rows)
+            imported += len(rows)
+    return imported, failed, errors
+
+@app.route('/api/bibliography/import', methods=['POST'])
+@token_required
+def import_bibliography(user):
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'No file provided'}), 400
+    import_format = request.form.get('format') or importers.detect_format(upload.filename)
+    if import_format not in importers.PARSERS:
+        return jsonify({'error': f"Unsupported import format. Use one of: {', '.join(importers.PARSERS)}"}), 400
+    style = request.form.get('style', 'APA')
+        
+    try:
+        bibliography_id = request.form.get('bibliographyId', type=int)
+        if bibliography_id:
+            bibliography = repository.get_bibliography(user.id, bibliography_id)
+            if bibliography is None:
+                return jsonify({'error': 'Bibliography not found'}), 404
         else:
-            authors_str = authors[0] if authors else ''
+            name = request.form.get('name') or (upload.filename or '').rsplit('.', 1)[0] or 'Imported bibliography'
+            bibliography = repository.create_bibliography(user.id, name[:100])
             
-        # Build citation
-        citation = f"{authors_str}"
-        if year:
-            citation += f" ({year})"
-        citation += f". {title}"  # Note: Title should be italicized in actual display
-        if publisher:
-            citation += f". {publisher}"
-        citation += "."
+        # Decode and parse the upload line by line; newline='' keeps quoted CSV newlines intact
+        lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace', newline='')
+        records = importers.PARSERS[import_format](lines)
+        imported, failed, errors = import_records(records, bibliography.id, style)
+        db.session.commit()
         
-        return citation
+        return jsonify({
+            'bibliography': {
+                'id': bibliography.id,
+                'name': bibliography.name
+            },
+            'imported': imported,
+            'failed': failed,
+            'errors': errors
+        })
         
-    else:  # MLA 9th edition
-        # MLA format for books:
-        # Author(s). Title (in italics). Publisher, Year.
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("Error importing bibliography: %s", e)
+        return jsonify({'error': str(e)}), 400
+
+def run_extract_job(job, payload):
+    urls = payload['urls']
+    unique, positions = dedupe(urls)
+
+    def on_result(slot, value, error):
+        job.add_results([(index, extract_result(urls[index], value, error)) for index in positions[slot]])
+
+    fetch_all(
+        unique,
+        get_metadata,
+        deadline=jobs.JOB_DEADLINE,
+        on_result=on_result,
+        cancelled=job.is_cancelled
+    )
+
+def run_generate_job(job, payload):
+    items, style = payload['items'], payload['style']
+    # Results are written in chunks to keep SQLite commits off the per-item path
+    chunk_size = 200
+    for start in range(0, len(items), chunk_size):
+        if job.is_cancelled():
+            return
+        chunk = format_many(items[start:start + chunk_size], style)
+        job.add_results([
+            (start + offset, generate_result(citation, error))
+            for offset, (citation, error) in enumerate(chunk)
+        ])
+
+jobs.register('extract-metadata', run_extract_job)
+jobs.register('generate-citations', run_generate_job)
+# Jobs left unfinished by a worker that exited (crash, restart, max_requests)
+jobs.recover_orphans()
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    try:
+        data = request.json
+        job_type = data.get('type')
         
-        # Format authors
-        if len(authors) > 2:
-            authors_str = ', '.join(authors[:-1]) + ', and ' + authors[-1]
-        elif len(authors) == 2:
-            authors_str = authors[0] + ' and ' + authors[1]
+        if job_type == 'extract-metadata':
+            items = data.get('urls', [])
+            payload = {'urls': items}
+        elif job_type == 'generate-citations':
+            items = data.get('items', [])
+            payload = {'items': items, 'style': data.get('style', 'APA')}
         else:
-            authors_str = authors[0] if authors else ''
+            return jsonify({'error': 'Unsupported job type'}), 400
+            
+        if not items:
+            return jsonify({'error': 'No items provided'}), 400
+        if len(items) > jobs.JOB_MAX_ITEMS:
+            return jsonify({'error': f'Too many items (maximum {jobs.JOB_MAX_ITEMS})'}), 400
             
-        # Build citation
-        citation = f"{authors_str}. {title}"  # Note: Title should be italicized in actual display
-        if publisher:
-            citation += f". {publisher}"
-        if year:
-            citation += f", {year}"
-        citation += "."
+        job_id = jobs.submit(job_type, payload, len(items))
+        return jsonify(jobs.get_job(job_id)), 202
         
-        return citation
-
-def format_journal_citation(data, style):
-    title = data.get('title', '')
-    authors = data.get('authors', [])
-    journal = data.get('journal', '')
-    volume = data.get('volume', '')
-    issue = data.get('issue', '')
-    year = data.get('year', '')
-    pages = data.get('pages', '')
-    doi = data.get('doi', '')
-
-    if style == 'APA':
-        # Format authors
-        if not authors:
-            authors_str = "No author"
-        elif len(authors) == 1:
-            authors_str = authors[0]
-        elif len(authors) == 2:
-            authors_str = f"{authors[0]} & {authors[1]}"
-        else:
-            authors_str = ", ".join(authors[:-1]) + f", & {authors[-1]}"
-
-        citation = f"{authors_str}. ({year}). {title}. {journal}"
-        if volume:
-            citation += f", {volume}"
-            if issue:
-                citation += f"({issue})"
-        if pages:
-            citation += f", {pages}"
-        if doi:
-            citation += f". https://doi.org/{doi}"
-        citation += "."
-        return citation
-
-    elif style == 'MLA':
-        # Format authors
-        if not authors:
-            authors_str = "No author"
-        elif len(authors) == 1:
-            authors_str = authors[0]
-        elif len(authors) == 2:
-            authors_str = f"{authors[0]} and {authors[1]}"
-        else:
-            authors_str = ", ".join(authors[:-1]) + f", and {authors[-1]}"
-
-        citation = f'{authors_str}. "{title}." {journal}'
-        if volume and issue:
-            citation += f", vol. {volume}, no. {issue}"
-        elif volume:
-            citation += f", vol. {volume}"
-        if year:
-            citation += f", {year}"
-        if pages:
-            citation += f", pp. {pages}"
-        if doi:
-            citation += f", https://doi.org/{doi}"
-        citation += "."
-        return citation
-
-    return "Citation style not supported"
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if not jobs.cancel(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(jobs.get_job(job_id))
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+        
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', 1000, type=int), 1000)
+    results, cursor = jobs.get_results(job_id, after, limit)
+    return jsonify({
+        'job': job,
+        'results': responses.columnar(results) if responses.wants_columnar() else results,
+        'next': cursor
+    })
+
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+def stream_job_results(job_id):
+    if jobs.get_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+        
+    # Server-sent events when asked for, newline-delimited JSON otherwise
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        def generate():
+            for result in jobs.follow(job_id):
+                yield f"data: {json.dumps(result)}\n\n"
+            yield f"event: done\ndata: {json.dumps(jobs.get_job(job_id))}\n\n"
+        return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+        
+    def generate():
+        for result in jobs.follow(job_id):
+            yield json.dumps(result) + '\n'
+    return Response(generate(), mimetype='application/x-ndjson')
 
 # For local development
 if __name__ == '__main__':
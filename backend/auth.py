@@ -1,39 +1,190 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, g, request, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
-from datetime import datetime, timedelta
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from config import Config
+from hashing import HashingBusy, hash_password, needs_rehash, verify_password
 from models import db, User
+import repository
+import logging
+import os
+import threading
+import time
 
 auth = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
 
-SECRET_KEY = 'your-secret-key'  # In production, use environment variable
+SECRET_KEY = Config.SECRET_KEY
+TOKEN_LIFETIME = timedelta(days=7)
+# Verified tokens are trusted for this long without touching the database.
+# Revocation is immediate in the worker that handles it and reaches the
+# others within this window.
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', 60))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+# Longer passwords are refused before hashing so they can't be used to burn CPU
+MAX_PASSWORD_LENGTH = 1024
+MAX_EMAIL_LENGTH = 120
+
+# The user fields request handlers need, detached from the session
+AuthenticatedUser = namedtuple('AuthenticatedUser', 'id email')
+
+def _timestamp(value):
+    return value.replace(tzinfo=timezone.utc).timestamp() if value else 0
+
+class TokenCache:
+    """Bounded LRU of verified token -> AuthenticatedUser, with per-entry expiry."""
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._data.get(token)
+            if entry is None:
+                return None
+            expires_at, issued_at, user = entry
+            if expires_at <= time.time() or issued_at < self._revoked.get(user.id, 0):
+                del self._data[token]
+                return None
+            self._data.move_to_end(token)
+            return user
+
+    def set(self, token, user, issued_at, token_expires_at):
+        with self._lock:
+            self._data[token] = (min(time.time() + self.ttl, token_expires_at), issued_at, user)
+            self._data.move_to_end(token)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def revoke(self, user_id, revoked_at):
+        """Reject cached tokens for user_id issued before revoked_at."""
+        with self._lock:
+            if revoked_at > self._revoked.get(user_id, 0):
+                self._revoked[user_id] = revoked_at
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._revoked.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+token_cache = TokenCache()
 
 def generate_token(user_id):
+    now = time.time()
     return jwt.encode(
         {
             'user_id': user_id,
-            'exp': datetime.utcnow() + timedelta(days=7)
+            # Sub-second precision so a token issued right after a revocation stays valid
+            'iat': now,
+            'exp': datetime.utcnow() + TOKEN_LIFETIME
         },
         SECRET_KEY,
         algorithm='HS256'
     )
 
-@auth.route('/register', methods=['POST'])
-def register():
-    data = request.json
+def authenticate(token):
+    """
+    Return (AuthenticatedUser, None) for a valid token or (None, error message).
+
+    A token seen recently is answered from token_cache; otherwise its
+    signature is verified and the user loaded once, then cached.
+    """
+    user = token_cache.get(token)
+    if user is not None:
+        return user, None
+    try:
+        data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        return None, 'Token has expired'
+    except jwt.InvalidTokenError:
+        return None, 'Invalid token'
+    record = repository.get_user(data.get('user_id'))
+    if not record:
+        return None, 'User not found'
+    revoked_at = _timestamp(record.tokens_revoked_at)
+    if revoked_at:
+        token_cache.revoke(record.id, revoked_at)
+    issued_at = data.get('iat', 0)
+    if issued_at < revoked_at:
+        return None, 'Token has been revoked'
+    user = AuthenticatedUser(record.id, record.email)
+    token_cache.set(token, user, issued_at, data['exp'])
+    return user, None
+
+def revoke_tokens(user_id):
+    """Invalidate every token issued to a user so far."""
+    now = datetime.utcnow()
+    user = repository.get_user(user_id)
+    user.tokens_revoked_at = now
+    db.session.commit()
+    token_cache.revoke(user_id, _timestamp(now))
+
+def token_required(view):
+    """Require a valid Bearer token and pass the AuthenticatedUser as the first argument."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user = g.get('user')
+        if user is None:
+            header = request.headers.get('Authorization', '')
+            if not header.startswith('Bearer '):
+                return jsonify({'error': 'No token provided'}), 401
+            user, error = authenticate(header.split(' ')[1])
+            if error:
+                return jsonify({'error': error}), 401
+            g.user = user
+        return view(user, *args, **kwargs)
+    return wrapper
+
+def read_credentials():
+    """
+    Return (email, password, None) from the JSON body, or (None, None, error)
+    for a request that can be refused without hashing anything. The checks
+    depend only on the request, so they reveal nothing about accounts.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, None, 'Email and password are required'
     email = data.get('email')
     password = data.get('password')
-    
-    if not email or not password:
-        return jsonify({'error': 'Email and password are required'}), 400
+    if not email or not password or not isinstance(email, str) or not isinstance(password, str):
+        return None, None, 'Email and password are required'
+    if len(email) > MAX_EMAIL_LENGTH or '@' not in email:
+        return None, None, 'Invalid email address'
+    if len(password) > MAX_PASSWORD_LENGTH:
+        return None, None, f'Password must be at most {MAX_PASSWORD_LENGTH} characters'
+    return email, password, None
+
+def busy_response():
+    response = jsonify({'error': 'Server busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@auth.route('/register', methods=['POST'])
+def register():
+    email, password, error = read_credentials()
+    if error:
+        return jsonify({'error': error}), 400
         
-    if User.query.filter_by(email=email).first():
+    if repository.find_user_by_email(email):
         return jsonify({'error': 'Email already registered'}), 400
         
+    try:
+        password_hash = hash_password(password)
+    except HashingBusy:
+        return busy_response()
+        
     user = User(
         email=email,
-        password=generate_password_hash(password, method='pbkdf2:sha256')
+        password=password_hash
     )
     
     try:
@@ -53,21 +204,31 @@ def register():
         db.session.rollback()
         return jsonify({'error': 'Failed to create user'}), 500
 
+def rehash(user, password):
+    """Store the password under the current hashing parameters; a failure only postpones it."""
+    try:
+        user.password = hash_password(password)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning("Password rehash failed for user %s: %s", user.id, e)
+
 @auth.route('/login', methods=['POST'])
 def login():
-    try:
-        data = request.json
-        email = data.get('email')
-        password = data.get('password')
+    email, password, error = read_credentials()
+    if error:
+        return jsonify({'error': error}), 400
         
-        if not email or not password:
-            return jsonify({'error': 'Email and password are required'}), 400
-            
-        user = User.query.filter_by(email=email).first()
+    try:
+        user = repository.find_user_by_email(email)
         
-        if not user or not check_password_hash(user.password, password):
+        # Unknown users are checked against a dummy hash so both cases take as long
+        if not verify_password(user.password if user else None, password) or not user:
             return jsonify({'error': 'Invalid email or password'}), 401
             
+        if needs_rehash(user.password):
+            rehash(user, password)
+            
         token = generate_token(user.id)
         
         return jsonify({
@@ -77,40 +238,28 @@ def login():
                 'email': user.email
             }
         })
+    except HashingBusy:
+        return busy_response()
     except Exception as e:
-        print(f"Login error: {str(e)}")
+        logger.warning("Login error: %s", e)
         return jsonify({'error': 'Login failed'}), 500
 
 @auth.route('/profile')
-def profile():
-    try:
-        token = request.headers.get('Authorization')
-        if not token or not token.startswith('Bearer '):
-            return jsonify({'error': 'No token provided'}), 401
-            
-        token = token.split(' ')[1]
-        
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            user = User.query.get(data['user_id'])
-            
-            if not user:
-                return jsonify({'error': 'User not found'}), 404
-                
-            return jsonify({
-                'user': {
-                    'id': user.id,
-                    'email': user.email
-                }
-            })
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
-            
-    except Exception as e:
-        print(f"Profile error: {str(e)}")
-        return jsonify({'error': 'Failed to get profile'}), 500
+@token_required
+def profile(user):
+    return jsonify({
+        'user': {
+            'id': user.id,
+            'email': user.email
+        }
+    })
+
+@auth.route('/logout-all', methods=['POST'])
+@token_required
+def logout_all(user):
+    """Revoke every token issued to the user, on all devices."""
+    revoke_tokens(user.id)
+    return jsonify({'message': 'All sessions logged out'})
 
 @auth.route('/logout')
 def logout():
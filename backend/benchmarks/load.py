@@ -0,0 +1,200 @@
+"""
+Load test comparing gunicorn serving modes on the metadata extraction endpoint.
+
+A local stub site serves the corpus pages after a fixed delay, standing in for
+a slow publisher. For each mode a single gunicorn worker is started and sent
+--requests extractions of distinct URLs, --concurrency at a time, and the
+throughput and latency percentiles are reported:
+
+    python benchmarks/load.py --modes sync gthread gevent --output load.json
+
+Caching, stored metadata and per-host rate limits are turned off in the
+server so every request really fetches a page from the stub.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from run import BACKEND_DIR, git_commit, load_corpus
+
+MODES = ('sync', 'gthread', 'gevent')
+
+
+class StubSite(ThreadingHTTPServer):
+    """Serves /page/<n> as the n-th corpus page (cycling) after `latency` seconds."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, pages, latency):
+        super().__init__(('127.0.0.1', 0), StubPage)
+        self.pages = pages
+        self.latency = latency
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StubPage(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        try:
+            body = self.server.pages[int(self.path.rsplit('/', 1)[-1]) % len(self.server.pages)]
+        except ValueError:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, concurrency, workdir):
+    env = dict(
+        os.environ,
+        SERVER_MODE=mode,
+        GUNICORN_THREADS=str(concurrency),
+        GUNICORN_WORKER_CONNECTIONS=str(max(concurrency, 100)),
+        METADATA_CACHE_BACKEND='none',
+        SOURCE_METADATA_STORE='0',
+        FETCH_HOST_RATE='0',
+        # Every request goes to the one stub host
+        HTTP_POOL_MAXSIZE=str(concurrency),
+        DATABASE_URL='sqlite:///' + os.path.join(workdir, 'load.db'),
+        METRICS_DB_PATH=os.path.join(workdir, 'metrics.db'),
+        JOBS_DB_PATH=os.path.join(workdir, 'jobs.db'),
+        LOG_LEVEL='WARNING',
+    )
+    command = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--workers', '1',
+               '--bind', f'127.0.0.1:{port}', 'app:app']
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    base = f'http://127.0.0.1:{port}'
+    give_up_at = time.monotonic() + 30
+    while time.monotonic() < give_up_at:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn ({mode}) exited with status {server.returncode}')
+        try:
+            requests.get(base + '/', timeout=5)
+            return server, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'gunicorn ({mode}) did not start')
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def run_load(base, site, mode, total, concurrency):
+    local = threading.local()
+
+    def extract(index):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        url = f'{site.url}/page/{mode}/{index}'
+        start = time.perf_counter()
+        response = session.post(base + '/api/extract-metadata', json={'url': url}, timeout=300)
+        return time.perf_counter() - start, response.status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(extract, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for latency, _ in outcomes)
+
+    def percentile(p):
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)], 1)
+
+    return {
+        'requests': total,
+        'ok': sum(ok for _, ok in outcomes),
+        'seconds': round(elapsed, 2),
+        'requests_per_sec': round(total / elapsed, 1),
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'max_ms': round(latencies[-1], 1),
+        'mean_ms': round(statistics.mean(latencies), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='serving modes to compare')
+    parser.add_argument('--requests', type=int, default=300, help='extractions per mode')
+    parser.add_argument('--concurrency', type=int, default=100, help='requests in flight at once')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds the stub site takes per page')
+    parser.add_argument('--pages', nargs='+', help='corpus pages to serve (default: all)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus()
+    pages = args.pages or list(corpus)
+    site = StubSite([corpus[name][1] for name in pages], args.latency)
+    threading.Thread(target=site.serve_forever, daemon=True).start()
+
+    results = {}
+    try:
+        for mode in args.modes:
+            with tempfile.TemporaryDirectory() as workdir:
+                server, base = start_server(mode, free_port(), args.concurrency, workdir)
+                try:
+                    results[mode] = run_load(base, site, mode, args.requests, args.concurrency)
+                finally:
+                    stop_server(server)
+            print(f"{mode:<8} {results[mode]['requests_per_sec']:>8} req/s  "
+                  f"p50 {results[mode]['p50_ms']:>8} ms  p95 {results[mode]['p95_ms']:>8} ms  "
+                  f"ok {results[mode]['ok']}/{args.requests}", file=sys.stderr)
+    finally:
+        site.shutdown()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'requests': args.requests, 'concurrency': args.concurrency, 'latency': args.latency,
+                     'pages': pages, 'workers': 1},
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
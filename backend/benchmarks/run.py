@@ -0,0 +1,468 @@
+"""
+Offline benchmarks for the extraction and formatting hot paths.
+
+Pages come from the saved HTML corpus next to this file and http_client.get
+is replaced by a stub serving them, so no network is needed. Results
+(per-stage timings, batch endpoint throughput, bulk formatting throughput,
+parsing pool throughput, SQL query counts for the bibliography endpoints and
+tracemalloc peaks) are written as JSON so runs from two commits can be
+compared:
+
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+# Measure extraction itself, not the metadata cache or stored metadata
+os.environ.setdefault('METADATA_CACHE_BACKEND', 'none')
+os.environ.setdefault('SOURCE_METADATA_STORE', '0')
+# Never touch the real databases: every SQLite file the app opens goes in a scratch directory
+SCRATCH_DIR = tempfile.mkdtemp(prefix='citation-benchmark-')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(SCRATCH_DIR, 'benchmark.db'))
+os.environ.setdefault('METRICS_DB_PATH', os.path.join(SCRATCH_DIR, 'metrics.db'))
+os.environ.setdefault('JOBS_DB_PATH', os.path.join(SCRATCH_DIR, 'jobs.db'))
+os.environ.setdefault('RESOLVER_DB_PATH', os.path.join(SCRATCH_DIR, 'identifiers.db'))
+sys.path.insert(0, BACKEND_DIR)
+
+import requests  # noqa: E402
+from requests.structures import CaseInsensitiveDict  # noqa: E402
+from urllib3 import HTTPResponse  # noqa: E402
+
+import http_client  # noqa: E402
+import metadata_parser  # noqa: E402
+from citation_rules import format_citation  # noqa: E402
+from formatters import format_book_citation, format_journal_citation, format_website_citation  # noqa: E402
+
+STYLES = ('APA', 'MLA')
+
+WEBSITE = {
+    'sourceType': 'website',
+    'title': 'understanding citation styles',
+    'author': 'Jane Q. Doe',
+    'date': '2021-09-14',
+    'publisher': 'Library Guides',
+    'url': 'https://library.example.edu/guides/citation-styles',
+}
+BOOK = {
+    'sourceType': 'book',
+    'authors': ['Ana Okafor', 'Lars Henriksen', 'Wei Chen'],
+    'title': 'Rivers in Motion',
+    'year': '2019',
+    'publisher': 'Example University Press',
+}
+JOURNAL = {
+    'sourceType': 'journal',
+    'authors': ['Ana Okafor', 'Lars Henriksen'],
+    'title': 'Sediment transport in braided rivers: a field study',
+    'journal': 'Journal of Hydrology Letters',
+    'volume': '42',
+    'issue': '3',
+    'year': '2022',
+    'pages': '117-134',
+    'doi': '10.5555/jhl.2022.117',
+}
+
+
+def load_corpus():
+    """Return {name: (url, body bytes)} for every page in the corpus."""
+    corpus = {}
+    for filename in sorted(os.listdir(CORPUS_DIR)):
+        name, ext = os.path.splitext(filename)
+        if ext != '.html':
+            continue
+        with open(os.path.join(CORPUS_DIR, filename), 'rb') as f:
+            corpus[name] = (f'https://www.{name.replace("_", "-")}.example/page', f.read())
+    return corpus
+
+
+class StubFetcher:
+    """Stands in for http_client.get, serving corpus pages as streamed responses."""
+
+    def __init__(self, corpus):
+        self.pages = {url: body for url, body in corpus.values()}
+
+    def __call__(self, url, timeout=None, **kwargs):
+        body = self.pages.get(url.partition('?')[0])
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200 if body is not None else 404
+        response.headers = CaseInsensitiveDict({'Content-Type': 'text/html; charset=utf-8'})
+        response.encoding = 'utf-8'
+        body = body or b''
+        response.raw = HTTPResponse(body=io.BytesIO(body), headers={'Content-Length': str(len(body))},
+                                    status=response.status_code, preload_content=False)
+        return response
+
+    @contextlib.contextmanager
+    def installed(self):
+        original = http_client.get
+        http_client.get = self
+        try:
+            yield self
+        finally:
+            http_client.get = original
+
+
+def measure(func, repeat, min_time=0.05):
+    """Time func(); returns per-call milliseconds over `repeat` rounds."""
+    # Calibrate how many calls make one round long enough to time reliably
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - start) / number * 1000)
+    median = statistics.median(rounds)
+    return {
+        'calls_per_round': number,
+        'min_ms': round(min(rounds), 4),
+        'median_ms': round(median, 4),
+        'mean_ms': round(statistics.mean(rounds), 4),
+        'ops_per_sec': round(1000 / median, 1) if median else None,
+        'peak_kb': peak_kb(func),
+    }
+
+
+def peak_kb(func):
+    """Peak traced allocation of a single func() call, in KiB."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def fetch_page(url):
+    response = http_client.get(url, stream=True)
+    page = http_client.StreamedPage(response)
+    try:
+        return page.read_all()
+    finally:
+        page.close()
+
+
+def bench_extraction(corpus, repeat):
+    """Per-stage timings for every corpus page."""
+    import app
+
+    results = {}
+    with StubFetcher(corpus).installed():
+        for name, (url, body) in corpus.items():
+            html = fetch_page(url)
+            page = metadata_parser.collect(html)
+            fields, extra = metadata_parser.extract_fields(page, url)
+            results[name] = {
+                'bytes': len(body),
+                'fetch': measure(lambda: fetch_page(url), repeat),
+                'parse': measure(lambda: metadata_parser.collect(html), repeat),
+                'extract': measure(lambda: metadata_parser.extract_fields(page, url), repeat),
+                'clean': measure(lambda: metadata_parser.clean_metadata(dict(fields), extra), repeat),
+                'total': measure(lambda: app.extract_metadata(url), repeat),
+            }
+    return results
+
+
+def bench_formatting(repeat):
+    results = {}
+    for style in STYLES:
+        website = {key: value for key, value in WEBSITE.items() if key != 'sourceType'}
+        results[style] = {
+            'format_website_citation': measure(lambda: format_website_citation(WEBSITE, style), repeat),
+            'format_book_citation': measure(lambda: format_book_citation(BOOK, style), repeat),
+            'format_journal_citation': measure(lambda: format_journal_citation(JOURNAL, style), repeat),
+            'format_citation': measure(lambda: format_citation(website, style, 'website'), repeat),
+        }
+    return results
+
+
+# Citations per second one worker must sustain when formatting a large batch
+BULK_TARGET = 10000
+
+
+def bulk_items(source_type, count):
+    """count distinct items of a source type ('mixed' cycles through all three)."""
+    items = []
+    for i in range(count):
+        kind = ('website', 'book', 'journal')[i % 3] if source_type == 'mixed' else source_type
+        if kind == 'website':
+            # Authors and dates repeat the way they do within a real bibliography
+            items.append(dict(WEBSITE, title=f'{WEBSITE["title"]} part {i}', author=f'Jane Q. Doe{i % 1000}',
+                              date=f'20{10 + i % 15}-{1 + i % 12:02d}-{1 + i % 28:02d}'))
+        elif kind == 'book':
+            items.append(dict(BOOK, title=f'{BOOK["title"]} {i}', year=str(1950 + i % 75)))
+        else:
+            items.append(dict(JOURNAL, title=f'{JOURNAL["title"]} {i}', pages=f'{i}-{i + 12}'))
+    return items
+
+
+def bench_bulk_formatting(count, repeat):
+    """Citations per second for one large batch, through format_many and the batch endpoint."""
+    from app import app
+    from formatters import format_many
+
+    results = {}
+    slowest = None
+    for source_type in ('website', 'book', 'journal', 'mixed'):
+        items = bulk_items(source_type, count)
+        results[source_type] = {}
+        for style in STYLES:
+            timing = measure(lambda: format_many(items, style), repeat, min_time=0)
+            timing['citations_per_sec'] = round(count * 1000 / timing['median_ms'])
+            results[source_type][style] = timing
+            slowest = min(slowest or timing['citations_per_sec'], timing['citations_per_sec'])
+
+    client = app.test_client()
+    payload = {'items': bulk_items('mixed', count), 'style': 'APA'}
+    timing = measure(lambda: post_batch(client, '/api/batch-generate-citations', payload, count), repeat, min_time=0)
+    timing['citations_per_sec'] = round(count * 1000 / timing['median_ms'])
+    results['/api/batch-generate-citations'] = timing
+
+    results['target_citations_per_sec'] = BULK_TARGET
+    results['meets_target'] = min(slowest, timing['citations_per_sec']) >= BULK_TARGET
+    if not results['meets_target']:
+        print(f'warning: bulk formatting below {BULK_TARGET} citations/s', file=sys.stderr)
+    return results
+
+
+def post_batch(client, path, payload, expected):
+    response = client.post(path, json=payload)
+    if response.status_code != 200 or len(response.get_json()) != expected:
+        raise RuntimeError(f'{path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}')
+
+
+def bench_batches(corpus, batch_size, repeat):
+    """Throughput of the batch endpoints through the Flask test client."""
+    from app import app
+
+    client = app.test_client()
+    urls = [url for url, _ in corpus.values()]
+    # Distinct URLs, or the batch endpoint would fetch each page only once
+    urls = [f'{urls[i % len(urls)]}?n={i}' for i in range(batch_size)]
+    items = [(WEBSITE, BOOK, JOURNAL)[i % 3] for i in range(batch_size)]
+
+    results = {}
+    with StubFetcher(corpus).installed():
+        for path, payload in (
+            ('/api/batch-extract-metadata', {'urls': urls}),
+            ('/api/batch-generate-citations', {'items': items, 'style': 'APA'}),
+        ):
+            timing = measure(lambda: post_batch(client, path, payload, batch_size), repeat, min_time=0)
+            timing['items_per_sec'] = round(batch_size * 1000 / timing['median_ms'], 1)
+            results[path] = timing
+    return results
+
+
+def bench_parse_pool(corpus, repeat, threads=4):
+    """Documents/s parsing the largest corpus page from several threads, inline and on the parsing pool."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    import parse_pool
+
+    url, body = max(corpus.values(), key=lambda page: len(page[1]))
+    html = body.decode('utf-8', errors='replace')
+    settings = parse_pool.PARSE_WORKERS, parse_pool.PARSE_POOL_MIN_SIZE
+
+    results = {'bytes': len(body), 'threads': threads, 'cpus': os.cpu_count()}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        def parse_concurrently():
+            list(pool.map(lambda _: parse_pool.parse(html, url), range(threads)))
+
+        try:
+            for name, workers in (('inline', 0), ('pool', min(threads, os.cpu_count() or 1))):
+                parse_pool.PARSE_WORKERS, parse_pool.PARSE_POOL_MIN_SIZE = workers, 0
+                parse_pool.warm_up()
+                timing = measure(parse_concurrently, repeat)
+                timing['documents_per_sec'] = round(threads * 1000 / timing['median_ms'], 1)
+                results[name] = timing
+        finally:
+            parse_pool.PARSE_WORKERS, parse_pool.PARSE_POOL_MIN_SIZE = settings
+    return results
+
+
+def seed_database(bibliographies, citations_per_bibliography):
+    """Create a benchmark user with bibliographies and citations; returns (token, bibliography ids)."""
+    from app import app
+    from auth import generate_token
+    from models import db, User, Bibliography, Citation
+
+    with app.app_context():
+        user = User(email=f'benchmark-{time.time_ns()}@example.com', password='x')
+        db.session.add(user)
+        db.session.commit()
+        db.session.execute(Bibliography.__table__.insert(), [
+            {'name': f'Bibliography {i}', 'user_id': user.id} for i in range(bibliographies)
+        ])
+        ids = [row.id for row in db.session.query(Bibliography.id).filter_by(user_id=user.id).order_by(Bibliography.id)]
+        for bibliography_id in ids:
+            db.session.execute(Citation.__table__.insert(), [
+                {'source_type': 'journal', 'style': 'APA', 'citation_text': f'Citation {i}',
+                 'source_data': JOURNAL, 'bibliography_id': bibliography_id}
+                for i in range(citations_per_bibliography)
+            ])
+        db.session.commit()
+        return generate_token(user.id), ids
+
+
+def bench_database(repeat, bibliographies=200, citations_per_bibliography=50):
+    """Latency and SQL query counts of the bibliography endpoints and token verification."""
+    import repository
+    from app import app
+    from auth import token_cache
+
+    token, ids = seed_database(bibliographies, citations_per_bibliography)
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    last_cursor = None
+    cursor = None
+    while True:
+        response = client.get('/api/bibliography', headers=headers,
+                              query_string={'limit': 50, **({'cursor': cursor} if cursor else {})})
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+        last_cursor = cursor
+
+    requests_to_time = {
+        'list_bibliographies': ('/api/bibliography', {'limit': 50}),
+        'list_bibliographies_last_page': ('/api/bibliography', {'limit': 50, 'cursor': last_cursor}),
+        'list_bibliographies_with_citations': ('/api/bibliography', {'limit': 50, 'include': 'citations'}),
+        'list_citations': (f'/api/bibliography/{ids[-1]}/citations', {'limit': 50}),
+        'export_text': (f'/api/bibliography/{ids[-1]}/export', {'format': 'text'}),
+    }
+    calls = {}
+    for name, (path, query) in requests_to_time.items():
+        def call(path=path, query=query):
+            response = client.get(path, headers=headers, query_string=query)
+            if response.status_code != 200:
+                raise RuntimeError(f'{path} returned {response.status_code}')
+            response.get_data()
+        calls[name] = call
+
+    # Token verification overhead: /auth/profile does nothing but authenticate
+    def profile():
+        response = client.get('/auth/profile', headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f'/auth/profile returned {response.status_code}')
+
+    def profile_uncached():
+        token_cache.clear()
+        profile()
+
+    profile()
+    calls['profile_token_cached'] = profile
+    calls['profile_token_uncached'] = profile_uncached
+
+    results = {'bibliographies': bibliographies, 'citations_per_bibliography': citations_per_bibliography}
+    for name, call in calls.items():
+        # Budgets are enforced by tests/test_query_counts.py; here they're only reported
+        with repository.count_queries() as counter:
+            call()
+        results[name] = measure(call, repeat)
+        results[name]['queries'] = counter['queries']
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """Yield (dotted path, median_ms) for every timing in a results tree."""
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if 'median_ms' in value:
+                yield prefix + key, value['median_ms']
+            else:
+                yield from flatten(value, f'{prefix}{key}.')
+
+
+def compare(current, baseline):
+    old = dict(flatten(baseline['results']))
+    print(f"{'benchmark':<70} {'before':>10} {'after':>10} {'change':>8}")
+    for path, median in flatten(current['results']):
+        if path not in old:
+            continue
+        change = (median - old[path]) / old[path] * 100 if old[path] else 0.0
+        print(f'{path:<70} {old[path]:>10.4f} {median:>10.4f} {change:>+7.1f}%')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='print changes against an earlier results file')
+    parser.add_argument('--repeat', type=int, default=5, help='timing rounds per benchmark')
+    parser.add_argument('--batch-size', type=int, default=100, help='items per batch endpoint request')
+    parser.add_argument('--bulk-size', type=int, default=10000, help='items per bulk formatting batch')
+    parser.add_argument('--only', choices=['extraction', 'formatting', 'bulk', 'batch', 'parsing', 'database'],
+                        action='append',
+                        help='run only these groups (may be repeated)')
+    args = parser.parse_args(argv)
+
+    groups = args.only or ['extraction', 'formatting', 'bulk', 'batch', 'parsing', 'database']
+    corpus = load_corpus()
+    results = {}
+    if 'extraction' in groups:
+        results['extraction'] = bench_extraction(corpus, args.repeat)
+    if 'formatting' in groups:
+        results['formatting'] = bench_formatting(args.repeat)
+    if 'bulk' in groups:
+        results['bulk'] = bench_bulk_formatting(args.bulk_size, args.repeat)
+    if 'batch' in groups:
+        results['batch'] = bench_batches(corpus, args.batch_size, args.repeat)
+    if 'parsing' in groups:
+        results['parsing'] = bench_parse_pool(corpus, args.repeat)
+    if 'database' in groups:
+        results['database'] = bench_database(args.repeat)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'repeat': args.repeat, 'batch_size': args.batch_size, 'bulk_size': args.bulk_size},
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    elif not args.output:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 """
 Citation rules based on Purdue OWL guidelines for APA 7th Edition and MLA 9th Edition.
 """
+from string import Formatter
 
 APA_RULES = {
     'website': {
@@ -47,6 +48,103 @@ APA_RULES = {
                 ]
             }
         }
+    },
+    'book': {
+        'format': '{authors}{year}{title}{publisher}.',
+        'strip': False,
+        'rules': {
+            'authors': {
+                'format': '{0}',
+                'join': {'two': ', & ', 'separator': ', ', 'last': ', & '},
+                'rules': [
+                    'Use last name, followed by initials',
+                    'Separate authors with commas, use & before the last author',
+                ]
+            },
+            'year': {
+                'format': ' ({0})',
+                'rules': [
+                    'Put the year of publication in parentheses',
+                ]
+            },
+            'title': {
+                'format': '. {0}',
+                'empty': '. ',
+                'rules': [
+                    'Italicize the title',
+                    'Capitalize only the first word of title and subtitle',
+                ]
+            },
+            'publisher': {
+                'format': '. {0}',
+                'rules': [
+                    'Do not include the publisher location',
+                    'End with a period',
+                ]
+            }
+        }
+    },
+    'journal': {
+        'format': '{authors}{year}{title}{journal}{volume}{issue}{pages}{doi}.',
+        'strip': False,
+        'rules': {
+            'authors': {
+                'format': '{0}. ',
+                'empty': '. ',
+                'join': {'none': 'No author', 'two': ' & ', 'separator': ', ', 'last': ', & '},
+                'rules': [
+                    'Use last name, followed by initials',
+                    'Use & before the last author',
+                ]
+            },
+            'year': {
+                'format': '({0}). ',
+                'empty': '(). ',
+                'rules': [
+                    'Put the year of publication in parentheses',
+                ]
+            },
+            'title': {
+                'format': '{0}. ',
+                'empty': '. ',
+                'rules': [
+                    'Capitalize only the first word of the article title',
+                    'Do not italicize or use quotation marks',
+                ]
+            },
+            'journal': {
+                'format': '{0}',
+                'rules': [
+                    'Italicize the journal name',
+                    'Capitalize all major words',
+                ]
+            },
+            'volume': {
+                'format': ', {0}',
+                'rules': [
+                    'Italicize the volume number',
+                ]
+            },
+            'issue': {
+                'format': '({0})',
+                'requires': 'volume',
+                'rules': [
+                    'Put the issue number in parentheses right after the volume',
+                ]
+            },
+            'pages': {
+                'format': ', {0}',
+                'rules': [
+                    'Give the page range of the article',
+                ]
+            },
+            'doi': {
+                'format': '. https://doi.org/{0}',
+                'rules': [
+                    'Include the DOI as a URL',
+                ]
+            }
+        }
     }
 }
 
@@ -101,6 +199,101 @@ MLA_RULES = {
                 ]
             }
         }
+    },
+    'book': {
+        'format': '{authors}{title}{publisher}{year}.',
+        'strip': False,
+        'rules': {
+            'authors': {
+                'format': '{0}. ',
+                'empty': '. ',
+                'join': {'two': ' and ', 'separator': ', ', 'last': ', and '},
+                'rules': [
+                    'Start with the first author\'s last name, followed by first name',
+                    'Use and before the last author',
+                ]
+            },
+            'title': {
+                'format': '{0}',
+                'rules': [
+                    'Italicize the title',
+                    'Capitalize all major words',
+                ]
+            },
+            'publisher': {
+                'format': '. {0}',
+                'rules': [
+                    'Include the publisher name',
+                ]
+            },
+            'year': {
+                'format': ', {0}',
+                'rules': [
+                    'End with the year of publication',
+                ]
+            }
+        }
+    },
+    'journal': {
+        'format': '{authors}{title}{journal}{volume}{issue}{year}{pages}{doi}.',
+        'strip': False,
+        'rules': {
+            'authors': {
+                'format': '{0}. ',
+                'empty': '. ',
+                'join': {'none': 'No author', 'two': ' and ', 'separator': ', ', 'last': ', and '},
+                'rules': [
+                    'Start with the first author\'s last name, followed by first name',
+                    'Use and before the last author',
+                ]
+            },
+            'title': {
+                'format': '"{0}." ',
+                'empty': '"." ',
+                'rules': [
+                    'Use quotation marks around the article title',
+                    'Capitalize all major words',
+                ]
+            },
+            'journal': {
+                'format': '{0}',
+                'rules': [
+                    'Italicize the journal name',
+                ]
+            },
+            'volume': {
+                'format': ', vol. {0}',
+                'rules': [
+                    'Abbreviate volume as vol.',
+                ]
+            },
+            'issue': {
+                'format': ', no. {0}',
+                'requires': 'volume',
+                'rules': [
+                    'Abbreviate issue number as no.',
+                    'Only give the issue together with a volume',
+                ]
+            },
+            'year': {
+                'format': ', {0}',
+                'rules': [
+                    'Give the year of publication',
+                ]
+            },
+            'pages': {
+                'format': ', pp. {0}',
+                'rules': [
+                    'Abbreviate pages as pp.',
+                ]
+            },
+            'doi': {
+                'format': ', https://doi.org/{0}',
+                'rules': [
+                    'Include the DOI as a URL',
+                ]
+            }
+        }
     }
 }
 
@@ -112,17 +305,107 @@ def get_citation_rules(style, source_type):
         return MLA_RULES.get(source_type, {})
     return {}
 
+def join_names(names, join):
+    """Join a list of names using a rule's 'join' separators."""
+    if isinstance(names, str):
+        names = [names]
+    if not names:
+        return join.get('none', '')
+    if len(names) == 1:
+        return names[0]
+    if len(names) == 2:
+        return names[0] + join['two'] + names[1]
+    return join['separator'].join(names[:-1]) + join['last'] + names[-1]
+
+
+class CompiledTemplate:
+    """
+    A (style, source_type) rule set turned into a flat list of render steps.
+
+    Field formats of the form 'prefix{0}suffix' become plain string
+    concatenation; anything fancier falls back to str.format, so output is
+    always identical to formatting the rules directly.
+
+    Besides 'format', a field rule may give 'empty' (text used when the value
+    is missing), 'requires' (another field that must be present) and 'join'
+    (separators for turning a list of names into one string). A rule set may
+    set 'strip': False to keep leading/trailing whitespace.
+    """
+
+    def __init__(self, rules):
+        formatter = Formatter()
+        self.required = tuple(
+            field for field, field_rules in rules['rules'].items() if field_rules.get('required', False)
+        )
+        self.strip = rules.get('strip', True)
+        self.fields = {}
+        for field, field_rules in rules['rules'].items():
+            pieces = list(formatter.parse(field_rules['format']))
+            if (len(pieces) in (1, 2) and pieces[0][1:] == ('0', '', None)
+                    and (len(pieces) == 1 or pieces[1][1] is None)):
+                suffix = pieces[1][0] if len(pieces) == 2 else ''
+                prefix, fmt = pieces[0][0], None
+            else:
+                prefix, suffix, fmt = None, None, field_rules['format']
+            self.fields[field] = (
+                prefix, suffix, fmt,
+                field_rules.get('empty', ''),
+                field_rules.get('requires'),
+                field_rules.get('join'),
+            )
+        self.steps = []
+        for literal, field, spec, conversion in formatter.parse(rules['format']):
+            if spec or conversion:
+                raise ValueError(f'Unsupported placeholder in citation template: {field}')
+            self.steps.append((literal, field))
+
+    def render(self, citation_data):
+        parts = []
+        get = citation_data.get
+        fields = self.fields
+        for literal, field in self.steps:
+            if literal:
+                parts.append(literal)
+            if field is None:
+                continue
+            prefix, suffix, fmt, empty, requires, join = fields[field]
+            value = get(field, '')
+            if join is not None:
+                value = join_names(value or [], join)
+            if value and (requires is None or get(requires)):
+                parts.append(prefix + format(value) + suffix if fmt is None else fmt.format(value))
+            elif empty:
+                parts.append(empty)
+        citation = ''.join(parts)
+        return citation.strip() if self.strip else citation
+
+    def missing_fields(self, citation_data):
+        return [field for field in self.required if not citation_data.get(field)]
+
+
+_compiled = {}
+
+
+def get_compiled_template(style, source_type):
+    """Return the CompiledTemplate for a style/source type, or None if unsupported."""
+    key = (style, source_type)
+    template = _compiled.get(key)
+    if template is None:
+        rules = get_citation_rules(style, source_type)
+        if not rules:
+            return None
+        # Only supported combinations are cached, so the cache stays bounded.
+        template = _compiled[key] = CompiledTemplate(rules)
+    return template
+
+
 def validate_citation(citation_data, style, source_type):
     """Validate citation data against rules."""
-    rules = get_citation_rules(style, source_type)
-    if not rules:
+    template = get_compiled_template(style, source_type)
+    if template is None:
         return {'valid': False, 'errors': ['Unsupported citation style or source type']}
     
-    errors = []
-    for field, field_rules in rules['rules'].items():
-        value = citation_data.get(field)
-        if not value and field_rules.get('required', False):
-            errors.append(f'Missing required field: {field}')
+    errors = [f'Missing required field: {field}' for field in template.missing_fields(citation_data)]
             
     return {
         'valid': len(errors) == 0,
@@ -131,16 +414,15 @@ def validate_citation(citation_data, style, source_type):
 
 def format_citation(citation_data, style, source_type):
     """Format citation according to style rules."""
-    rules = get_citation_rules(style, source_type)
-    if not rules:
+    template = get_compiled_template(style, source_type)
+    if template is None:
         return None
-        
-    formatted_parts = {}
-    for field, field_rules in rules['rules'].items():
-        value = citation_data.get(field, '')
-        if value:
-            formatted_parts[field] = field_rules['format'].format(value)
-        else:
-            formatted_parts[field] = ''
-            
-    return rules['format'].format(**formatted_parts).strip()
+    return template.render(citation_data)
+
+def render_many(records, style, source_type):
+    """Format many citation dicts with one rule lookup; None if unsupported."""
+    template = get_compiled_template(style, source_type)
+    if template is None:
+        return None
+    render = template.render
+    return [render(record) for record in records]
@@ -1,8 +1,36 @@
 import os
 
+from sqlalchemy.pool import QueuePool
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+# How long SQLite waits on a lock held by another worker before failing, in ms
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+
+def engine_options(uri):
+    """SQLAlchemy engine options for a database URI."""
+    if uri.startswith('sqlite'):
+        # File databases default to a fresh connection per checkout on older
+        # SQLAlchemy versions; pool them and share them between threads.
+        return {
+            'poolclass': QueuePool,
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'connect_args': {'check_same_thread': False, 'timeout': SQLITE_BUSY_TIMEOUT / 1000},
+        }
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-please-change-in-production'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///instance/citations.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'instance', 'citations.db')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 class ProductionConfig(Config):
@@ -0,0 +1,171 @@
+"""
+Bibliography export formats.
+
+Each exporter turns an iterable of (source_type, source_data, citation_text)
+rows into an iterator of text chunks, so an export can be streamed straight
+from a windowed database query without holding the bibliography in memory.
+"""
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+_YEAR = re.compile(r'\b(\d{4})\b')
+
+
+class ExportFormat:
+    def __init__(self, name, mimetype, extension, export, uses_text):
+        self.name = name
+        self.mimetype = mimetype
+        self.extension = extension
+        self.export = export
+        # Only formats that output citation_text need it re-rendered for another style
+        self.uses_text = uses_text
+
+
+EXPORT_FORMATS = {}
+
+
+def register_export_format(name, mimetype, extension, uses_text=False):
+    """Decorator registering export(rows) -> iterator of str under a format name."""
+    def decorator(export):
+        EXPORT_FORMATS[name] = ExportFormat(name, mimetype, extension, export, uses_text)
+        return export
+    return decorator
+
+
+def _authors(data):
+    authors = data.get('authors')
+    if isinstance(authors, list):
+        return [a for a in authors if isinstance(a, str) and a.strip()]
+    author = data.get('author')
+    return [author] if isinstance(author, str) and author.strip() else []
+
+
+def _split_name(name):
+    """Return (family, given) for a "First Middle Last" name."""
+    parts = name.split()
+    if len(parts) < 2:
+        return name.strip(), ''
+    return parts[-1], ' '.join(parts[:-1])
+
+
+def _year(data):
+    year = str(data.get('year') or '')
+    match = _YEAR.search(year) or _YEAR.search(str(data.get('date') or ''))
+    return match.group(1) if match else ''
+
+
+def _pages(data):
+    pages = str(data.get('pages') or '')
+    start, _, end = pages.replace('–', '-').partition('-')
+    return start.strip(), end.strip()
+
+
+def _text(data, key):
+    value = data.get(key)
+    return ' '.join(str(value).split()) if value else ''
+
+
+@register_export_format('text', 'text/plain', 'txt', uses_text=True)
+def export_text(rows):
+    for _, _, citation_text in rows:
+        yield citation_text + '\n'
+
+
+RIS_TYPES = {'website': 'ELEC', 'book': 'BOOK', 'journal': 'JOUR'}
+
+
+@register_export_format('ris', 'application/x-research-info-systems', 'ris')
+def export_ris(rows):
+    for source_type, data, _ in rows:
+        lines = [f"TY  - {RIS_TYPES.get(source_type, 'GEN')}"]
+        lines.extend(f'AU  - {family}, {given}'.rstrip(', ') for family, given in map(_split_name, _authors(data)))
+        start, end = _pages(data)
+        for tag, value in (
+            ('TI', _text(data, 'title')),
+            ('PY', _year(data)),
+            ('DA', _text(data, 'date')),
+            ('JO', _text(data, 'journal')),
+            ('VL', _text(data, 'volume')),
+            ('IS', _text(data, 'issue')),
+            ('SP', start),
+            ('EP', end),
+            ('PB', _text(data, 'publisher')),
+            ('DO', _text(data, 'doi')),
+            ('UR', _text(data, 'url')),
+        ):
+            if value:
+                lines.append(f'{tag}  - {value}')
+        lines.append('ER  - ')
+        yield '\n'.join(lines) + '\n\n'
+
+
+BIBTEX_TYPES = {'website': 'online', 'book': 'book', 'journal': 'article'}
+_BIBTEX_KEY = re.compile(r'[^A-Za-z0-9]')
+
+
+def _bibtex_escape(value):
+    return value.replace('\\', '\\textbackslash{}').replace('{', '\\{').replace('}', '\\}')
+
+
+@register_export_format('bibtex', 'application/x-bibtex', 'bib')
+def export_bibtex(rows):
+    for number, (source_type, data, _) in enumerate(rows, 1):
+        authors = _authors(data)
+        family = _split_name(authors[0])[0] if authors else 'anon'
+        key = f"{_BIBTEX_KEY.sub('', family).lower() or 'anon'}{_year(data)}_{number}"
+        fields = [
+            ('author', ' and '.join(f'{f}, {g}'.rstrip(', ') for f, g in map(_split_name, authors))),
+            ('title', _text(data, 'title')),
+            ('journal', _text(data, 'journal')),
+            ('year', _year(data)),
+            ('volume', _text(data, 'volume')),
+            ('number', _text(data, 'issue')),
+            ('pages', _text(data, 'pages').replace('-', '--')),
+            ('publisher', _text(data, 'publisher')),
+            ('doi', _text(data, 'doi')),
+            ('url', _text(data, 'url')),
+        ]
+        body = ',\n'.join(f'  {name} = {{{_bibtex_escape(value)}}}' for name, value in fields if value)
+        yield f"@{BIBTEX_TYPES.get(source_type, 'misc')}{{{key},\n{body}\n}}\n\n"
+
+
+CSL_TYPES = {'website': 'webpage', 'book': 'book', 'journal': 'article-journal'}
+
+
+@register_export_format('csl-json', 'application/vnd.citationstyles.csl+json', 'json')
+def export_csl_json(rows):
+    yield '['
+    for number, (source_type, data, _) in enumerate(rows, 1):
+        item = {'id': f'item-{number}', 'type': CSL_TYPES.get(source_type, 'document')}
+        authors = []
+        for name in _authors(data):
+            family, given = _split_name(name)
+            authors.append({'family': family, 'given': given} if given else {'literal': family})
+        if authors:
+            item['author'] = authors
+        year = _year(data)
+        if year:
+            item['issued'] = {'date-parts': [[int(year)]]}
+        for key, csl_key in (('title', 'title'), ('journal', 'container-title'), ('volume', 'volume'),
+                             ('issue', 'issue'), ('pages', 'page'), ('publisher', 'publisher'),
+                             ('doi', 'DOI'), ('url', 'URL')):
+            value = _text(data, key)
+            if value:
+                item[csl_key] = value
+        yield ('\n' if number == 1 else ',\n') + json.dumps(item, ensure_ascii=False)
+    yield '\n]\n'
+
+
+def stream(export_format, rows, chunk_size=CHUNK_SIZE):
+    """Run an exporter over rows, coalescing its output into chunk_size pieces."""
+    buffer, size = [], 0
+    for piece in EXPORT_FORMATS[export_format].export(rows):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,139 @@
+"""
+Bounded-concurrency fetch engine used by the batch metadata endpoint.
+
+URLs are fetched on a shared thread pool, with a cap on how many requests may
+be in flight against the same host and an overall deadline for the batch.
+Hosts whose rate limit (see politeness) is used up are skipped until they
+can take a request again, so their URLs don't hold pool threads that other
+hosts could use. Results always come back in input order.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from politeness import HOST_MAX_WAIT, host_of, throttle
+
+MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 8))
+PER_HOST_LIMIT = int(os.environ.get('BATCH_PER_HOST_LIMIT', 2))
+BATCH_DEADLINE = float(os.environ.get('BATCH_DEADLINE', 60))
+
+DEADLINE_ERROR = 'Batch deadline exceeded'
+CANCELLED_ERROR = 'Cancelled'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide fetch pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='fetch')
+    return _executor
+
+
+def _run(fetch, url):
+    try:
+        return fetch(url), None
+    except Exception as e:
+        return None, str(e)
+
+
+def fetch_all(urls, fetch, max_workers=None, per_host_limit=None, deadline=None,
+              on_result=None, cancelled=None):
+    """
+    Call fetch(url) for every url and return a list of (value, error) tuples
+    in the same order as urls. error is None when fetch returned normally.
+
+    on_result(index, value, error) is called as each URL finishes, and
+    cancelled() is polled between completions to abandon the rest early.
+    """
+    max_workers = max_workers or MAX_WORKERS
+    per_host_limit = per_host_limit or PER_HOST_LIMIT
+    deadline = BATCH_DEADLINE if deadline is None else deadline
+    stop_at = time.monotonic() + deadline
+
+    results = [None] * len(urls)
+
+    # One FIFO queue per host; hosts are served round-robin so a single
+    # large domain cannot starve the others.
+    pending = OrderedDict()
+    for index, url in enumerate(urls):
+        pending.setdefault(host_of(url), deque()).append(index)
+
+    in_flight = {}
+    host_load = {}
+    executor = get_executor()
+
+    def submit_ready():
+        """Start what can start now; returns seconds until a throttled host frees up, or None."""
+        next_ready = None
+        progressed = True
+        while progressed and len(in_flight) < max_workers:
+            progressed = False
+            next_ready = None
+            for host in list(pending):
+                if len(in_flight) >= max_workers:
+                    break
+                if host_load.get(host, 0) >= per_host_limit:
+                    continue
+                # A host backed off for longer than a fetch would wait is
+                # submitted anyway and fails fast instead of idling to the deadline
+                delay = throttle.ready_in(host)
+                if 0 < delay <= HOST_MAX_WAIT:
+                    next_ready = delay if next_ready is None else min(next_ready, delay)
+                    continue
+                index = pending[host].popleft()
+                if not pending[host]:
+                    del pending[host]
+                # Carry the request's context (e.g. its Server-Timing) into the worker
+                context = contextvars.copy_context()
+                future = executor.submit(context.run, _run, fetch, urls[index])
+                in_flight[future] = (index, host)
+                host_load[host] = host_load.get(host, 0) + 1
+                progressed = True
+        return next_ready
+
+    stop_error = DEADLINE_ERROR
+    next_ready = submit_ready()
+    while in_flight or pending:
+        remaining = stop_at - time.monotonic()
+        if remaining <= 0:
+            break
+        # Wake up periodically so cancellation is noticed while requests are slow.
+        timeout = min(remaining, 1.0) if cancelled else remaining
+        if next_ready is not None:
+            timeout = min(timeout, next_ready)
+        if not in_flight:
+            time.sleep(timeout)
+            done = ()
+        else:
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, host = in_flight.pop(future)
+            host_load[host] -= 1
+            results[index] = future.result()
+            if on_result:
+                on_result(index, *results[index])
+        if cancelled and cancelled():
+            stop_error = CANCELLED_ERROR
+            break
+        next_ready = submit_ready()
+
+    # Anything still queued or running missed the deadline (or was cancelled).
+    unfinished = [index for index, _ in in_flight.values()]
+    for future in in_flight:
+        future.cancel()
+    for queue in pending.values():
+        unfinished.extend(queue)
+    for index in sorted(unfinished):
+        results[index] = (None, stop_error)
+        if on_result:
+            on_result(index, None, stop_error)
+
+    return results
@@ -0,0 +1,222 @@
+"""
+Citation formatting for every source type.
+
+Each source type registers a compiler: given the requested style, it makes
+the style-dependent choices once (rule set, required fields, author, date
+and title conventions) and returns a preparer that turns one item's request
+data into the fields its template in citation_rules.py expects. Compiled
+preparers are cached per (style, source type), so format_source() pays for
+them once, and format_many() groups a mixed batch by source type and runs
+each group through its preparer and template in a tight loop.
+"""
+from citation_rules import get_compiled_template
+from instrumentation import timer
+from normalization import format_author, format_date
+
+# Styles with their own author/date conventions for websites
+DATE_FORMATS = {
+    'APA': '%Y',
+    'MLA': '%d %b. %Y',
+}
+
+
+# Styles every source type is rendered in
+STYLES = ('APA', 'MLA')
+
+
+class CitationMessage(Exception):
+    """Raised by a compiler or preparer to return a fixed message instead of a citation."""
+
+
+SOURCE_TYPES = {}
+
+
+def register_source_type(source_type):
+    """Decorator registering compile(style) -> (render style, prepare(data) -> fields) for a source type."""
+    def decorator(compile):
+        SOURCE_TYPES[source_type] = compile
+        return compile
+    return decorator
+
+
+def _apa_title(title):
+    # Only the first word is capitalized
+    return title.capitalize()
+
+
+def _mla_title(title):
+    return ' '.join(word.capitalize() for word in title.split())
+
+
+# Title case per style; other styles keep the title as entered
+TITLE_CASE = {
+    'APA': _apa_title,
+    'MLA': _mla_title,
+}
+
+
+@register_source_type('website')
+def compile_website(style):
+    template = get_compiled_template(style, 'website')
+    if template is None:
+        raise CitationMessage("Error: Unsupported citation style or source type")
+    required = template.required
+    date_format = DATE_FORMATS.get(style)
+    title_case = TITLE_CASE.get(style)
+
+    def prepare(data):
+        if required:
+            missing = [f'Missing required field: {field}' for field in required if not data.get(field)]
+            if missing:
+                raise CitationMessage(f"Error: {', '.join(missing)}")
+        author = data.get('author', '')
+        date = data.get('date', '')
+        title = data.get('title', '')
+        if date_format:
+            if author:
+                author = format_author(author, style)
+            # Keep the original date if parsing fails
+            if date:
+                date = format_date(date, date_format) or date
+        if title and title_case:
+            title = title_case(title)
+        return {
+            'author': author,
+            'date': date,
+            'title': title,
+            'publisher': data.get('publisher', ''),
+            'url': data.get('url', '')
+        }
+
+    return style, prepare
+
+
+@register_source_type('book')
+def compile_book(style):
+    def prepare(data):
+        return {
+            'authors': data.get('authors', []),
+            'title': data.get('title', ''),
+            'year': data.get('year', ''),
+            'publisher': data.get('publisher', '')
+        }
+
+    # Anything other than APA is formatted as MLA 9th edition
+    return ('APA' if style == 'APA' else 'MLA'), prepare
+
+
+@register_source_type('journal')
+def compile_journal(style):
+    if style not in ('APA', 'MLA'):
+        raise CitationMessage("Citation style not supported")
+
+    def prepare(data):
+        return {
+            'authors': data.get('authors', []),
+            'title': data.get('title', ''),
+            'journal': data.get('journal', ''),
+            'volume': data.get('volume', ''),
+            'issue': data.get('issue', ''),
+            'year': data.get('year', ''),
+            'pages': data.get('pages', ''),
+            'doi': data.get('doi', '')
+        }
+
+    return style, prepare
+
+
+_compiled = {}
+
+
+def compiled_preparer(style, source_type):
+    """
+    Return (prepare, render) for a style and registered source type; raises
+    CitationMessage if the style can't be used for it.
+    """
+    key = (style, source_type)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        render_style, prepare = SOURCE_TYPES[source_type](style)
+        template = get_compiled_template(render_style, source_type)
+        if template is None:
+            raise CitationMessage("Citation style not supported")
+        compiled = (prepare, template.render)
+        # Only styles rendered as themselves are cached; any other string a
+        # client sends (e.g. one a book falls back to MLA for) is compiled
+        # per call, so the cache stays bounded
+        if render_style == style:
+            _compiled[key] = compiled
+    return compiled
+
+
+def format_source(data, style, source_type):
+    """Format one citation; returns None for an unknown source type."""
+    if source_type not in SOURCE_TYPES:
+        return None
+    with timer('format'):
+        try:
+            prepare, render = compiled_preparer(style, source_type)
+            return render(prepare(data)) or "Error formatting citation"
+        except CitationMessage as e:
+            return str(e)
+
+
+def format_many(items, style, messages_as_errors=False):
+    """
+    Format a mixed list of citation dicts in one pass.
+
+    Returns (citation, error) tuples in input order; citation is None for
+    unknown source types and error holds the message of any exception. With
+    messages_as_errors, validation messages such as "Error: Missing required
+    field" are returned as errors instead of as the citation text.
+    """
+    with timer('format'):
+        return _format_many(items, style, messages_as_errors)
+
+
+def _format_many(items, style, messages_as_errors):
+    def message(text):
+        return (None, text) if messages_as_errors else (text, None)
+
+    results = [(None, None)] * len(items)
+    groups = {}
+    for index, item in enumerate(items):
+        try:
+            source_type = item.get('sourceType')
+            if source_type in SOURCE_TYPES:
+                groups.setdefault(source_type, []).append(index)
+        except Exception as e:
+            results[index] = (None, str(e))
+
+    for source_type, indexes in groups.items():
+        try:
+            prepare, render = compiled_preparer(style, source_type)
+        except CitationMessage as e:
+            result = message(str(e))
+            for index in indexes:
+                results[index] = result
+            continue
+        failed = message("Error formatting citation")
+        for index in indexes:
+            try:
+                citation = render(prepare(items[index]))
+            except CitationMessage as e:
+                results[index] = message(str(e))
+                continue
+            except Exception as e:
+                results[index] = (None, str(e))
+                continue
+            results[index] = (citation, None) if citation else failed
+    return results
+
+
+def format_website_citation(data, style):
+    return format_source(data, style, 'website')
+
+
+def format_book_citation(data, style):
+    return format_source(data, style, 'book')
+
+
+def format_journal_citation(data, style):
+    return format_source(data, style, 'journal')
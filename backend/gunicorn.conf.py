@@ -1,3 +1,47 @@
-workers = 4
+import importlib.util
+import os
+
+# How each worker serves requests:
+#   sync     one request at a time per worker process
+#   gthread  GUNICORN_THREADS requests at a time, one OS thread each
+#   gevent   up to GUNICORN_WORKER_CONNECTIONS at a time on greenlets
+#            (pip install -r requirements-gevent.txt)
+# Extraction mostly waits on publishers, so gthread and gevent let one
+# worker hold many fetches open instead of pinning a process per fetch.
+SERVER_MODE = os.environ.get('SERVER_MODE', 'sync')
+SERVER_MODES = ('sync', 'gthread', 'gevent')
+
+if SERVER_MODE not in SERVER_MODES:
+    raise RuntimeError(f"SERVER_MODE must be one of {', '.join(SERVER_MODES)}, not {SERVER_MODE!r}")
+if SERVER_MODE == 'gevent' and importlib.util.find_spec('gevent') is None:
+    raise RuntimeError('SERVER_MODE=gevent needs gevent: pip install -r requirements-gevent.txt')
+
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
 bind = "0.0.0.0:10000"
 timeout = 120
+worker_class = SERVER_MODE
+if SERVER_MODE == 'gthread':
+    threads = int(os.environ.get('GUNICORN_THREADS', 32))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 500))
+
+
+def on_starting(server):
+    # /metrics totals are per server run, summed across workers
+    import instrumentation
+    instrumentation.reset()
+
+
+def post_fork(server, worker):
+    # Patch before the worker imports the app, so every module it loads
+    # (requests, threading, time.sleep, ...) gets the cooperative versions
+    if SERVER_MODE == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+
+
+def post_worker_init(worker):
+    # After the worker has loaded the app (and, for gevent, been patched)
+    import hashing
+    import parse_pool
+    hashing.warm_up()
+    parse_pool.warm_up()
@@ -0,0 +1,118 @@
+"""
+Password hashing off the request thread.
+
+Hashing is deliberately slow, so a burst of logins run inline would tie up
+every gunicorn worker. Hashes are computed on a small process pool per
+worker instead, and when more than HASH_QUEUE_DEPTH hashes are already
+waiting or running new ones are refused with HashingBusy rather than
+queued without bound. If a pool process dies, the request that finds out
+gets HashingBusy and the next one starts a new pool.
+
+The cost is set by PASSWORD_HASH_METHOD (any werkzeug method string, e.g.
+pbkdf2:sha256:600000 or scrypt:32768:8:1). Stored hashes made with other
+parameters still verify, and needs_rehash() tells the caller to upgrade
+them after a successful login.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+# Processes per gunicorn worker; 0 hashes on the request thread
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', 1))
+# Hashes allowed to wait or run at once in a worker before new ones are refused
+HASH_QUEUE_DEPTH = int(os.environ.get('HASH_QUEUE_DEPTH', 16))
+HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 10))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_DEPTH)
+_dummy_hash = None
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+
+def get_executor():
+    """Return this process's hashing pool, creating it on first use."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _discard_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(func, *args):
+    if HASH_WORKERS <= 0:
+        return func(*args)
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy('Too many password checks in progress')
+    executor = get_executor()
+    try:
+        future = executor.submit(func, *args)
+    except (BrokenProcessPool, RuntimeError):
+        # A pool process died (or another request just replaced the pool)
+        _slots.release()
+        _discard_executor(executor)
+        raise HashingBusy('Password hashing is restarting')
+    # The slot stays taken until the hash finishes, even if we stop waiting
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except TimeoutError:
+        raise HashingBusy('Password check timed out')
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise HashingBusy('Password hashing is restarting')
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def hash_password(password):
+    return _submit(_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(stored_hash, password):
+    """
+    Check password against stored_hash. With stored_hash None (unknown user)
+    a hash made with the current parameters is checked instead, so the
+    response takes as long as for a real account.
+    """
+    if stored_hash is None:
+        _submit(check_password_hash, dummy_hash(), password)
+        return False
+    return _submit(check_password_hash, stored_hash, password)
+
+
+def dummy_hash():
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(os.urandom(16).hex())
+    return _dummy_hash
+
+
+def warm_up():
+    """Start the pool and make the dummy hash so the first login isn't slower than the rest."""
+    dummy_hash()
+
+
+def needs_rehash(stored_hash):
+    """True when stored_hash was made with parameters other than the current ones."""
+    return stored_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
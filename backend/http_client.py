@@ -0,0 +1,228 @@
+"""
+Process-wide pooled HTTP session for outbound metadata fetches.
+
+All extraction goes through a single requests.Session so connections to the
+same publisher are kept alive and reused across requests and threads.
+"""
+import os
+import re
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from politeness import host_of, throttle
+
+POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 32))
+POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 8))
+MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))
+BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.3))
+CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+
+# Streaming download limits for HTML pages.
+STREAM_HEAD = os.environ.get('FETCH_STREAM_HEAD', '1') != '0'
+HEAD_MAX_BYTES = int(os.environ.get('FETCH_HEAD_MAX_BYTES', 256 * 1024))
+MAX_BODY_BYTES = int(os.environ.get('FETCH_MAX_BODY_BYTES', 5 * 1024 * 1024))
+DRAIN_MAX_BYTES = int(os.environ.get('FETCH_DRAIN_MAX_BYTES', 64 * 1024))
+CHUNK_SIZE = 16 * 1024
+
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
+
+_stats = {'requests': 0, 'connections_opened': 0}
+_stats_lock = threading.Lock()
+
+
+def _incr(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        _incr('connections_opened')
+        return super().connect()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        _incr('connections_opened')
+        return super().connect()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools count every TCP connect."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+
+
+def build_session():
+    """Create a session with connection pooling, retries and default headers."""
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        # 429 and 503 are left to politeness.throttle, which honours Retry-After
+        status_forcelist=(502, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = PooledAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    session.verify = False
+    # The session is shared between threads and users, so never keep cookies.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the shared session, rebuilding it after a gunicorn fork."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = build_session()
+                _session_pid = pid
+    return _session
+
+
+def get(url, timeout=None, **kwargs):
+    """
+    GET url through the shared session using the configured timeouts, waiting
+    for the host's rate limit first. Raises politeness.HostThrottled if the
+    host is backed off for too long.
+    """
+    host = host_of(url)
+    throttle.acquire(host)
+    _incr('requests')
+    response = get_session().get(url, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+    throttle.observe(host, response)
+    return response
+
+
+def connection_stats():
+    """Return request/connection counters for this worker process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['connections_reused'] = max(stats['requests'] - stats['connections_opened'], 0)
+    return stats
+
+
+def is_html(response):
+    """True unless the response declares a non-HTML Content-Type."""
+    content_type = response.headers.get('Content-Type', '')
+    if not content_type:
+        return True
+    return content_type.split(';', 1)[0].strip().lower() in HTML_CONTENT_TYPES
+
+
+_HEAD_END = re.compile(rb'</head\s*>', re.IGNORECASE)
+_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+class StreamedPage:
+    """
+    Reads the body of a stream=True response on demand.
+
+    read_head() stops at </head> (or HEAD_MAX_BYTES) since that is where
+    nearly all citation metadata lives; read_all() continues up to
+    MAX_BODY_BYTES when the body-only fallbacks are needed.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self._chunks = response.iter_content(CHUNK_SIZE)
+        self._buffer = bytearray()
+        self._head_end = None
+        self.complete = False
+        self.truncated = False
+
+    def _read_until(self, limit, stop_at_head=False):
+        while not self.complete and len(self._buffer) < limit:
+            if stop_at_head and self._head_end is not None:
+                return
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self.complete = True
+                return
+            # Search a little before the new chunk in case the tag straddles it.
+            start = max(len(self._buffer) - 16, 0)
+            self._buffer += chunk
+            if self._head_end is None:
+                match = _HEAD_END.search(self._buffer, start)
+                if match:
+                    self._head_end = match.end()
+        if len(self._buffer) >= MAX_BODY_BYTES and not self.complete:
+            self.truncated = True
+
+    def read_head(self):
+        """Return the document up to and including </head>."""
+        self._read_until(HEAD_MAX_BYTES, stop_at_head=True)
+        end = self._head_end if self._head_end is not None else len(self._buffer)
+        return self._decode(self._buffer[:end])
+
+    def read_all(self):
+        """Return the whole document, capped at MAX_BODY_BYTES."""
+        self._read_until(MAX_BODY_BYTES)
+        return self._decode(self._buffer[:MAX_BODY_BYTES])
+
+    def _encoding(self):
+        if 'charset' in self.response.headers.get('Content-Type', '').lower():
+            return self.response.encoding
+        match = _META_CHARSET.search(self._buffer, 0, 4096)
+        if match:
+            return match.group(1).decode('ascii')
+        return 'utf-8'
+
+    def _decode(self, data):
+        try:
+            return data.decode(self._encoding(), errors='replace')
+        except LookupError:
+            return data.decode('utf-8', errors='replace')
+
+    def close(self):
+        """Release the connection, draining small remainders so it can be reused."""
+        if not self.complete:
+            remaining = getattr(self.response.raw, 'length_remaining', None)
+            if remaining is not None and remaining <= DRAIN_MAX_BYTES:
+                for _ in self._chunks:
+                    pass
+                self.complete = True
+        self.response.close()
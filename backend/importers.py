@@ -0,0 +1,412 @@
+"""
+Incremental BibTeX, RIS and CSV parsers for bibliography import.
+
+Each parser consumes an iterator of text lines and yields one record at a
+time, already mapped onto the book/journal/website fields the formatters use
+(with 'sourceType' set), so files with tens of thousands of entries are never
+held in memory. Malformed entries are yielded as InvalidRecord values so the
+caller can report them without stopping the import.
+"""
+import csv
+import re
+
+MAX_ENTRY_CHARS = 64 * 1024
+
+_YEAR = re.compile(r'\b(\d{4})\b')
+_LATEX_ESCAPE = re.compile(r'\\([&%$#_{}])')
+_LATEX_COMMAND = re.compile(r'\\[a-zA-Z]+\s*|\\.')
+_ENTRY_START = re.compile(r'@\s*(\w+)\s*([{(])')
+_LINE_ENTRY_START = re.compile(r'\s*@\s*\w+\s*[{(]')
+
+MONTHS = {
+    'jan': 'January', 'feb': 'February', 'mar': 'March', 'apr': 'April',
+    'may': 'May', 'jun': 'June', 'jul': 'July', 'aug': 'August',
+    'sep': 'September', 'oct': 'October', 'nov': 'November', 'dec': 'December',
+}
+
+
+class InvalidRecord:
+    """Yielded in place of a record that could not be parsed; `line` is where it started."""
+
+    def __init__(self, line, error):
+        self.line = line
+        self.error = error
+
+
+def _clean(value):
+    return ' '.join(str(value).split()) if value else ''
+
+
+def _year(*values):
+    for value in values:
+        match = _YEAR.search(value or '')
+        if match:
+            return match.group(1)
+    return ''
+
+
+def person_name(name):
+    """Turn "Last, First" into "First Last"; other forms are kept as written."""
+    name = _clean(name)
+    if name.count(',') == 1:
+        last, first = (part.strip() for part in name.split(','))
+        return f'{first} {last}'.strip()
+    return name
+
+
+def build_record(source_type, fields):
+    """Build a formatter record, keeping only the fields for its source type."""
+    authors = [a for a in fields.get('authors', []) if a]
+    pages = _clean(fields.get('pages')).replace('--', '-').replace('–', '-')
+    if source_type == 'journal':
+        return {
+            'sourceType': 'journal',
+            'authors': authors,
+            'title': _clean(fields.get('title')),
+            'journal': _clean(fields.get('journal')),
+            'volume': _clean(fields.get('volume')),
+            'issue': _clean(fields.get('issue')),
+            'year': _clean(fields.get('year')),
+            'pages': pages,
+            'doi': _clean(fields.get('doi')),
+        }
+    if source_type == 'website':
+        return {
+            'sourceType': 'website',
+            'author': authors[0] if authors else '',
+            'title': _clean(fields.get('title')),
+            'date': _clean(fields.get('date')) or _clean(fields.get('year')),
+            'publisher': _clean(fields.get('publisher')),
+            'url': _clean(fields.get('url')),
+        }
+    return {
+        'sourceType': 'book',
+        'authors': authors,
+        'title': _clean(fields.get('title')),
+        'year': _clean(fields.get('year')),
+        'publisher': _clean(fields.get('publisher')),
+    }
+
+
+def guess_type(fields):
+    if fields.get('journal'):
+        return 'journal'
+    if fields.get('url') and not fields.get('publisher'):
+        return 'website'
+    return 'book'
+
+
+# BibTeX
+
+BIBTEX_TYPES = {
+    'article': 'journal',
+    'book': 'book', 'inbook': 'book', 'incollection': 'book', 'booklet': 'book',
+    'online': 'website', 'electronic': 'website', 'www': 'website', 'webpage': 'website',
+}
+
+
+def _latex_command(match):
+    # Logos are words in their own right; other commands (\emph, accents) are dropped
+    command = match.group(0)
+    if command[1:].rstrip() in ('TeX', 'LaTeX', 'BibTeX'):
+        return command[1:]
+    return ' ' if command == '\\ ' else ''
+
+
+def _latex_to_text(value):
+    value = _LATEX_ESCAPE.sub(r'\1', value)
+    value = _LATEX_COMMAND.sub(_latex_command, value)
+    return value.replace('{', '').replace('}', '').replace('~', ' ')
+
+
+class _BibtexEntry:
+    """Scanner over the text of a single @type{...} entry."""
+
+    def __init__(self, text, strings):
+        self.text = text
+        self.pos = 0
+        self.strings = strings
+
+    def skip_space(self):
+        while self.pos < len(self.text) and self.text[self.pos] in ' \t\r\n':
+            self.pos += 1
+
+    def peek(self):
+        self.skip_space()
+        return self.text[self.pos] if self.pos < len(self.text) else ''
+
+    def word(self):
+        self.skip_space()
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] not in ' \t\r\n=,#{}()"':
+            self.pos += 1
+        return self.text[start:self.pos]
+
+    def delimited(self, close):
+        """Read a {...} or "..." value; the opening delimiter has been consumed."""
+        depth, start = 0, self.pos
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if char == '\\':
+                self.pos += 2
+                continue
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                if depth == 0 and close == '}':
+                    self.pos += 1
+                    return self.text[start:self.pos - 1]
+                depth -= 1
+            elif char == '"' and close == '"' and depth == 0:
+                self.pos += 1
+                return self.text[start:self.pos - 1]
+            self.pos += 1
+        raise ValueError('Unterminated field value')
+
+    def value(self):
+        parts = []
+        while True:
+            char = self.peek()
+            if char == '{':
+                self.pos += 1
+                parts.append(self.delimited('}'))
+            elif char == '"':
+                self.pos += 1
+                parts.append(self.delimited('"'))
+            else:
+                token = self.word()
+                if not token:
+                    raise ValueError('Missing field value')
+                key = token.lower()
+                parts.append(self.strings.get(key) or MONTHS.get(key) or token)
+            if self.peek() != '#':
+                return ''.join(parts)
+            self.pos += 1
+
+    def fields(self):
+        fields = {}
+        while True:
+            char = self.peek()
+            if char == ',':
+                self.pos += 1
+                continue
+            if char in ('}', ')', ''):
+                return fields
+            name = self.word().lower()
+            if not name or self.peek() != '=':
+                raise ValueError(f'Malformed field near {self.text[self.pos:self.pos + 20]!r}')
+            self.pos += 1
+            fields[name] = self.value()
+
+
+def _bibtex_record(entry_type, fields):
+    authors = fields.get('author') or fields.get('editor') or ''
+    names = [person_name(_latex_to_text(name)) for name in re.split(r'\s+and\s+', authors) if name.strip()]
+    values = {key: _latex_to_text(value) for key, value in fields.items()}
+    mapped = {
+        'authors': names,
+        'title': values.get('title') or values.get('booktitle'),
+        'journal': values.get('journal') or values.get('journaltitle'),
+        'volume': values.get('volume'),
+        'issue': values.get('number') or values.get('issue'),
+        'year': _year(values.get('year'), values.get('date')),
+        'date': values.get('date') or ' '.join(filter(None, [values.get('day'), values.get('month'), values.get('year')])),
+        'pages': values.get('pages'),
+        'publisher': values.get('publisher') or values.get('organization') or values.get('institution')
+                     or values.get('howpublished'),
+        'doi': values.get('doi'),
+        'url': values.get('url'),
+    }
+    return build_record(BIBTEX_TYPES.get(entry_type) or guess_type(mapped), mapped)
+
+
+def _bibtex_entries(lines):
+    """
+    Yield (line number, entry text, error) per @type{...} entry; text is None
+    and error says why if the entry can't be parsed.
+    """
+    buffer, start_line = None, 0
+    for number, line in enumerate(lines, 1):
+        position = segment = 0
+        if buffer is not None and _LINE_ENTRY_START.match(line):
+            # A line starting a new entry ends one missing its closing
+            # delimiter, rather than it swallowing the rest of the file
+            yield start_line, None, 'Unterminated entry'
+            buffer = None
+        while position < len(line):
+            if buffer is None:
+                match = _ENTRY_START.search(line, position)
+                if not match:
+                    break
+                buffer, size, start_line, depth = [], 0, number, 0
+                close = '}' if match.group(2) == '{' else ')'
+                segment, position = match.start(), match.end()
+            # Find the delimiter closing the entry, skipping braced values
+            while position < len(line):
+                char = line[position]
+                if char == '\\':
+                    position += 2
+                    continue
+                if char == '{':
+                    depth += 1
+                elif char == '}':
+                    if depth == 0 and close == '}':
+                        break
+                    depth -= 1
+                elif char == ')' and close == ')' and depth == 0:
+                    break
+                position += 1
+            if position < len(line):
+                buffer.append(line[segment:position + 1])
+                yield start_line, ''.join(buffer), None
+                buffer = None
+                position += 1
+            else:
+                buffer.append(line[segment:])
+                size += len(line) - segment
+                if size > MAX_ENTRY_CHARS:
+                    yield start_line, None, 'Entry too large'
+                    buffer = None
+    if buffer is not None:
+        yield start_line, None, 'Unterminated entry'
+
+
+def parse_bibtex(lines):
+    strings = {}
+    for line, text, error in _bibtex_entries(lines):
+        if error:
+            yield InvalidRecord(line, error)
+            continue
+        match = re.match(r'@\s*(\w+)\s*[{(]\s*', text)
+        if not match:
+            yield InvalidRecord(line, 'Malformed entry')
+            continue
+        entry_type = match.group(1).lower()
+        if entry_type in ('comment', 'preamble'):
+            continue
+        entry = _BibtexEntry(text, strings)
+        entry.pos = match.end()
+        try:
+            if entry_type == 'string':
+                strings.update({key: value for key, value in entry.fields().items()})
+                continue
+            entry.word()  # citation key
+            fields = entry.fields()
+        except ValueError as e:
+            yield InvalidRecord(line, str(e))
+            continue
+        yield _bibtex_record(entry_type, fields)
+
+
+# RIS
+
+RIS_TYPES = {
+    'JOUR': 'journal', 'JFULL': 'journal', 'MGZN': 'journal', 'NEWS': 'journal',
+    'BOOK': 'book', 'CHAP': 'book', 'EBOOK': 'book', 'EDBOOK': 'book',
+    'ELEC': 'website', 'WEB': 'website', 'BLOG': 'website',
+}
+_RIS_LINE = re.compile(r'^([A-Z][A-Z0-9])  -(?: (.*))?$')
+
+
+def _ris_record(tags):
+    def first(*names):
+        for name in names:
+            if tags.get(name):
+                return tags[name][0]
+        return ''
+
+    start, end = first('SP'), first('EP')
+    mapped = {
+        'authors': [person_name(name) for name in tags.get('AU', []) + tags.get('A1', [])],
+        'title': first('TI', 'T1'),
+        'journal': first('JO', 'JF', 'T2', 'JA'),
+        'volume': first('VL'),
+        'issue': first('IS'),
+        'year': _year(first('PY', 'Y1', 'DA')),
+        'date': first('DA', 'PY', 'Y1'),
+        'pages': f'{start}-{end}' if start and end else start,
+        'publisher': first('PB'),
+        'doi': first('DO'),
+        'url': first('UR'),
+    }
+    source_type = RIS_TYPES.get(first('TY').upper())
+    if source_type == 'book' and first('TY').upper() == 'CHAP':
+        mapped['title'] = first('T2', 'BT') or mapped['title']
+    return build_record(source_type or guess_type(mapped), mapped)
+
+
+def parse_ris(lines):
+    tags, start_line, last_tag = None, 0, None
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        match = _RIS_LINE.match(line.lstrip('\ufeff'))
+        if not match:
+            # Continuation of a long value
+            if tags is not None and last_tag and line.strip():
+                tags[last_tag][-1] += ' ' + line.strip()
+            continue
+        tag, value = match.group(1), (match.group(2) or '').strip()
+        if tag == 'TY':
+            if tags is not None:
+                yield InvalidRecord(start_line, 'Record missing ER')
+            tags, start_line = {}, number
+        if tags is None:
+            continue
+        if tag == 'ER':
+            yield _ris_record(tags)
+            tags, last_tag = None, None
+            continue
+        tags.setdefault(tag, []).append(value)
+        last_tag = tag
+    if tags is not None:
+        yield InvalidRecord(start_line, 'Record missing ER')
+
+
+# CSV
+
+CSV_COLUMNS = {
+    'type': 'sourceType', 'sourcetype': 'sourceType', 'source_type': 'sourceType',
+    'author': 'authors', 'authors': 'authors',
+    'title': 'title', 'journal': 'journal', 'volume': 'volume',
+    'issue': 'issue', 'number': 'issue', 'year': 'year', 'date': 'date',
+    'pages': 'pages', 'publisher': 'publisher', 'doi': 'doi', 'url': 'url',
+}
+
+
+def parse_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        mapped = {}
+        for column, value in row.items():
+            key = CSV_COLUMNS.get((column or '').strip().lower())
+            if key and value:
+                mapped[key] = value
+        if not any(mapped.values()):
+            continue
+        authors = mapped.get('authors', '')
+        mapped['authors'] = [person_name(name) for name in re.split(r';|\s+and\s+', authors) if name.strip()]
+        mapped['year'] = _year(mapped.get('year'), mapped.get('date')) or mapped.get('year', '')
+        source_type = mapped.pop('sourceType', '').strip().lower()
+        if source_type not in ('book', 'journal', 'website'):
+            source_type = guess_type(mapped)
+        yield build_record(source_type, mapped)
+
+
+PARSERS = {
+    'bibtex': parse_bibtex,
+    'ris': parse_ris,
+    'csv': parse_csv,
+}
+
+EXTENSIONS = {
+    'bib': 'bibtex',
+    'bibtex': 'bibtex',
+    'ris': 'ris',
+    'csv': 'csv',
+}
+
+
+def detect_format(filename):
+    """Guess the import format from a file name, or None."""
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    return EXTENSIONS.get(extension)
@@ -0,0 +1,270 @@
+"""
+Logging setup, stage timers and Prometheus-style metrics.
+
+timer('parse') records how long a stage took into the citation_stage_seconds
+histogram and, while a request is being traced, into that request's
+Server-Timing breakdown. Each process buffers counts in memory and adds them
+to a small SQLite table every few seconds, so /metrics reports totals across
+all gunicorn workers.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') not in ('0', 'false', 'no')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_DB_PATH = os.environ.get('METRICS_DB_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics.db')
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') not in ('0', 'false', 'no')
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS = {
+    'citation_stage_seconds': ('histogram', 'Time spent in each extraction and formatting stage.'),
+    'http_request_duration_seconds': ('histogram', 'API request latency.'),
+    'citation_extractions_total': ('counter', 'Metadata extractions by outcome.'),
+    'citation_parses_total': ('counter', 'HTML documents parsed, by where they were parsed.'),
+}
+
+logger = logging.getLogger(__name__)
+
+# Logging
+
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra` fields are included as keys."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Configure the root logger from LOG_LEVEL/LOG_FORMAT unless something else already has."""
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+
+# Per-request Server-Timing
+
+class RequestTimings:
+    """Stage durations for one request, summed across the threads serving it."""
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self, total=None):
+        parts = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in self.stages.items()]
+        if total is not None:
+            parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def start_request():
+    """Begin collecting stage timings for the current request."""
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+def current_timings():
+    return _request_timings.get()
+
+
+# Metrics
+
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+_local = threading.local()
+
+
+def _labels(labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def _record(updates):
+    global _last_flush
+    with _pending_lock:
+        for key, amount in updates:
+            _pending[key] = _pending.get(key, 0) + amount
+        due = time.monotonic() - _last_flush >= METRICS_FLUSH_INTERVAL
+        if due:
+            _last_flush = time.monotonic()
+    if due:
+        flush()
+
+
+def inc(name, amount=1, **labels):
+    """Increment a counter."""
+    if METRICS_ENABLED:
+        _record([((name, _labels(labels), ''), amount)])
+
+
+def observe(name, seconds, **labels):
+    """Record one observation in a histogram."""
+    if not METRICS_ENABLED:
+        return
+    labels = _labels(labels)
+    index = bisect_left(BUCKETS, seconds)
+    le = str(BUCKETS[index]) if index < len(BUCKETS) else '+Inf'
+    _record([
+        ((name, labels, 'le=' + le), 1),
+        ((name, labels, 'count'), 1),
+        ((name, labels, 'sum'), seconds),
+    ])
+
+
+@contextmanager
+def timer(stage):
+    """Time a block as `stage` in citation_stage_seconds and the request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_stage(stage, seconds):
+    """Record a stage duration measured elsewhere, e.g. in a pool process."""
+    observe('citation_stage_seconds', seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def _conn():
+    conn, pid = getattr(_local, 'conn', (None, None))
+    if conn is None or pid != os.getpid():
+        os.makedirs(os.path.dirname(METRICS_DB_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(METRICS_DB_PATH, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS metric (
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                field TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (name, labels, field)
+            )
+        ''')
+        _local.conn = (conn, os.getpid())
+    return conn
+
+
+def flush():
+    """Add this process's buffered counts to the shared table."""
+    with _pending_lock:
+        if not _pending:
+            return
+        rows = [(name, labels, field, value) for (name, labels, field), value in _pending.items()]
+        _pending.clear()
+    try:
+        conn = _conn()
+        conn.executemany(
+            'INSERT INTO metric (name, labels, field, value) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (name, labels, field) DO UPDATE SET value = value + excluded.value',
+            rows,
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.warning('Dropping %d metric updates: %s', len(rows), e)
+
+
+def disable():
+    """Stop recording metrics in this process and drop anything it has buffered."""
+    global METRICS_ENABLED
+    METRICS_ENABLED = False
+    with _pending_lock:
+        _pending.clear()
+
+
+def reset():
+    """Forget all recorded metrics (called when the gunicorn master starts)."""
+    with _pending_lock:
+        _pending.clear()
+    conn = _conn()
+    conn.execute('DELETE FROM metric')
+    conn.commit()
+
+
+def _number(value):
+    """Exposition format for a sample: whole numbers in full, other floats round-trippable."""
+    if float(value).is_integer():
+        return '%d' % value
+    return repr(float(value))
+
+
+def _series(name, labels, extra=''):
+    labels = ','.join(filter(None, [labels, extra]))
+    return f'{name}{{{labels}}}' if labels else name
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    flush()
+    rows = _conn().execute('SELECT name, labels, field, value FROM metric ORDER BY name, labels').fetchall()
+    grouped = {}
+    for name, labels, field, value in rows:
+        grouped.setdefault(name, {}).setdefault(labels, {})[field] = value
+
+    lines = []
+    for name, series in grouped.items():
+        kind, help_text = METRICS.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, fields in series.items():
+            if kind != 'histogram':
+                lines.append(f"{_series(name, labels)} {_number(fields.get('', 0))}")
+                continue
+            cumulative = 0
+            for bound in BUCKETS + ('+Inf',):
+                cumulative += fields.get(f'le={bound}', 0)
+                bucket = _series(name + '_bucket', labels, f'le="{bound}"')
+                lines.append(f'{bucket} {_number(cumulative)}')
+            lines.append(f"{_series(name + '_sum', labels)} {_number(fields.get('sum', 0))}")
+            lines.append(f"{_series(name + '_count', labels)} {_number(fields.get('count', 0))}")
+    return '\n'.join(lines) + '\n'
+
+
+atexit.register(flush)
@@ -0,0 +1,323 @@
+"""
+Background batch jobs.
+
+Large batches are submitted as jobs and processed on an in-process worker
+pool, so the request that submits them returns immediately. Job state and
+per-item results live in SQLite, which lets any gunicorn worker answer
+progress, result and cancellation requests for a job started by another.
+
+Payloads are not stored, so a job whose worker exits before it finishes
+cannot be resumed. Each job records the process that owns it, and
+unfinished jobs whose owner is gone are marked failed: all of them at
+startup (recover_orphans) and any single one as soon as it is looked up.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_ITEMS = int(os.environ.get('JOB_MAX_ITEMS', 5000))
+JOB_DEADLINE = float(os.environ.get('JOB_DEADLINE', 30 * 60))
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION', 24 * 60 * 60))
+# Unfinished jobs owned by another host are given up on after this long
+# without progress, since whether their worker is alive can't be checked
+JOB_STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 2 * JOB_DEADLINE))
+# Longest follow() streams results for a job before giving up
+JOB_FOLLOW_MAX = float(os.environ.get('JOB_FOLLOW_MAX', JOB_DEADLINE + 60))
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'jobs.db')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+FINISHED = (COMPLETED, CANCELLED, FAILED)
+
+ORPHANED_ERROR = 'The worker running this job stopped before it finished'
+
+logger = logging.getLogger(__name__)
+
+_runners = {}
+_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+_schema_ready = False
+_owner = None
+
+
+def _conn():
+    conn, pid = getattr(_local, 'conn', (None, None))
+    if conn is None or pid != os.getpid():
+        os.makedirs(os.path.dirname(JOBS_DB_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB_PATH, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = (conn, os.getpid())
+        _ensure_schema(conn)
+    return conn
+
+
+def _ensure_schema(conn):
+    global _schema_ready
+    if _schema_ready:
+        return
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS job (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            owner_host TEXT,
+            owner_pid INTEGER,
+            owner_boot TEXT
+        );
+        CREATE TABLE IF NOT EXISTS job_result (
+            job_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            item_index INTEGER NOT NULL,
+            result TEXT NOT NULL,
+            PRIMARY KEY (job_id, seq)
+        );
+        CREATE INDEX IF NOT EXISTS ix_job_created ON job (created_at);
+    ''')
+    # Job tables created before owners were recorded
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(job)')}
+    for column, kind in (('owner_host', 'TEXT'), ('owner_pid', 'INTEGER'), ('owner_boot', 'TEXT')):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE job ADD COLUMN {column} {kind}')
+    conn.commit()
+    _schema_ready = True
+
+
+def _owner_id():
+    """(host, pid, boot id) of this process; the boot id tells a reused pid apart."""
+    global _owner
+    if _owner is None or _owner[1] != os.getpid():
+        _owner = (socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+    return _owner
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _orphaned(row, now):
+    if row['status'] in FINISHED:
+        return False
+    host, pid, boot = _owner_id()
+    if row['owner_host'] != host or row['owner_pid'] is None:
+        return now - row['updated_at'] > JOB_STALE_AFTER
+    if row['owner_pid'] == pid:
+        return row['owner_boot'] != boot
+    return not _pid_alive(row['owner_pid'])
+
+
+def _fail_orphans(conn, rows):
+    ids = [row['id'] for row in rows if _orphaned(row, time.time())]
+    if ids:
+        conn.executemany(
+            'UPDATE job SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status NOT IN (?, ?, ?)',
+            [(FAILED, ORPHANED_ERROR, time.time(), job_id) + FINISHED for job_id in ids],
+        )
+        conn.commit()
+        logger.warning('Marked %d orphaned job(s) as failed', len(ids))
+    return ids
+
+
+def recover_orphans():
+    """Mark failed every unfinished job whose worker has exited; returns their ids."""
+    conn = _conn()
+    rows = conn.execute('SELECT * FROM job WHERE status NOT IN (?, ?, ?)', FINISHED).fetchall()
+    return _fail_orphans(conn, rows)
+
+
+def register(kind, runner):
+    """Register runner(job, payload) as the handler for jobs of this kind."""
+    _runners[kind] = runner
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+    return _executor
+
+
+class Job:
+    """Handle passed to runners for reporting results and checking cancellation."""
+
+    # Cancellation is requested through the database, possibly by another worker.
+    CANCEL_CHECK_INTERVAL = 0.5
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self._seq = 0
+        self._cancelled = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def add_result(self, index, result):
+        """Record the result for input item `index`; safe to call from any thread."""
+        self.add_results([(index, result)])
+
+    def add_results(self, pairs):
+        """Record several (index, result) pairs in one transaction."""
+        if not pairs:
+            return
+        with self._lock:
+            conn = _conn()
+            conn.executemany(
+                'INSERT INTO job_result (job_id, seq, item_index, result) VALUES (?, ?, ?, ?)',
+                [(self.id, self._seq + offset, index, json.dumps(result))
+                 for offset, (index, result) in enumerate(pairs)],
+            )
+            conn.execute(
+                'UPDATE job SET completed = completed + ?, updated_at = ? WHERE id = ?',
+                (len(pairs), time.time(), self.id),
+            )
+            conn.commit()
+            self._seq += len(pairs)
+
+    def is_cancelled(self):
+        if self._cancelled:
+            return True
+        now = time.monotonic()
+        if now - self._checked_at >= self.CANCEL_CHECK_INTERVAL:
+            self._checked_at = now
+            row = _conn().execute('SELECT cancel_requested FROM job WHERE id = ?', (self.id,)).fetchone()
+            self._cancelled = bool(row and row['cancel_requested'])
+        return self._cancelled
+
+
+def _set_status(job_id, status, error=None):
+    conn = _conn()
+    conn.execute(
+        'UPDATE job SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+        (status, error, time.time(), job_id),
+    )
+    conn.commit()
+
+
+def _run(job_id, kind, payload):
+    job = Job(job_id)
+    try:
+        if job.is_cancelled():
+            _set_status(job_id, CANCELLED)
+            return
+        _set_status(job_id, RUNNING)
+        _runners[kind](job, payload)
+        _set_status(job_id, CANCELLED if job.is_cancelled() else COMPLETED)
+    except Exception as e:
+        logger.exception("Job %s failed: %s", job_id, e)
+        _set_status(job_id, FAILED, str(e))
+
+
+def _purge_expired(conn):
+    cutoff = time.time() - JOB_RETENTION
+    conn.execute('DELETE FROM job_result WHERE job_id IN (SELECT id FROM job WHERE created_at < ?)', (cutoff,))
+    conn.execute('DELETE FROM job WHERE created_at < ?', (cutoff,))
+
+
+def submit(kind, payload, total):
+    """Queue a job and return its id."""
+    if kind not in _runners:
+        raise ValueError(f'Unknown job type: {kind}')
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _conn()
+    _purge_expired(conn)
+    conn.execute(
+        'INSERT INTO job (id, kind, status, total, created_at, updated_at, owner_host, owner_pid, owner_boot) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (job_id, kind, QUEUED, total, now, now) + _owner_id(),
+    )
+    conn.commit()
+    _get_executor().submit(_run, job_id, kind, payload)
+    return job_id
+
+
+def get_job(job_id):
+    """Return the job's status dict, or None if it does not exist."""
+    conn = _conn()
+    row = conn.execute('SELECT * FROM job WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    if _fail_orphans(conn, [row]):
+        row = conn.execute('SELECT * FROM job WHERE id = ?', (job_id,)).fetchone()
+    return {
+        'id': row['id'],
+        'type': row['kind'],
+        'status': row['status'],
+        'total': row['total'],
+        'completed': row['completed'],
+        'cancelRequested': bool(row['cancel_requested']),
+        'error': row['error'],
+        'createdAt': row['created_at'],
+        'updatedAt': row['updated_at'],
+    }
+
+
+def get_results(job_id, after=0, limit=1000):
+    """
+    Return (results, next_cursor) for results recorded after `after`, in the
+    order they finished. Each result carries the input 'index'.
+    """
+    rows = _conn().execute(
+        'SELECT seq, item_index, result FROM job_result WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?',
+        (job_id, after, limit),
+    ).fetchall()
+    results = []
+    for row in rows:
+        result = json.loads(row['result'])
+        result['index'] = row['item_index']
+        results.append(result)
+    return results, after + len(results)
+
+
+def cancel(job_id):
+    """Request cancellation; returns False if the job does not exist."""
+    conn = _conn()
+    cursor = conn.execute(
+        'UPDATE job SET cancel_requested = 1, updated_at = ? WHERE id = ?',
+        (time.time(), job_id),
+    )
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+def follow(job_id, poll_interval=0.25, max_duration=None):
+    """Yield results as they are recorded until the job finishes or max_duration (JOB_FOLLOW_MAX) passes."""
+    give_up_at = time.monotonic() + (JOB_FOLLOW_MAX if max_duration is None else max_duration)
+    cursor = 0
+    while True:
+        job = get_job(job_id)
+        results, cursor = get_results(job_id, cursor)
+        yield from results
+        if job is None or (job['status'] in FINISHED and not results):
+            return
+        if time.monotonic() >= give_up_at:
+            logger.info('Stopped following job %s, still %s', job_id, job['status'])
+            return
+        if not results:
+            time.sleep(poll_interval)
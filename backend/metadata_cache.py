@@ -0,0 +1,219 @@
+"""
+Cache for extracted URL metadata.
+
+Entries are keyed on urls.cache_key(url) and expire after a TTL; failed
+extractions are cached too, with a shorter TTL, so a broken URL submitted
+repeatedly is not refetched every time. Two backends are available: an
+in-process LRU and a SQLite file that all gunicorn workers can share.
+"""
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from urls import cache_key
+
+CACHE_BACKEND = os.environ.get('METADATA_CACHE_BACKEND', 'memory')
+CACHE_TTL = float(os.environ.get('METADATA_CACHE_TTL', 24 * 60 * 60))
+CACHE_NEGATIVE_TTL = float(os.environ.get('METADATA_CACHE_NEGATIVE_TTL', 60))
+CACHE_MAX_SIZE = int(os.environ.get('METADATA_CACHE_MAX_SIZE', 10000))
+CACHE_PATH = os.environ.get('METADATA_CACHE_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'metadata_cache.db')
+
+logger = logging.getLogger(__name__)
+
+class MemoryBackend:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_size=CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """LRU cache stored in a SQLite file so every worker process shares hits."""
+
+    # Evicting on every write would add a COUNT(*) to each miss.
+    EVICT_EVERY = 100
+
+    def __init__(self, path=CACHE_PATH, max_size=CACHE_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS metadata_cache ('
+            'key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_metadata_cache_accessed ON metadata_cache (accessed_at)')
+        conn.commit()
+
+    def _conn(self):
+        # Connections are per thread and must not survive a gunicorn fork.
+        conn, pid = getattr(self._local, 'conn', (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = (conn, os.getpid())
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            'SELECT value FROM metadata_cache WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE metadata_cache SET accessed_at = ? WHERE key = ?', (now, key))
+        conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO metadata_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), now + ttl, now),
+        )
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self._evict(conn, now)
+        conn.commit()
+
+    def _evict(self, conn, now):
+        conn.execute('DELETE FROM metadata_cache WHERE expires_at <= ?', (now,))
+        conn.execute(
+            'DELETE FROM metadata_cache WHERE key IN ('
+            'SELECT key FROM metadata_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_size,),
+        )
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute('DELETE FROM metadata_cache')
+        conn.commit()
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM metadata_cache').fetchone()[0]
+
+
+class NullBackend:
+    """Backend that stores nothing; selected with METADATA_CACHE_BACKEND=none."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'sqlite': SQLiteBackend,
+    'none': NullBackend,
+}
+
+# Sentinel stored for failed extractions so they can be told apart from a miss.
+_FAILED = {'__failed__': True}
+
+
+class MetadataCache:
+    """Positive/negative metadata cache with hit/miss accounting."""
+
+    def __init__(self, backend, ttl=CACHE_TTL, negative_ttl=CACHE_NEGATIVE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._stats = {'hits': 0, 'negative_hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, url):
+        """Return (found, metadata); metadata is None for a cached failure."""
+        try:
+            value = self.backend.get(cache_key(url))
+        except (ValueError, AttributeError, sqlite3.Error):
+            value = None
+        if value is None:
+            self._count('misses')
+            return False, None
+        if value == _FAILED:
+            self._count('negative_hits')
+            return True, None
+        self._count('hits')
+        return True, value
+
+    def set(self, url, metadata):
+        """Store metadata for url; None records a failed extraction."""
+        try:
+            if metadata is None:
+                self.backend.set(cache_key(url), _FAILED, self.negative_ttl)
+            else:
+                self.backend.set(cache_key(url), metadata, self.ttl)
+        except (ValueError, AttributeError, sqlite3.Error) as e:
+            logger.warning("Error writing metadata cache: %s", e)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+        stats['backend'] = type(self.backend).__name__
+        try:
+            stats['size'] = len(self.backend)
+        except sqlite3.Error:
+            stats['size'] = None
+        return stats
+
+
+def create_cache(backend=None):
+    """Build a MetadataCache using the named backend (defaults to METADATA_CACHE_BACKEND)."""
+    backend_cls = BACKENDS.get(backend or CACHE_BACKEND, MemoryBackend)
+    return MetadataCache(backend_cls())
+
+
+metadata_cache = create_cache()
@@ -0,0 +1,348 @@
+"""
+Single-pass HTML metadata parser.
+
+MetadataCollector walks the document once with html.parser and keeps only
+the tags citation extraction looks at: the JSON-LD scripts, the
+og:/twitter:/article: meta tags, <title>, the first <h1> and the first
+<time datetime>. It follows the same tree-building rules as BeautifulSoup's
+html.parser builder (void elements, string containers, end-tag popping), so
+parse_metadata() returns exactly what the previous soup.find() based code did
+without building a full tree.
+"""
+import logging
+import re
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+from bs4.dammit import EntitySubstitution
+
+import structured_data
+from instrumentation import timer
+from normalization import format_date
+
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed',
+    'frame', 'hr', 'image', 'img', 'input', 'isindex', 'keygen', 'link',
+    'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr',
+])
+# Text inside these is not "text" for get_text() purposes.
+STRING_CONTAINERS = frozenset(['rt', 'rp', 'style', 'script', 'template'])
+PRESERVE_WHITESPACE = frozenset(['pre', 'textarea'])
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+META_PROPERTIES = frozenset([
+    'og:title', 'article:author', 'og:article:author', 'article:published_time', 'og:site_name',
+])
+META_NAMES = frozenset(['title', 'twitter:title', 'author', 'date', 'publisher'])
+
+logger = logging.getLogger(__name__)
+
+_DECIMAL_REFERENCE = re.compile('^([0-9]+)(.*)')
+_HEX_REFERENCE = re.compile('^([0-9a-f]+)(.*)')
+
+# String kinds; only TEXT and CDATA count towards get_text().
+TEXT, CDATA, CONTAINED, OTHER = range(4)
+
+
+def _numeric_reference(number):
+    """Resolve a numeric character reference the way the HTML spec (and bs4) does."""
+    if number == 0 or number > 0x10ffff or 0xd800 <= number <= 0xdfff:
+        return '\ufffd'
+    if 0x80 <= number <= 0x9f:
+        try:
+            return bytes([number]).decode('cp1252')
+        except UnicodeDecodeError:
+            pass
+    return chr(number)
+
+
+class _Node:
+    __slots__ = ('children',)
+
+    def __init__(self):
+        self.children = []
+
+    @property
+    def string(self):
+        """Same semantics as bs4's Tag.string."""
+        if len(self.children) != 1:
+            return None
+        child = self.children[0]
+        if isinstance(child, _Node):
+            return child.string
+        return child[1]
+
+    def get_text(self):
+        parts = []
+        stack = [iter(self.children)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, _Node):
+                    stack.append(iter(child.children))
+                    break
+                if child[0] == TEXT or child[0] == CDATA:
+                    parts.append(child[1])
+            else:
+                stack.pop()
+        return ''.join(parts)
+
+
+class MetadataCollector(HTMLParser):
+    """Collects citation-relevant tags in one pass over the document."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.json_ld = []
+        self.title = None
+        self.h1 = None
+        self.time = None
+        self.meta_property = {}
+        self.meta_name = {}
+
+        # Open elements as (name, node); node is set only inside a captured element.
+        self._stack = []
+        self._open_counts = {}
+        self._containers = []
+        self._preserve = 0
+        self._already_closed = []
+        self._data = []
+
+    # Tree building
+
+    def _flush(self, kind=None):
+        if not self._data:
+            return
+        data = ''.join(self._data)
+        self._data = []
+        if not self._stack:
+            return
+        node = self._stack[-1][1]
+        if node is None:
+            return
+        if kind is None:
+            if not self._preserve and not data.strip(ASCII_SPACES):
+                data = '\n' if '\n' in data else ' '
+            kind = CONTAINED if self._containers else TEXT
+        node.children.append((kind, data))
+
+    def _push(self, tag, node):
+        self._stack.append((tag, node))
+        self._open_counts[tag] = self._open_counts.get(tag, 0) + 1
+        if tag in STRING_CONTAINERS:
+            self._containers.append(tag)
+        if tag in PRESERVE_WHITESPACE:
+            self._preserve += 1
+
+    def _pop(self):
+        tag, _ = self._stack.pop()
+        self._open_counts[tag] -= 1
+        if self._containers and self._containers[-1] == tag:
+            self._containers.pop()
+        if tag in PRESERVE_WHITESPACE:
+            self._preserve -= 1
+
+    def _pop_to(self, tag):
+        while self._stack and self._open_counts.get(tag):
+            name = self._stack[-1][0]
+            self._pop()
+            if name == tag:
+                break
+
+    def _start(self, tag, attrs, handle_empty_element=True):
+        self._flush()
+        attr_dict = {}
+        for key, value in attrs:
+            attr_dict[key] = '' if value is None else value
+
+        parent = self._stack[-1][1] if self._stack else None
+        node = None
+        if parent is not None:
+            node = _Node()
+            parent.children.append(node)
+
+        if tag == 'meta':
+            prop = attr_dict.get('property')
+            if prop in META_PROPERTIES and prop not in self.meta_property:
+                self.meta_property[prop] = attr_dict
+            name = attr_dict.get('name')
+            if name in META_NAMES and name not in self.meta_name:
+                self.meta_name[name] = attr_dict
+        elif tag == 'title':
+            if self.title is None:
+                self.title = node = node or _Node()
+        elif tag == 'h1':
+            if self.h1 is None:
+                self.h1 = node = node or _Node()
+        elif tag == 'time':
+            if self.time is None and 'datetime' in attr_dict:
+                self.time = attr_dict
+        elif tag == 'script':
+            if attr_dict.get('type') == 'application/ld+json':
+                node = node or _Node()
+                self.json_ld.append(node)
+
+        self._push(tag, node)
+        if handle_empty_element and tag in VOID_ELEMENTS:
+            self._end(tag, check_already_closed=False)
+            self._already_closed.append(tag)
+
+    def _end(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self._already_closed:
+            self._already_closed.remove(tag)
+            return
+        self._flush()
+        self._pop_to(tag)
+
+    # HTMLParser callbacks
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, handle_empty_element=False)
+        self._end(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag):
+        self._end(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_charref(self, name):
+        # Same recovery as bs4: keep the leading digits of a malformed reference.
+        base, digits, pattern = 10, name, _DECIMAL_REFERENCE
+        if name[:1] in ('x', 'X'):
+            base, digits, pattern = 16, name[1:], _HEX_REFERENCE
+        try:
+            number, extra = int(digits, base), ''
+        except ValueError:
+            match = pattern.match(digits)
+            if match is None:
+                self._data.append(digits)
+                return
+            number, extra = int(match.group(1), base), match.group(2)
+        self._data.append(_numeric_reference(number))
+        self._data.append(extra)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self._data.append(character if character is not None else f'&{name}')
+
+    def _special(self, data, kind):
+        self._flush()
+        self._data.append(data)
+        self._flush(kind)
+
+    def handle_comment(self, data):
+        self._special(data, OTHER)
+
+    def handle_decl(self, decl):
+        self._special(decl[len('DOCTYPE '):], OTHER)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self._special(data[len('CDATA['):], CDATA)
+        else:
+            self._special(data, OTHER)
+
+    def handle_pi(self, data):
+        self._special(data, OTHER)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def collect(html):
+    """Run the collector over a whole document and return it."""
+    collector = MetadataCollector()
+    collector.feed(html)
+    collector.close()
+    return collector
+
+
+def extract_fields(page, url):
+    """Pick title/author/date/publisher (plus any JSON-LD extras) from a collected page."""
+    metadata = {
+        'title': '',
+        'author': '',
+        'date': '',
+        'publisher': ''
+    }
+
+    # Try JSON-LD first (most reliable when available)
+    extra = {}
+    structured = structured_data.resolve([script.string for script in page.json_ld]) if page.json_ld else None
+    if structured:
+        logger.debug("Found JSON-LD data")
+        for key in metadata:
+            metadata[key] = structured.pop(key)
+        # Book/journal fields are only reported when the page provides them
+        extra = {key: value for key, value in structured.items() if value}
+
+    props = page.meta_property
+    names = page.meta_name
+
+    # Fallback to meta tags if needed
+    if not metadata['title']:
+        meta_title = props.get('og:title') or names.get('title') or names.get('twitter:title')
+        if meta_title is not None:
+            metadata['title'] = meta_title.get('content', '')
+        # Fallback to title tag
+        elif page.title is not None:
+            metadata['title'] = page.title.string
+        # Last resort: h1
+        elif page.h1 is not None:
+            metadata['title'] = page.h1.get_text()
+
+    if not metadata['author']:
+        meta_author = props.get('article:author') or names.get('author') or props.get('og:article:author')
+        if meta_author is not None:
+            metadata['author'] = meta_author.get('content', '')
+
+    if not metadata['date']:
+        meta_date = props.get('article:published_time') or names.get('date') or page.time
+        if meta_date is not None:
+            date_str = meta_date.get('content', '') or meta_date.get('datetime', '')
+            formatted_date = format_date(date_str, '%Y, %B %d')
+            if formatted_date is not None:
+                metadata['date'] = formatted_date
+            else:
+                logger.info("Error parsing date: %r", date_str)
+
+    if not metadata['publisher']:
+        meta_publisher = props.get('og:site_name') or names.get('publisher')
+        if meta_publisher is not None:
+            metadata['publisher'] = meta_publisher.get('content', '')
+        else:
+            # Use domain name as fallback
+            domain = urlparse(url).netloc
+            metadata['publisher'] = domain.replace('www.', '')
+
+    return metadata, extra
+
+
+def clean_metadata(metadata, extra):
+    """Normalize whitespace, split site suffixes off the title and merge the extras."""
+    for key in ('title', 'author', 'date', 'publisher'):
+        if metadata[key]:
+            # Remove extra whitespace and newlines
+            metadata[key] = ' '.join(metadata[key].split())
+            # Remove common website suffixes from title
+            if key == 'title':
+                parts = metadata[key].split(' - ')
+                metadata[key] = parts[0].strip()
+                # If we don't have a publisher and there's a suffix, use it
+                if not metadata['publisher'] and len(parts) > 1:
+                    metadata['publisher'] = parts[-1].strip()
+
+    metadata.update(extra)
+    return metadata
+
+
+def parse_metadata(html, url):
+    """Extract title/author/date/publisher from an HTML document."""
+    with timer('parse'):
+        page = collect(html)
+    with timer('extract'):
+        return clean_metadata(*extract_fields(page, url))
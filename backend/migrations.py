@@ -0,0 +1,90 @@
+"""
+Schema migrations for databases created before a model change.
+
+db.create_all() only creates missing tables, so changes to existing tables
+(new indexes, backfills) are applied here. Each migration runs once, in
+order, and is recorded in the schema_migration table. Migrations must be
+idempotent because several gunicorn workers may start at the same time.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+from models import db, Bibliography, Citation
+
+logger = logging.getLogger(__name__)
+
+
+def _listing_indexes(conn):
+    # Rows from before created_at had a default would fall outside keyset pages
+    conn.execute(text(
+        'UPDATE bibliography SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP) WHERE created_at IS NULL'))
+    for table in (Bibliography.__table__, Citation.__table__):
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _token_revocation(conn):
+    columns = {column['name'] for column in inspect(conn).get_columns('user')}
+    if 'tokens_revoked_at' not in columns:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN tokens_revoked_at TIMESTAMP'))
+
+
+def _password_hash_length(conn):
+    # SQLite does not enforce VARCHAR lengths
+    if conn.dialect.name != 'sqlite':
+        conn.execute(text('ALTER TABLE "user" ALTER COLUMN password TYPE VARCHAR(255)'))
+
+
+MIGRATIONS = [
+    (1, 'bibliography and citation listing indexes', _listing_indexes),
+    (2, 'user token revocation', _token_revocation),
+    (3, 'longer password hashes', _password_hash_length),
+]
+
+
+def create_tables(engine, metadata=db.metadata, attempts=3):
+    """
+    db.create_all() for workers starting together. create_all() checks for
+    each table before creating it, so a worker can lose the race to another
+    one between the check and CREATE TABLE ("already exists", or "database
+    is locked" on SQLite); trying again skips the tables that now exist.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            metadata.create_all(bind=engine)
+            return
+        except (IntegrityError, OperationalError, ProgrammingError) as e:
+            if attempt == attempts:
+                raise
+            logger.debug("Creating tables raced another process, retrying: %s", e)
+
+
+def upgrade(engine):
+    """Apply every migration that has not run on this database yet."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migration '
+            '(version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP NOT NULL)'))
+    for version, name, migrate in MIGRATIONS:
+        try:
+            with engine.begin() as conn:
+                applied = conn.execute(
+                    text('SELECT 1 FROM schema_migration WHERE version = :version'), {'version': version}).first()
+                if applied:
+                    continue
+                logger.info("Applying migration %d: %s", version, name)
+                migrate(conn)
+                conn.execute(
+                    text('INSERT INTO schema_migration (version, name, applied_at) VALUES (:version, :name, :now)'),
+                    {'version': version, 'name': name, 'now': datetime.utcnow()})
+        except (IntegrityError, OperationalError) as e:
+            # Another worker applied it first; anything else is a real failure
+            with engine.connect() as conn:
+                applied = conn.execute(
+                    text('SELECT 1 FROM schema_migration WHERE version = :version'), {'version': version}).first()
+            if not applied:
+                raise
+            logger.debug("Migration %d already applied by another process: %s", version, e)
@@ -7,11 +7,17 @@ db = SQLAlchemy()
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(60), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Tokens issued before this moment are rejected
+    tokens_revoked_at = db.Column(db.DateTime)
     bibliographies = db.relationship('Bibliography', backref='user', lazy=True)
 
 class Bibliography(db.Model):
+    __table_args__ = (
+        # Keyset pagination of a user's bibliographies in creation order
+        db.Index('ix_bibliography_user_created', 'user_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -20,6 +26,10 @@ class Bibliography(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Citation(db.Model):
+    __table_args__ = (
+        # Listing, counting and exporting a bibliography's citations in order
+        db.Index('ix_citation_bibliography_id', 'bibliography_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     source_type = db.Column(db.String(50), nullable=False)
     style = db.Column(db.String(50), nullable=False)
@@ -28,3 +38,16 @@ class Citation(db.Model):
     bibliography_id = db.Column(db.Integer, db.ForeignKey('bibliography.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SourceMetadata(db.Model):
+    """Metadata extracted from a URL, kept with the HTTP validators needed to revalidate it."""
+    id = db.Column(db.Integer, primary_key=True)
+    # sha256 of the normalized URL; fixed width keeps the unique index small
+    url_hash = db.Column(db.String(64), unique=True, index=True, nullable=False)
+    url = db.Column(db.Text, nullable=False)
+    source_data = db.Column(db.JSON, nullable=False)
+    etag = db.Column(db.String(255))
+    last_modified = db.Column(db.String(64))
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,98 @@
+"""
+Memoized author-name and date normalization.
+
+The same dates and author names recur constantly in batches and
+bibliography exports, and dateutil parsing is one of the slowest steps in
+formatting, so results are kept in bounded LRU caches. Plain ISO-8601 dates
+skip dateutil entirely.
+
+This module is the only place the app and the formatters parse dates or
+reorder author names.
+"""
+import os
+import re
+from datetime import date, datetime
+from functools import lru_cache
+
+from dateutil import parser
+
+from instrumentation import timer
+
+CACHE_SIZE = int(os.environ.get('NORMALIZE_CACHE_SIZE', 4096))
+
+_ISO_DATE = re.compile(
+    r'\d{4}-\d{2}-\d{2}'
+    r'(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?)?'
+    r'(?:Z|[+-]\d{2}:?\d{2})?'
+)
+
+
+def _parse(value):
+    if _ISO_DATE.fullmatch(value):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    # Only cache misses get here, so this times real dateutil work
+    with timer('date_parse'):
+        try:
+            return parser.parse(value)
+        except Exception:
+            return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_cached(value, today):
+    # `today` is part of the key because dateutil fills in missing parts
+    # (e.g. the month and day of "2020") from the current date.
+    return _parse(value)
+
+
+def parse_date(value):
+    """Parse a date string; returns a datetime, or None if it cannot be parsed."""
+    if not isinstance(value, str):
+        return None
+    return _parse_cached(value, date.today())
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _format_date_cached(value, fmt, today):
+    parsed = _parse_cached(value, today)
+    return parsed.strftime(fmt) if parsed is not None else None
+
+
+def format_date(value, fmt):
+    """Parse a date string and strftime it; returns None if it cannot be parsed."""
+    if not isinstance(value, str):
+        return None
+    return _format_date_cached(value, fmt, date.today())
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_author(name, style):
+    """Reorder a "First Middle Last" name for a citation style."""
+    names = name.split()
+    if len(names) < 2:
+        return name
+    if style == 'APA':
+        # APA: Last, F. M.
+        return f"{names[-1]}, {' '.join(n[0] + '.' for n in names[:-1])}"
+    if style == 'MLA':
+        # MLA: Last, First Middle
+        return f"{names[-1]}, {' '.join(names[:-1])}"
+    return name
+
+
+def cache_stats():
+    """Hit/miss counters for the normalization caches."""
+    stats = {}
+    for name, func in (('parse_date', _parse_cached), ('format_date', _format_date_cached),
+                       ('format_author', format_author)):
+        info = func.cache_info()
+        stats[name] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'max_size': info.maxsize,
+        }
+    return stats
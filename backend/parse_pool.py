@@ -0,0 +1,115 @@
+"""
+HTML parsing off the request thread for large pages.
+
+parse_metadata() is pure-Python CPU work that holds the GIL, so large pages
+parsed on request or fetch threads don't use more than one core per worker.
+With PARSE_WORKERS set, documents of at least PARSE_POOL_MIN_SIZE
+characters are parsed on a process pool instead. Smaller ones stay inline,
+where they cost less than the trip to another process.
+
+At most PARSE_QUEUE_DEPTH documents wait for or run on the pool at once.
+When it is full, or a pool call fails or takes longer than PARSE_TIMEOUT,
+the document is parsed inline instead, so extraction never fails because
+the pool is busy.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import instrumentation
+from metadata_parser import parse_metadata
+
+# Processes per gunicorn worker; 0 parses everything inline
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0))
+# Documents shorter than this (in characters) are parsed inline
+PARSE_POOL_MIN_SIZE = int(os.environ.get('PARSE_POOL_MIN_SIZE', 64 * 1024))
+# Documents allowed to wait or run on the pool at once before the rest go inline
+PARSE_QUEUE_DEPTH = int(os.environ.get('PARSE_QUEUE_DEPTH', 8))
+PARSE_TIMEOUT = float(os.environ.get('PARSE_TIMEOUT', 10))
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PARSE_QUEUE_DEPTH)
+
+
+def _init_worker():
+    # Timings are sent back and recorded by the worker that asked for the
+    # parse; the metric counts this process inherited are that worker's too
+    instrumentation.disable()
+
+
+def _parse(html, url):
+    timings = instrumentation.start_request()
+    return parse_metadata(html, url), timings.stages
+
+
+def get_executor():
+    """Return this process's parsing pool, creating it on first use."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS, initializer=_init_worker)
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _discard_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _parse_on_pool(html, url):
+    """Return the pool's metadata for html, or None if it has to be parsed inline."""
+    if not _slots.acquire(blocking=False):
+        return None
+    executor = get_executor()
+    try:
+        future = executor.submit(_parse, html, url)
+    except (BrokenProcessPool, RuntimeError):
+        # A pool process died (or another request just replaced the pool)
+        _slots.release()
+        _discard_executor(executor)
+        return None
+    # The slot stays taken until the pool is done with the document, even if
+    # we stop waiting and parse it inline
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        metadata, stages = future.result(timeout=PARSE_TIMEOUT)
+    except TimeoutError:
+        logger.warning('Parsing %s on the pool timed out; parsing inline', url)
+        return None
+    except BrokenProcessPool:
+        logger.warning('Parsing pool broke while parsing %s; parsing inline', url)
+        _discard_executor(executor)
+        return None
+    for stage, seconds in stages.items():
+        instrumentation.record_stage(stage, seconds)
+    return metadata
+
+
+def parse(html, url):
+    """parse_metadata(html, url), on the pool when the document is large enough and the pool has room."""
+    if PARSE_WORKERS > 0 and len(html) >= PARSE_POOL_MIN_SIZE:
+        metadata = _parse_on_pool(html, url)
+        if metadata is not None:
+            instrumentation.inc('citation_parses_total', where='pool')
+            return metadata
+        instrumentation.inc('citation_parses_total', where='overflow')
+    else:
+        instrumentation.inc('citation_parses_total', where='inline')
+    return parse_metadata(html, url)
+
+
+def warm_up():
+    """Start the pool's processes so the first large page doesn't wait for them."""
+    if PARSE_WORKERS > 0:
+        get_executor().submit(int).result()
@@ -0,0 +1,201 @@
+"""
+Per-host politeness for outbound fetches.
+
+Every host gets a token bucket allowing HOST_RATE requests per second with
+bursts of HOST_BURST. A 429 or 503 with a Retry-After header blocks the
+host until that time has passed. Limits are per worker process, and
+buckets of hosts that have gone quiet are dropped.
+
+SingleFlight lets concurrent requests for the same URL share one fetch
+instead of each sending their own.
+"""
+import copy
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+HOST_RATE = float(os.environ.get('FETCH_HOST_RATE', 2))
+HOST_BURST = float(os.environ.get('FETCH_HOST_BURST', 4))
+# Longest a single fetch waits for its host before giving up
+HOST_MAX_WAIT = float(os.environ.get('FETCH_HOST_MAX_WAIT', 10))
+RETRY_AFTER_MAX = float(os.environ.get('FETCH_RETRY_AFTER_MAX', 300))
+# Retry-After without a usable value still backs the host off this long
+RETRY_AFTER_DEFAULT = 5.0
+
+BACKOFF_STATUSES = (429, 503)
+# How often buckets that have refilled and aren't blocked are dropped
+IDLE_SWEEP_INTERVAL = 60.0
+
+
+class HostThrottled(Exception):
+    """Raised when a host will not accept a request within HOST_MAX_WAIT."""
+
+
+def host_of(url):
+    """Return the lower-cased host of a URL, or '' if it cannot be parsed."""
+    try:
+        return (urlparse(url).hostname or '').lower()
+    except (ValueError, TypeError, AttributeError):
+        return ''
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait for a Retry-After header value (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    return max(when.timestamp() - (now if now is not None else time.time()), 0.0)
+
+
+class _Host:
+    __slots__ = ('tokens', 'updated', 'blocked_until')
+
+    def __init__(self, now, burst):
+        self.tokens = burst
+        self.updated = now
+        self.blocked_until = 0.0
+
+
+class HostThrottle:
+    """Token bucket per host, plus Retry-After blocks."""
+
+    def __init__(self, rate=HOST_RATE, burst=HOST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + IDLE_SWEEP_INTERVAL
+
+    def _sweep(self, now):
+        # A full, unblocked bucket behaves exactly like a new one
+        self._hosts = {
+            host: state for host, state in self._hosts.items()
+            if state.blocked_until > now or state.tokens + (now - state.updated) * self.rate < self.burst
+        }
+        self._next_sweep = now + IDLE_SWEEP_INTERVAL
+
+    def _refill(self, host, now):
+        if now >= self._next_sweep:
+            self._sweep(now)
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host(now, self.burst)
+        elif now > state.updated:
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+            state.updated = now
+        return state
+
+    def _delay(self, state, now):
+        wait = max(state.blocked_until - now, 0.0)
+        if state.tokens < 1 and self.rate > 0:
+            wait = max(wait, (1 - state.tokens) / self.rate)
+        return wait
+
+    def ready_in(self, host):
+        """Seconds until host would accept a request; 0 if it would now."""
+        if not host or self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            return self._delay(self._refill(host, now), now)
+
+    def acquire(self, host, max_wait=HOST_MAX_WAIT):
+        """Take a token for host, sleeping until one is available; raises HostThrottled past max_wait."""
+        if not host or self.rate <= 0:
+            return
+        give_up_at = time.monotonic() + max_wait
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                state = self._refill(host, now)
+                wait = self._delay(state, now)
+                if wait <= 0:
+                    state.tokens -= 1
+                    return
+            if now + wait > give_up_at:
+                raise HostThrottled(f'{host} is rate limited, retry in {wait:.0f}s')
+            time.sleep(wait)
+
+    def back_off(self, host, seconds):
+        """Send nothing to host for the next `seconds`."""
+        if not host:
+            return
+        seconds = min(max(seconds, 0.0), RETRY_AFTER_MAX)
+        now = time.monotonic()
+        with self._lock:
+            state = self._refill(host, now)
+            state.blocked_until = max(state.blocked_until, now + seconds)
+
+    def observe(self, host, response):
+        """Back off host if response asks us to slow down."""
+        if response.status_code not in BACKOFF_STATUSES:
+            return
+        header = response.headers.get('Retry-After')
+        if header is None and response.status_code != 429:
+            return
+        delay = parse_retry_after(header)
+        self.back_off(host, RETRY_AFTER_DEFAULT if delay is None else delay)
+
+    def clear(self):
+        with self._lock:
+            self._hosts.clear()
+
+    def __len__(self):
+        return len(self._hosts)
+
+
+throttle = HostThrottle()
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers wait for and share its result."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return (value, shared); shared is True when another caller did the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Callers may mutate what they get back
+            return copy.deepcopy(call.value), True
+        try:
+            call.value = func()
+            return call.value, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,200 @@
+"""
+Data access for users, bibliographies and citations.
+
+Listings use keyset pagination: a page is "the next `limit` rows after this
+cursor" on an indexed ordering, so page N costs the same as page 1 and rows
+inserted meanwhile never shift pages. Cursors are opaque base64 strings.
+
+configure_engine() sets the SQLite pragmas the gunicorn workers need to share
+instance/citations.db: WAL so readers never block the writer, and a busy
+timeout so a worker waits for a lock instead of failing immediately.
+"""
+import base64
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import and_, event, func, or_, select
+from sqlalchemy.orm import selectinload
+
+from config import SQLITE_BUSY_TIMEOUT
+from models import db, User, Bibliography, Citation
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# Engine setup
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+    cursor.close()
+
+
+def configure_engine(engine):
+    """Apply per-connection settings; call once per engine."""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+    event.listen(engine, 'before_cursor_execute', _count_query)
+
+
+# Query counting
+
+_counters = threading.local()
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counts = getattr(_counters, 'stack', None)
+    if counts:
+        for counter in counts:
+            counter['queries'] += 1
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements executed by this thread inside the block."""
+    counter = {'queries': 0}
+    stack = _counters.__dict__.setdefault('stack', [])
+    stack.append(counter)
+    try:
+        yield counter
+    finally:
+        stack.remove(counter)
+
+
+# Cursors
+
+def encode_cursor(*values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the values packed into a cursor; raises ValueError if it is malformed."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def page_size(limit):
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+# Users
+
+def get_user(user_id):
+    """Return the User for an id; repeated lookups in one request hit the session's identity map."""
+    if user_id is None:
+        return None
+    return db.session.get(User, user_id)
+
+
+def find_user_by_email(email):
+    return db.session.execute(select(User).where(User.email == email)).scalar_one_or_none()
+
+
+# Bibliographies
+
+def get_bibliography(user_id, bibliography_id, with_citations=False):
+    """Return one of the user's bibliographies, or None."""
+    query = select(Bibliography).where(Bibliography.id == bibliography_id, Bibliography.user_id == user_id)
+    if with_citations:
+        query = query.options(selectinload(Bibliography.citations))
+    return db.session.execute(query).scalar_one_or_none()
+
+
+def create_bibliography(user_id, name):
+    bibliography = Bibliography(name=name, user_id=user_id)
+    db.session.add(bibliography)
+    db.session.flush()
+    return bibliography
+
+
+def list_bibliographies(user_id, limit=None, cursor=None, with_citations=False):
+    """
+    Return (bibliographies, next_cursor) for a page of the user's bibliographies
+    in creation order. Each bibliography has a citation_count attribute; with
+    with_citations their citations are loaded in one extra query.
+    """
+    limit = page_size(limit)
+    citation_count = (
+        select(func.count(Citation.id))
+        .where(Citation.bibliography_id == Bibliography.id)
+        .correlate(Bibliography)
+        .scalar_subquery()
+    )
+    query = (
+        select(Bibliography, citation_count)
+        .where(Bibliography.user_id == user_id)
+        .order_by(Bibliography.created_at, Bibliography.id)
+        .limit(limit + 1)
+    )
+    if cursor:
+        try:
+            created_at, last_id = decode_cursor(cursor)
+            created_at, last_id = datetime.fromisoformat(created_at), int(last_id)
+        except (TypeError, ValueError) as e:
+            raise ValueError('Invalid cursor') from e
+        query = query.where(or_(
+            Bibliography.created_at > created_at,
+            and_(Bibliography.created_at == created_at, Bibliography.id > last_id),
+        ))
+    if with_citations:
+        query = query.options(selectinload(Bibliography.citations))
+
+    rows = db.session.execute(query).all()
+    bibliographies = []
+    for bibliography, count in rows[:limit]:
+        bibliography.citation_count = count
+        bibliographies.append(bibliography)
+    next_cursor = None
+    if len(rows) > limit:
+        last = bibliographies[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return bibliographies, next_cursor
+
+
+# Citations
+
+def iter_citation_rows(bibliography_id, window=500):
+    """
+    Yield (source_type, style, citation_text, source_data) for every citation
+    in a bibliography from one query read in windows of `window` rows. Plain
+    column tuples keep the session's identity map empty, so memory stays flat.
+    """
+    query = db.session.query(
+        Citation.source_type, Citation.style, Citation.citation_text, Citation.source_data
+    ).filter(Citation.bibliography_id == bibliography_id).order_by(Citation.id)
+    yield from query.yield_per(window)
+
+
+def list_citations(bibliography_id, limit=None, cursor=None):
+    """Return (citations, next_cursor) for a page of a bibliography's citations in insertion order."""
+    limit = page_size(limit)
+    query = (
+        select(Citation)
+        .where(Citation.bibliography_id == bibliography_id)
+        .order_by(Citation.id)
+        .limit(limit + 1)
+    )
+    if cursor:
+        try:
+            (last_id,) = decode_cursor(cursor)
+            last_id = int(last_id)
+        except (TypeError, ValueError) as e:
+            raise ValueError('Invalid cursor') from e
+        query = query.where(Citation.id > last_id)
+    citations = db.session.execute(query).scalars().all()
+    next_cursor = encode_cursor(citations[limit - 1].id) if len(citations) > limit else None
+    return citations[:limit], next_cursor
@@ -0,0 +1,400 @@
+"""
+DOI and ISBN resolution.
+
+Identifiers are looked up in a local SQLite index first. The index is
+loaded from CSL-JSON or Crossref dumps with `python resolver.py load FILE`.
+Identifiers it doesn't know go to the remote backend registered for their
+kind (Crossref for DOIs, Open Library for ISBNs), asked in bulk. Remote
+answers, including "not found", are written back to the index, so the same
+identifier is not looked up remotely again until it expires.
+
+Backends are plain functions registered with register_backend(kind); tests
+and offline deployments can swap them or set RESOLVER_REMOTE=0.
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+import http_client
+from importers import build_record, person_name
+
+RESOLVER_DB_PATH = os.environ.get('RESOLVER_DB_PATH') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'identifiers.db')
+REMOTE_ENABLED = os.environ.get('RESOLVER_REMOTE', '1') not in ('0', 'false', 'no')
+# How long remote answers are trusted before asking again
+REMOTE_TTL = float(os.environ.get('RESOLVER_REMOTE_TTL', 30 * 24 * 60 * 60))
+NEGATIVE_TTL = float(os.environ.get('RESOLVER_NEGATIVE_TTL', 24 * 60 * 60))
+CROSSREF_MAILTO = os.environ.get('CROSSREF_MAILTO', '')
+MAX_IDENTIFIERS = int(os.environ.get('RESOLVER_MAX_IDENTIFIERS', 500))
+# SQLite allows 999 bound parameters per statement on older builds
+LOOKUP_CHUNK = 500
+CROSSREF_CHUNK = 50
+OPENLIBRARY_CHUNK = 50
+
+LOCAL = 'local'
+REMOTE = 'remote'
+
+NOT_AN_IDENTIFIER = 'Not a DOI or ISBN'
+NOT_FOUND = 'Identifier not found'
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_schema_ready = False
+
+
+# Identifiers
+
+_DOI = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)?(10\.\d{4,9}/\S+)$', re.IGNORECASE)
+_ISBN_CHARS = re.compile(r'[\s-]')
+
+
+def _isbn13(isbn):
+    """Return the ISBN-13 for a 10- or 13-character ISBN, or None if its check digit is wrong."""
+    if len(isbn) == 10:
+        if not isbn[:9].isdigit() or not (isbn[9].isdigit() or isbn[9] == 'X'):
+            return None
+        total = sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(isbn))
+        if total % 11:
+            return None
+        isbn = '978' + isbn[:9]
+        return isbn + str((10 - sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(isbn)) % 10) % 10)
+    if len(isbn) == 13 and isbn.isdigit():
+        if sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(isbn)) % 10:
+            return None
+        return isbn
+    return None
+
+
+def parse_identifier(value):
+    """Return ('doi', doi) or ('isbn', isbn13) for a DOI or ISBN in any common spelling, or None."""
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    match = _DOI.match(value)
+    if match:
+        return 'doi', match.group(1).lower()
+    isbn = _ISBN_CHARS.sub('', value).upper()
+    if isbn.startswith('ISBN:'):
+        isbn = isbn[5:]
+    elif isbn.startswith('ISBN'):
+        isbn = isbn[4:]
+    isbn = _isbn13(isbn)
+    return ('isbn', isbn) if isbn else None
+
+
+def _key(kind, value):
+    return f'{kind}:{value}'
+
+
+# CSL-JSON / Crossref items
+
+JOURNAL_TYPES = {'article-journal', 'journal-article', 'article', 'proceedings-article', 'paper-conference'}
+BOOK_TYPES = {'book', 'monograph', 'edited-book', 'reference-book', 'chapter', 'book-chapter'}
+
+
+def _first(value):
+    if isinstance(value, list):
+        value = value[0] if value else ''
+    return str(value) if value is not None else ''
+
+
+def _item_year(item):
+    for key in ('issued', 'published-print', 'published-online', 'published', 'created'):
+        parts = (item.get(key) or {}).get('date-parts') or [[]]
+        if parts[0] and parts[0][0]:
+            return str(parts[0][0])
+    return ''
+
+
+def _item_authors(item):
+    authors = []
+    for author in item.get('author') or []:
+        if not isinstance(author, dict):
+            continue
+        name = ' '.join(part for part in (author.get('given'), author.get('family')) if part)
+        name = name or author.get('literal') or author.get('name') or ''
+        if name:
+            authors.append(person_name(name))
+    return authors
+
+
+def record_from_item(item):
+    """Build a formatter record from a CSL-JSON or Crossref work."""
+    fields = {
+        'authors': _item_authors(item),
+        'title': _first(item.get('title')),
+        'journal': _first(item.get('container-title')),
+        'volume': _first(item.get('volume')),
+        'issue': _first(item.get('issue')),
+        'pages': _first(item.get('page')),
+        'year': _item_year(item),
+        'publisher': _first(item.get('publisher')),
+        'doi': _first(item.get('DOI')),
+    }
+    item_type = item.get('type')
+    if item_type in JOURNAL_TYPES:
+        source_type = 'journal'
+    elif item_type in BOOK_TYPES:
+        source_type = 'book'
+    else:
+        source_type = 'journal' if fields['journal'] else 'book'
+    return build_record(source_type, fields)
+
+
+def item_keys(item):
+    """Index keys for every DOI and ISBN a work carries."""
+    keys = []
+    parsed = parse_identifier(_first(item.get('DOI')))
+    if parsed:
+        keys.append(_key(*parsed))
+    isbns = item.get('ISBN') or []
+    for isbn in isbns if isinstance(isbns, list) else [isbns]:
+        parsed = parse_identifier(str(isbn))
+        if parsed and parsed[0] == 'isbn':
+            keys.append(_key(*parsed))
+    return keys
+
+
+# Local index
+
+def _conn():
+    conn, pid = getattr(_local, 'conn', (None, None))
+    if conn is None or pid != os.getpid():
+        os.makedirs(os.path.dirname(RESOLVER_DB_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(RESOLVER_DB_PATH, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = (conn, os.getpid())
+        _ensure_schema(conn)
+    return conn
+
+
+def _ensure_schema(conn):
+    global _schema_ready
+    if _schema_ready:
+        return
+    # The primary key is the DOI/ISBN index; record is NULL for "not found"
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS identifier ('
+        'key TEXT PRIMARY KEY, record TEXT, origin TEXT NOT NULL, fetched_at REAL NOT NULL)'
+    )
+    conn.commit()
+    _schema_ready = True
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _lookup_local(keys):
+    """Return {key: record or None} for keys with a usable index entry."""
+    found = {}
+    now = time.time()
+    conn = _conn()
+    for chunk in _chunks(keys, LOOKUP_CHUNK):
+        rows = conn.execute(
+            f'SELECT key, record, origin, fetched_at FROM identifier WHERE key IN ({",".join("?" * len(chunk))})',
+            chunk,
+        )
+        for key, record, origin, fetched_at in rows:
+            if origin == REMOTE:
+                ttl = REMOTE_TTL if record is not None else NEGATIVE_TTL
+                if fetched_at + ttl <= now:
+                    continue
+            found[key] = json.loads(record) if record is not None else None
+    return found
+
+
+def _store(entries, origin):
+    """Write (key, record or None) pairs to the index."""
+    now = time.time()
+    conn = _conn()
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO identifier (key, record, origin, fetched_at) VALUES (?, ?, ?, ?)',
+            [(key, json.dumps(record) if record is not None else None, origin, now) for key, record in entries],
+        )
+
+
+def _open_dump(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def _dump_items(path):
+    """Yield works from a CSL-JSON array or Crossref API response (.json) or JSON lines (.jsonl/.ndjson), optionally gzipped."""
+    name = path[:-3] if path.endswith('.gz') else path
+    with _open_dump(path) as f:
+        if not name.endswith(('.jsonl', '.ndjson')):
+            data = json.load(f)
+            if isinstance(data, dict):
+                message = data.get('message', data)
+                data = message.get('items', [message]) if isinstance(message, dict) else []
+            yield from (item for item in data if isinstance(item, dict))
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict):
+                yield item['message'] if isinstance(item.get('message'), dict) else item
+
+
+def load_dump(path, batch_size=1000):
+    """Add every work in a dump to the local index; returns how many keys were written."""
+    written = 0
+    batch = []
+    for item in _dump_items(path):
+        keys = item_keys(item)
+        if not keys:
+            continue
+        record = record_from_item(item)
+        batch.extend((key, record) for key in keys)
+        if len(batch) >= batch_size:
+            _store(batch, LOCAL)
+            written += len(batch)
+            batch = []
+    if batch:
+        _store(batch, LOCAL)
+        written += len(batch)
+    return written
+
+
+# Remote backends
+
+REMOTE_BACKENDS = {}
+
+
+def register_backend(kind):
+    """Decorator registering lookup(values) -> {value: record} as the remote backend for a kind."""
+    def decorator(lookup):
+        REMOTE_BACKENDS[kind] = lookup
+        return lookup
+    return decorator
+
+
+def _get_json(url):
+    response = http_client.get(url, headers={'Accept': 'application/json'})
+    response.raise_for_status()
+    return response.json()
+
+
+@register_backend('doi')
+def crossref_lookup(dois):
+    """Look DOIs up on the Crossref REST API, many per request."""
+    found = {}
+    for chunk in _chunks(dois, CROSSREF_CHUNK):
+        filters = ','.join(f'doi:{doi}' for doi in chunk)
+        url = f'https://api.crossref.org/works?filter={quote(filters, safe=":,/")}&rows={len(chunk)}'
+        if CROSSREF_MAILTO:
+            url += f'&mailto={quote(CROSSREF_MAILTO)}'
+        for item in _get_json(url).get('message', {}).get('items', []):
+            doi = (item.get('DOI') or '').lower()
+            if doi:
+                found[doi] = record_from_item(item)
+    return found
+
+
+@register_backend('isbn')
+def openlibrary_lookup(isbns):
+    """Look ISBNs up on the Open Library books API, many per request."""
+    found = {}
+    for chunk in _chunks(isbns, OPENLIBRARY_CHUNK):
+        keys = ','.join(f'ISBN:{isbn}' for isbn in chunk)
+        data = _get_json(f'https://openlibrary.org/api/books?bibkeys={keys}&format=json&jscmd=data')
+        for isbn in chunk:
+            book = data.get(f'ISBN:{isbn}')
+            if not book:
+                continue
+            year = re.search(r'\b(\d{4})\b', book.get('publish_date') or '')
+            found[isbn] = build_record('book', {
+                'authors': [a.get('name', '') for a in book.get('authors') or []],
+                'title': book.get('title', ''),
+                'year': year.group(1) if year else '',
+                'publisher': _first([p.get('name', '') for p in book.get('publishers') or []]),
+            })
+    return found
+
+
+def _lookup_remote(keys):
+    """Return {key: record or None} from the remote backends; keys whose backend failed are left out."""
+    by_kind = {}
+    for key in keys:
+        kind, _, value = key.partition(':')
+        by_kind.setdefault(kind, []).append(value)
+    found = {}
+    for kind, values in by_kind.items():
+        lookup = REMOTE_BACKENDS.get(kind)
+        if lookup is None:
+            continue
+        try:
+            records = lookup(values)
+        except Exception as e:
+            logger.warning("Remote %s lookup failed for %d identifiers: %s", kind, len(values), e)
+            continue
+        for value in values:
+            found[_key(kind, value)] = records.get(value)
+    return found
+
+
+# Resolution
+
+def resolve_many(identifiers, remote=None):
+    """
+    Resolve DOIs/ISBNs to formatter records. Returns a list of (record, error)
+    in input order; error is None when a record was found.
+    """
+    remote = REMOTE_ENABLED if remote is None else remote
+    keys = []
+    for identifier in identifiers:
+        parsed = parse_identifier(identifier)
+        keys.append(_key(*parsed) if parsed else None)
+
+    unique = list(dict.fromkeys(key for key in keys if key))
+    found = _lookup_local(unique) if unique else {}
+    missing = [key for key in unique if key not in found]
+    if missing and remote:
+        fetched = _lookup_remote(missing)
+        if fetched:
+            _store(fetched.items(), REMOTE)
+        found.update(fetched)
+
+    results = []
+    for key in keys:
+        if key is None:
+            results.append((None, NOT_AN_IDENTIFIER))
+        elif found.get(key) is None:
+            results.append((None, NOT_FOUND))
+        else:
+            results.append((found[key], None))
+    return results
+
+
+def resolve(identifier, remote=None):
+    return resolve_many([identifier], remote)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the local DOI/ISBN index.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('load', help='add CSL-JSON or Crossref dumps (.json, .jsonl, optionally .gz)')
+    load.add_argument('paths', nargs='+')
+    args = parser.parse_args(argv)
+
+    for path in args.paths:
+        print(f'{path}: {load_dump(path)} identifiers indexed')
+
+
+if __name__ == '__main__':
+    main()
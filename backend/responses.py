@@ -0,0 +1,211 @@
+"""
+Response encoding: faster JSON, compression and columnar batch results.
+
+init_app() installs two things:
+
+* A JSON provider that serializes responses with orjson when it is
+  installed, keeping Flask's sorted keys and HTTP dates. Values orjson
+  can't handle fall back to the standard encoder.
+* An after_request hook that compresses responses of at least
+  COMPRESS_MIN_SIZE bytes with the best of zstd, br and gzip the client
+  accepts. zstd and br are used only when the zstandard and brotli packages
+  are installed. Streamed responses such as exports are compressed chunk by
+  chunk.
+
+batch_response() returns a batch result list as usual, or with ?format=columnar
+as one array per key, so keys like "success" aren't repeated for every item.
+"""
+import os
+import zlib
+
+from flask import jsonify, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    # Flask < 2.2 has no JSON provider interface; keep the stdlib encoder
+    DefaultJSONProvider = None
+
+COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION', '1') not in ('0', 'false', 'no')
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+# Server preference when the client accepts several equally
+COMPRESS_ALGORITHMS = os.environ.get('COMPRESS_ALGORITHMS', 'zstd,br,gzip').split(',')
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+ZSTD_LEVEL = int(os.environ.get('ZSTD_LEVEL', 3))
+JSON_SERIALIZER = os.environ.get('JSON_SERIALIZER', 'orjson')
+
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/javascript', 'application/xml',
+    'application/x-bibtex', 'application/x-research-info-systems',
+)
+
+
+# Compression
+
+ENCODINGS = {}
+
+
+def register_encoding(name):
+    """Decorator registering factory() -> compressor with compress(bytes) and flush() for a content coding."""
+    def decorator(factory):
+        ENCODINGS[name] = factory
+        return factory
+    return decorator
+
+
+@register_encoding('gzip')
+def _gzip():
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+if brotli is not None:
+    class _BrotliCompressor:
+        def __init__(self):
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+        def compress(self, data):
+            return self._compressor.process(data)
+
+        def flush(self):
+            return self._compressor.finish()
+
+    register_encoding('br')(_BrotliCompressor)
+
+
+if zstandard is not None:
+    @register_encoding('zstd')
+    def _zstd():
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+
+def choose_encoding(accept_encodings):
+    """Return the best content coding both sides support, or None."""
+    available = [name for name in COMPRESS_ALGORITHMS if name in ENCODINGS]
+    return accept_encodings.best_match(available) if available else None
+
+
+# Compressing these would hold events back until the compressor flushes
+STREAMING_TYPES = ('text/event-stream', 'application/x-ndjson')
+
+
+def _compressible(response):
+    mimetype = response.mimetype or ''
+    if mimetype in STREAMING_TYPES:
+        return False
+    return mimetype.startswith('text/') or mimetype.endswith('+json') or mimetype in COMPRESSIBLE_TYPES
+
+
+def _compress_stream(chunks, compressor):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress_response(response):
+    """after_request hook compressing the response body if the client accepts it."""
+    # Errors and redirects are small; 204/206 bodies must not be re-encoded
+    if (not 200 <= response.status_code < 300 or response.status_code in (204, 206)
+            or 'Content-Encoding' in response.headers or not _compressible(response)):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough:
+        return response
+    streamed = response.is_streamed
+    if not streamed and (response.content_length or 0) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    compressor = ENCODINGS[encoding]()
+    if streamed:
+        response.response = _compress_stream(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compressor.compress(response.get_data()) + compressor.flush())
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body differs from the one a strong ETag was made for
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# JSON
+
+if DefaultJSONProvider is not None:
+    class FastJSONProvider(DefaultJSONProvider):
+        """
+        Flask's default provider with compact responses serialized by orjson.
+        Output matches except that non-ASCII text is sent as UTF-8 rather
+        than \\u escapes.
+        """
+
+        # Dates and dataclasses go through default() like the stdlib encoder,
+        # so they serialize exactly as before
+        option = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                  | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+
+        def _orjson(self, obj):
+            try:
+                return orjson.dumps(obj, default=self.default, option=self.option)
+            except TypeError:
+                # Integers over 64 bits, non-str keys orjson can't sort, ...
+                return None
+
+        def response(self, *args, **kwargs):
+            if (self.compact is None and self._app.debug) or self.compact is False:
+                return super().response(*args, **kwargs)
+            data = self._orjson(self._prepare_response_obj(args, kwargs))
+            if data is None:
+                return super().response(*args, **kwargs)
+            return self._app.response_class(data + b'\n', mimetype=self.mimetype)
+
+
+def init_app(app):
+    if orjson is not None and DefaultJSONProvider is not None and JSON_SERIALIZER == 'orjson':
+        app.json = FastJSONProvider(app)
+    if COMPRESSION_ENABLED:
+        app.after_request(compress_response)
+
+
+# Batch results
+
+def columnar(results):
+    """{"count": n, key: [value per item, None where absent], ...} for a list of result dicts."""
+    keys = {}
+    for result in results:
+        keys.update(dict.fromkeys(result))
+    table = {'count': len(results)}
+    for key in keys:
+        table[key] = [result.get(key) for result in results]
+    return table
+
+
+def wants_columnar():
+    return request.args.get('format') == 'columnar'
+
+
+def batch_response(results):
+    """JSON response for a batch endpoint's result list, columnar if the request asked for it."""
+    return jsonify(columnar(results) if wants_columnar() else results)
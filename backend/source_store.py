@@ -0,0 +1,127 @@
+"""
+Persistent store of extracted URL metadata.
+
+Extracted metadata is saved in the SourceMetadata table together with the
+response's ETag/Last-Modified validators. Within SOURCE_METADATA_MAX_AGE a
+stored record is served without touching the network. After that it is
+revalidated with If-None-Match/If-Modified-Since, and a 304 reuses the stored
+metadata without downloading or parsing the page again.
+
+Extraction runs on fetch and job worker threads, so every operation uses its
+own app context and returns plain dicts rather than ORM objects.
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from urls import cache_key
+from models import db, SourceMetadata
+
+STORE_ENABLED = os.environ.get('SOURCE_METADATA_STORE', '1') not in ('0', 'false', 'no')
+# Serve stored metadata without revalidating for this long
+MAX_AGE = float(os.environ.get('SOURCE_METADATA_MAX_AGE', 7 * 24 * 60 * 60))
+# Set to 0 to refetch stale records unconditionally instead of revalidating
+REVALIDATE = os.environ.get('SOURCE_METADATA_REVALIDATE', '1') not in ('0', 'false', 'no')
+
+logger = logging.getLogger(__name__)
+
+_app = None
+
+
+def init_app(app):
+    """Bind the store to the Flask app whose database it uses."""
+    global _app
+    _app = app
+
+
+def url_hash(url):
+    return hashlib.sha256(cache_key(url).encode('utf-8')).hexdigest()
+
+
+def _as_dict(record):
+    return {
+        'metadata': record.source_data,
+        'etag': record.etag,
+        'last_modified': record.last_modified,
+        'fetched_at': record.fetched_at,
+    }
+
+
+def lookup(url):
+    """Return the stored record for url as a dict, or None."""
+    if not STORE_ENABLED or _app is None:
+        return None
+    try:
+        with _app.app_context():
+            record = SourceMetadata.query.filter_by(url_hash=url_hash(url)).first()
+            return _as_dict(record) if record else None
+    except (SQLAlchemyError, ValueError) as e:
+        logger.warning("Error reading source metadata for %s: %s", url, e)
+        return None
+
+
+def is_fresh(stored):
+    return datetime.utcnow() - stored['fetched_at'] < timedelta(seconds=MAX_AGE)
+
+
+def conditional_headers(stored):
+    """If-None-Match/If-Modified-Since headers for revalidating a stored record."""
+    headers = {}
+    if not stored or not REVALIDATE:
+        return headers
+    if stored['etag']:
+        headers['If-None-Match'] = stored['etag']
+    if stored['last_modified']:
+        headers['If-Modified-Since'] = stored['last_modified']
+    return headers
+
+
+def _validators(response):
+    return response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+
+def save(url, metadata, response):
+    """Store freshly extracted metadata and the response's validators."""
+    if not STORE_ENABLED or _app is None:
+        return
+    etag, last_modified = _validators(response)
+    try:
+        with _app.app_context():
+            key = url_hash(url)
+            record = SourceMetadata.query.filter_by(url_hash=key).first()
+            if record is None:
+                record = SourceMetadata(url_hash=key, url=url)
+                db.session.add(record)
+            record.source_data = metadata
+            record.etag = etag
+            record.last_modified = last_modified
+            record.fetched_at = datetime.utcnow()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another worker stored the same URL first
+                db.session.rollback()
+    except (SQLAlchemyError, ValueError) as e:
+        logger.warning("Error storing source metadata for %s: %s", url, e)
+
+
+def mark_revalidated(url, response):
+    """Record that a 304 confirmed the stored metadata is still current."""
+    if not STORE_ENABLED or _app is None:
+        return
+    etag, last_modified = _validators(response)
+    try:
+        with _app.app_context():
+            record = SourceMetadata.query.filter_by(url_hash=url_hash(url)).first()
+            if record is None:
+                return
+            # A 304 may carry updated validators; keep the old ones otherwise
+            record.etag = etag or record.etag
+            record.last_modified = last_modified or record.last_modified
+            record.fetched_at = datetime.utcnow()
+            db.session.commit()
+    except (SQLAlchemyError, ValueError) as e:
+        logger.warning("Error updating source metadata for %s: %s", url, e)
@@ -0,0 +1,268 @@
+"""
+Schema.org JSON-LD resolution for metadata extraction.
+
+All application/ld+json blocks on a page are parsed once, @graph containers
+are flattened and @id references resolved, and the node that best describes
+the cited work (ScholarlyArticle > Book > Article > WebPage) is picked. Work
+is bounded by byte, block, node and depth budgets so pages with enormous JSON-LD
+payloads cannot stall a worker.
+"""
+import json
+import logging
+import os
+import re
+
+MAX_JSON_LD_BYTES = int(os.environ.get('JSON_LD_MAX_BYTES', 512 * 1024))
+MAX_JSON_LD_BLOCKS = int(os.environ.get('JSON_LD_MAX_BLOCKS', 20))
+MAX_JSON_LD_NODES = int(os.environ.get('JSON_LD_MAX_NODES', 2000))
+# Nesting deeper than this is ignored when walking the graph
+MAX_JSON_LD_DEPTH = int(os.environ.get('JSON_LD_MAX_DEPTH', 32))
+
+# How strongly a schema.org type suggests "this node is the cited work".
+TYPE_RANK = {
+    'ScholarlyArticle': 5,
+    'MedicalScholarlyArticle': 5,
+    'Book': 4,
+    'Chapter': 4,
+    'Article': 3,
+    'NewsArticle': 3,
+    'BlogPosting': 3,
+    'TechArticle': 3,
+    'Report': 3,
+    'ReportageNewsArticle': 3,
+    'AnalysisNewsArticle': 3,
+    'OpinionNewsArticle': 3,
+    'CreativeWork': 2,
+    'WebPage': 1,
+    'AboutPage': 1,
+    'ItemPage': 1,
+    'CollectionPage': 1,
+}
+
+SOURCE_TYPES = {
+    'ScholarlyArticle': 'journal',
+    'MedicalScholarlyArticle': 'journal',
+    'Book': 'book',
+    'Chapter': 'book',
+}
+
+logger = logging.getLogger(__name__)
+
+_STRUCTURAL_KEYS = frozenset(['@id', '@context', '@graph'])
+_DOI = re.compile(r'\b(10\.\d{4,9}/\S+)', re.IGNORECASE)
+_YEAR = re.compile(r'\b(\d{4})\b')
+
+
+def load_blocks(texts):
+    """Parse JSON-LD script bodies within the configured byte and block budgets."""
+    documents = []
+    budget = MAX_JSON_LD_BYTES
+    for text in texts[:MAX_JSON_LD_BLOCKS]:
+        if not text:
+            continue
+        budget -= len(text)
+        if budget < 0:
+            logger.info("JSON-LD budget exceeded, ignoring remaining blocks")
+            break
+        try:
+            documents.append(json.loads(text))
+        except (ValueError, RecursionError) as e:
+            # RecursionError: nested deeper than the json module will follow
+            logger.info("Error parsing JSON-LD: %s", e)
+    return documents
+
+
+def flatten(documents):
+    """Return (nodes, index): every dict node in document order, and nodes by @id."""
+    nodes = []
+    index = {}
+    stack = [(document, 0) for document in reversed(documents)]
+    while stack and len(nodes) < MAX_JSON_LD_NODES:
+        item, depth = stack.pop()
+        if depth > MAX_JSON_LD_DEPTH:
+            continue
+        if isinstance(item, list):
+            stack.extend((child, depth + 1) for child in reversed(item))
+            continue
+        if not isinstance(item, dict):
+            continue
+        if any(key not in _STRUCTURAL_KEYS for key in item):
+            nodes.append(item)
+            node_id = item.get('@id')
+            if isinstance(node_id, str):
+                # Bare {"@id": ...} references are never indexed; the first full node wins.
+                index.setdefault(node_id, item)
+        children = [value for value in item.values() if isinstance(value, (dict, list))]
+        stack.extend((child, depth + 1) for child in reversed(children))
+    return nodes, index
+
+
+def _deref(value, index):
+    if isinstance(value, dict) and isinstance(value.get('@id'), str):
+        return index.get(value['@id'], value)
+    return value
+
+
+def _types(node):
+    value = node.get('@type', ())
+    if isinstance(value, str):
+        return (value.rsplit('/', 1)[-1],)
+    if isinstance(value, list):
+        return tuple(v.rsplit('/', 1)[-1] for v in value if isinstance(v, str))
+    return ()
+
+
+def _rank(node):
+    return max((TYPE_RANK.get(t, 0) for t in _types(node)), default=0)
+
+
+def _text(value, index=None, depth=0):
+    """Coerce a JSON-LD value to a single whitespace-normalized string."""
+    if isinstance(value, list):
+        value = value[0] if value else ''
+    if index is not None:
+        value = _deref(value, index)
+    if isinstance(value, dict):
+        value = value.get('@value') or value.get('name') or ''
+        if isinstance(value, (list, dict)):
+            return _text(value, depth=depth + 1) if depth < MAX_JSON_LD_DEPTH else ''
+    if value is None:
+        return ''
+    return ' '.join(str(value).split())
+
+
+def _person_name(value, index):
+    value = _deref(value, index)
+    if isinstance(value, dict):
+        name = _text(value.get('name'))
+        if not name:
+            name = ' '.join(filter(None, [_text(value.get('givenName')), _text(value.get('familyName'))]))
+        return name
+    return _text(value)
+
+
+def _authors(node, index):
+    value = node.get('author') or node.get('creator')
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    names = []
+    for author in value[:50]:
+        name = _person_name(author, index)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _doi(node):
+    candidates = []
+    for key in ('doi', 'identifier', 'sameAs', '@id', 'url'):
+        value = node.get(key)
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, dict):
+                if str(item.get('propertyID', '')).lower() == 'doi':
+                    candidates.insert(0, _text(item.get('value')))
+                continue
+            if isinstance(item, str):
+                candidates.append(item)
+    for candidate in candidates:
+        match = _DOI.search(candidate)
+        if match:
+            return match.group(1).rstrip('.,;')
+    return ''
+
+
+def _isbn(node, index):
+    value = node.get('isbn')
+    if not value:
+        for example in node.get('workExample') or []:
+            example = _deref(example, index)
+            if isinstance(example, dict) and example.get('isbn'):
+                value = example['isbn']
+                break
+    return _text(value)
+
+
+def _container_fields(node, index):
+    """Walk isPartOf (issue -> volume -> periodical) for journal/volume/issue."""
+    fields = {
+        'volume': _text(node.get('volumeNumber')),
+        'issue': _text(node.get('issueNumber')),
+        'journal': '',
+    }
+    parent = node.get('isPartOf')
+    for _ in range(4):
+        if isinstance(parent, list):
+            parent = parent[0] if parent else None
+        parent = _deref(parent, index)
+        if not isinstance(parent, dict):
+            break
+        types = _types(parent)
+        if 'PublicationIssue' in types and not fields['issue']:
+            fields['issue'] = _text(parent.get('issueNumber'))
+        if 'PublicationVolume' in types and not fields['volume']:
+            fields['volume'] = _text(parent.get('volumeNumber'))
+        if 'Periodical' in types or 'Newspaper' in types or 'Journal' in types:
+            fields['journal'] = _text(parent.get('name'))
+            break
+        parent = parent.get('isPartOf')
+    return fields
+
+
+def _pages(node):
+    pages = _text(node.get('pagination'))
+    if not pages:
+        start, end = _text(node.get('pageStart')), _text(node.get('pageEnd'))
+        pages = f'{start}-{end}' if start and end else start
+    return pages
+
+
+def best_node(nodes):
+    """Pick the node most likely to describe the cited work."""
+    best, best_rank = None, 0
+    for node in nodes:
+        rank = _rank(node)
+        if rank > best_rank:
+            best, best_rank = node, rank
+    if best is None and nodes:
+        # No recognised type: behave like the old first-object lookup.
+        best = nodes[0]
+    return best
+
+
+def resolve(texts):
+    """
+    Resolve the JSON-LD blocks of a page into citation fields.
+
+    Returns None when the page has no usable JSON-LD. Otherwise returns a
+    dict with title/author/date/publisher plus any of authors, year, doi,
+    isbn, journal, volume, issue, pages and suggestedSourceType that could be
+    found.
+    """
+    nodes, index = flatten(load_blocks(texts))
+    node = best_node(nodes)
+    if node is None:
+        return None
+
+    authors = _authors(node, index)
+    date = _text(node.get('datePublished') or node.get('dateCreated'))
+    fields = {
+        'title': _text(node.get('headline')) or _text(node.get('name')),
+        'author': authors[0] if authors else '',
+        'date': date,
+        'publisher': _text(node.get('publisher'), index),
+        'authors': authors,
+        'doi': _doi(node),
+        'isbn': _isbn(node, index),
+        'pages': _pages(node),
+    }
+    fields.update(_container_fields(node, index))
+    year = _YEAR.search(date)
+    fields['year'] = year.group(1) if year else ''
+
+    for schema_type in _types(node):
+        if schema_type in SOURCE_TYPES:
+            fields['suggestedSourceType'] = SOURCE_TYPES[schema_type]
+            break
+    return fields
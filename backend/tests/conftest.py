@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# Keep every database the modules open out of instance/
+_scratch = tempfile.mkdtemp(prefix='citation-tests-')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_scratch, 'citations.db'))
+os.environ.setdefault('METRICS_DB_PATH', os.path.join(_scratch, 'metrics.db'))
+os.environ.setdefault('JOBS_DB_PATH', os.path.join(_scratch, 'jobs.db'))
+os.environ.setdefault('RESOLVER_DB_PATH', os.path.join(_scratch, 'identifiers.db'))
+os.environ.setdefault('METADATA_CACHE_BACKEND', 'none')
+os.environ.setdefault('SOURCE_METADATA_STORE', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
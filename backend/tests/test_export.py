@@ -0,0 +1,57 @@
+"""Bibliography export in a citation style other than the stored one."""
+import time
+
+import pytest
+
+from app import app
+from auth import generate_token
+from models import db, User, Bibliography, Citation
+
+
+@pytest.fixture(scope='module')
+def bibliography():
+    with app.app_context():
+        user = User(email=f'export-{time.time_ns()}@example.com', password='x')
+        db.session.add(user)
+        db.session.commit()
+        bibliography = Bibliography(name='Export', user_id=user.id)
+        db.session.add(bibliography)
+        db.session.commit()
+        db.session.add_all([
+            Citation(source_type='book', style='APA', citation_text='Stored book citation',
+                     source_data={'authors': ['Jane Smith'], 'title': 'A Book', 'year': '2020',
+                                  'publisher': 'Press'},
+                     bibliography_id=bibliography.id),
+            # Not enough data to render a website citation in any style
+            Citation(source_type='website', style='APA', citation_text='Stored website citation',
+                     source_data={}, bibliography_id=bibliography.id),
+        ])
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {generate_token(user.id)}'}
+        return bibliography.id, headers
+
+
+def export(bibliography, style):
+    bibliography_id, headers = bibliography
+    return app.test_client().get(f'/api/bibliography/{bibliography_id}/export?format=text&style={style}',
+                                 headers=headers)
+
+
+def test_unknown_style_is_rejected(bibliography):
+    response = export(bibliography, 'Chicago')
+    assert response.status_code == 400
+    assert 'APA, MLA' in response.get_json()['error']
+
+
+def test_other_style_is_re_rendered(bibliography):
+    response = export(bibliography, 'MLA')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert 'A Book' in text
+    assert 'Stored book citation' not in text
+
+
+def test_stored_citation_kept_when_re_rendering_fails(bibliography):
+    text = export(bibliography, 'MLA').get_data(as_text=True)
+    assert 'Stored website citation' in text
+    assert 'Error' not in text
@@ -0,0 +1,24 @@
+import formatters
+from formatters import format_book_citation, format_many
+
+BOOK = {
+    'sourceType': 'book',
+    'authors': ['Ana Okafor'],
+    'title': 'Rivers in Motion',
+    'year': '2019',
+    'publisher': 'Example University Press',
+}
+
+
+def test_unknown_styles_do_not_grow_the_cache():
+    mla = format_book_citation(BOOK, 'MLA')
+    before = len(formatters._compiled)
+    for n in range(2000):
+        assert format_book_citation(BOOK, f'style-{n}') == mla
+        format_many([BOOK], f'other-{n}')
+    assert len(formatters._compiled) == before
+
+
+def test_supported_styles_are_cached():
+    format_book_citation(BOOK, 'APA')
+    assert ('APA', 'book') in formatters._compiled
@@ -0,0 +1,45 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+import hashing
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    monkeypatch.setattr(hashing, 'HASH_WORKERS', 1)
+    monkeypatch.setattr(hashing, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    yield
+    if hashing._executor is not None:
+        hashing._discard_executor(hashing._executor)
+
+
+def test_killed_pool_worker_is_replaced():
+    stored = hashing.hash_password('secret')
+    executor = hashing.get_executor()
+    for pid in list(executor._processes):
+        os.kill(pid, signal.SIGKILL)
+    give_up_at = time.monotonic() + 10
+    while not executor._broken and time.monotonic() < give_up_at:
+        time.sleep(0.05)
+
+    with pytest.raises(hashing.HashingBusy):
+        hashing.verify_password(stored, 'secret')
+    assert hashing.get_executor() is not executor
+    assert hashing.verify_password(stored, 'secret')
+
+
+def test_slot_held_until_timed_out_hash_finishes(monkeypatch):
+    monkeypatch.setattr(hashing, '_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(hashing, 'HASH_TIMEOUT', 0.05)
+    with pytest.raises(hashing.HashingBusy, match='timed out'):
+        hashing._submit(time.sleep, 0.5)
+    with pytest.raises(hashing.HashingBusy, match='Too many'):
+        hashing._submit(time.sleep, 0)
+
+    time.sleep(0.7)
+    monkeypatch.setattr(hashing, 'HASH_TIMEOUT', 5)
+    assert hashing._submit(time.sleep, 0) is None
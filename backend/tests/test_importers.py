@@ -0,0 +1,133 @@
+import io
+import time
+
+import pytest
+
+from app import app
+from auth import generate_token
+from importers import InvalidRecord, parse_bibtex, parse_csv, parse_ris
+from models import db, User
+
+
+def lines(text):
+    return io.StringIO(text.lstrip('\n'), newline='')
+
+
+def test_bibtex_string_macros_and_concatenation():
+    records = list(parse_bibtex(lines('''
+@string{pub = "Oxford University Press"}
+@STRING{ed = {Second}}
+@book{key,
+  author = {Smith, Jane and John Doe},
+  title = ed # " edition of " # {The {B}ook},
+  publisher = pub,
+  year = 2020,
+}
+''')))
+    assert records == [{
+        'sourceType': 'book',
+        'authors': ['Jane Smith', 'John Doe'],
+        'title': 'Second edition of The Book',
+        'year': '2020',
+        'publisher': 'Oxford University Press',
+    }]
+
+
+def test_bibtex_unterminated_entry_does_not_swallow_the_rest():
+    records = list(parse_bibtex(lines('''
+@book{first, title = {First}, year = 2001}
+@book{broken, title = {Never closed, year = 2002
+
+@article{third, title = {Third}, journal = {Journal}, year = 2003}
+@book{last, title = {Last}
+''')))
+    assert [type(record) for record in records] == [dict, InvalidRecord, dict, InvalidRecord]
+    assert records[0]['title'] == 'First'
+    assert (records[1].line, records[1].error) == (2, 'Unterminated entry')
+    assert records[2]['sourceType'] == 'journal'
+    assert records[2]['title'] == 'Third'
+    assert (records[3].line, records[3].error) == (5, 'Unterminated entry')
+
+
+def test_bibtex_malformed_field_is_reported():
+    records = list(parse_bibtex(lines('''
+@book{bad, title {No equals sign}}
+@book{good, title = {Good}}
+''')))
+    assert isinstance(records[0], InvalidRecord)
+    assert records[0].line == 1
+    assert records[1]['title'] == 'Good'
+
+
+def test_ris_record_without_er():
+    records = list(parse_ris(lines('''
+TY  - JOUR
+AU  - Smith, Jane
+TI  - A long title
+  continued here
+JO  - Journal
+PY  - 2019
+ER  -
+TY  - BOOK
+TI  - Missing its end
+TY  - BOOK
+TI  - A Book
+PB  - Press
+ER  -
+TY  - WEB
+TI  - Cut off at the end of the file
+''')))
+    assert records[0]['sourceType'] == 'journal'
+    assert records[0]['authors'] == ['Jane Smith']
+    assert records[0]['title'] == 'A long title continued here'
+    assert (records[1].line, records[1].error) == (8, 'Record missing ER')
+    assert records[2]['title'] == 'A Book'
+    assert (records[3].line, records[3].error) == (14, 'Record missing ER')
+    assert len(records) == 4
+
+
+def test_csv_quoted_multiline_field():
+    records = list(parse_csv(lines(
+        'type,authors,title,year,publisher\r\n'
+        'book,"Smith, Jane; John Doe","A title\r\nover two lines",2018,Press\r\n'
+        ',,,,\r\n'
+        'journal,Ann Lee,Article,2020,\r\n'
+    )))
+    assert records[0] == {
+        'sourceType': 'book',
+        'authors': ['Jane Smith', 'John Doe'],
+        'title': 'A title over two lines',
+        'year': '2018',
+        'publisher': 'Press',
+    }
+    assert records[1]['sourceType'] == 'journal'
+    assert len(records) == 2
+
+
+@pytest.fixture
+def headers():
+    with app.app_context():
+        user = User(email=f'import-{time.time_ns()}@example.com', password='x')
+        db.session.add(user)
+        db.session.commit()
+        return {'Authorization': f'Bearer {generate_token(user.id)}'}
+
+
+def test_import_reports_errors_per_entry(headers):
+    upload = (
+        b'@book{one, title = {One}, author = {Smith, Jane}, year = 2001, publisher = {Press}}\n'
+        b'@book{two, title {Two}}\n'
+        b'@online{three}\n'
+        b'@book{four, title = {Four}, author = {Doe, John}, year = 2004, publisher = {Press}}\n'
+    )
+    response = app.test_client().post('/api/bibliography/import', headers=headers, data={
+        'file': (io.BytesIO(upload), 'library.bib'),
+    })
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report['bibliography']['name'] == 'library'
+    assert report['imported'] == 2
+    assert report['failed'] == 2
+    assert report['errors'][0]['entry'] == 2
+    assert report['errors'][0]['line'] == 2
+    assert report['errors'][1] == {'entry': 3, 'error': 'Error formatting citation'}
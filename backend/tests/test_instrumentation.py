@@ -0,0 +1,19 @@
+import instrumentation
+
+
+def samples():
+    return dict(line.rsplit(' ', 1) for line in instrumentation.render().splitlines() if not line.startswith('#'))
+
+
+def test_large_counts_are_rendered_in_full():
+    instrumentation.reset()
+    instrumentation.inc('citation_extractions_total', 1234567, result='success')
+    for _ in range(3):
+        instrumentation.observe('http_request_duration_seconds', 0.2, endpoint='x')
+    instrumentation.inc('citation_extractions_total', 2_000_000, result='success')
+
+    rendered = samples()
+    assert rendered['citation_extractions_total{result="success"}'] == '3234567'
+    assert rendered['http_request_duration_seconds_bucket{endpoint="x",le="0.25"}'] == '3'
+    assert rendered['http_request_duration_seconds_count{endpoint="x"}'] == '3'
+    assert float(rendered['http_request_duration_seconds_sum{endpoint="x"}']) == 0.2 + 0.2 + 0.2
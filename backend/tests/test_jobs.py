@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import jobs
+
+
+def stalled_job(pid, boot='gone', updated_at=None):
+    """Insert a running job that nothing is working on, owned by pid on this host."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = jobs._conn()
+    conn.execute(
+        'INSERT INTO job (id, kind, status, total, created_at, updated_at, owner_host, owner_pid, owner_boot) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (job_id, 'stall', jobs.RUNNING, 1, now, updated_at or now, jobs._owner_id()[0], pid, boot),
+    )
+    conn.commit()
+    return job_id
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_jobs_of_dead_workers_fail_at_startup():
+    orphan = stalled_job(dead_pid())
+    assert orphan in jobs.recover_orphans()
+    job = jobs.get_job(orphan)
+    assert job['status'] == jobs.FAILED
+    assert job['error'] == jobs.ORPHANED_ERROR
+
+
+def test_lookup_fails_orphaned_job_and_follow_ends():
+    orphan = stalled_job(dead_pid())
+    start = time.monotonic()
+    assert list(jobs.follow(orphan, poll_interval=0.01)) == []
+    assert time.monotonic() - start < 1
+    assert jobs.get_job(orphan)['status'] == jobs.FAILED
+
+
+def test_earlier_process_with_our_pid_is_detected():
+    orphan = stalled_job(os.getpid(), boot='earlier-boot')
+    assert orphan in jobs.recover_orphans()
+
+
+def test_jobs_of_live_workers_are_left_alone():
+    live = stalled_job(os.getppid())
+    assert live not in jobs.recover_orphans()
+    assert jobs.get_job(live)['status'] == jobs.RUNNING
+
+
+def test_follow_gives_up_after_max_duration():
+    live = stalled_job(os.getppid())
+    start = time.monotonic()
+    assert list(jobs.follow(live, poll_interval=0.01, max_duration=0.2)) == []
+    assert 0.2 <= time.monotonic() - start < 1
@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import OperationalError
+
+import migrations
+from models import db
+
+
+class RacingMetadata:
+    """Fails like a worker that lost the CREATE TABLE race, `losses` times."""
+
+    def __init__(self, losses):
+        self.losses = losses
+        self.calls = 0
+
+    def create_all(self, bind):
+        self.calls += 1
+        if self.calls <= self.losses:
+            raise OperationalError('CREATE TABLE user', {}, Exception('table user already exists'))
+        db.metadata.create_all(bind=bind)
+
+
+def test_create_tables_retries_a_lost_race(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'race.db'}")
+    metadata = RacingMetadata(losses=1)
+    migrations.create_tables(engine, metadata)
+    assert metadata.calls == 2
+    assert 'citation' in inspect(engine).get_table_names()
+
+
+def test_create_tables_gives_up_eventually(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'race.db'}")
+    with pytest.raises(OperationalError):
+        migrations.create_tables(engine, RacingMetadata(losses=3))
+
+
+def test_workers_starting_together(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'race.db'}")
+    for _ in range(2):
+        migrations.create_tables(engine)
+        migrations.upgrade(engine)
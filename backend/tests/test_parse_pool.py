@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+import metadata_parser
+import parse_pool
+
+HTML = '<html><head><title>Pooled page</title></head><body>' + 'x' * 200 + '</body></html>'
+URL = 'https://example.com/page'
+
+
+def slow_parse(html, url):
+    time.sleep(0.5)
+    return metadata_parser.parse_metadata(html, url), {}
+
+
+@pytest.fixture(autouse=True)
+def pool(monkeypatch):
+    monkeypatch.setattr(parse_pool, 'PARSE_WORKERS', 1)
+    monkeypatch.setattr(parse_pool, 'PARSE_POOL_MIN_SIZE', 0)
+    monkeypatch.setattr(parse_pool, '_slots', threading.BoundedSemaphore(1))
+    yield
+    if parse_pool._executor is not None:
+        parse_pool._discard_executor(parse_pool._executor)
+
+
+def test_large_pages_parse_on_the_pool(monkeypatch):
+    parse_pool.warm_up()
+    # Patched only here in the test process; the pool forked before this
+    inline = []
+    monkeypatch.setattr(parse_pool, 'parse_metadata', lambda html, url: inline.append(url))
+    assert parse_pool.parse(HTML, URL)['title'] == 'Pooled page'
+    assert inline == []
+
+
+def test_timeout_parses_inline_and_keeps_the_slot(monkeypatch):
+    monkeypatch.setattr(parse_pool, '_parse', slow_parse)
+    monkeypatch.setattr(parse_pool, 'PARSE_TIMEOUT', 0.05)
+    assert parse_pool.parse(HTML, URL)['title'] == 'Pooled page'
+    # The timed-out document is still on the pool, so the queue is full
+    assert parse_pool._parse_on_pool(HTML, URL) is None
+
+    time.sleep(0.8)
+    monkeypatch.setattr(parse_pool, 'PARSE_TIMEOUT', 5)
+    assert parse_pool._parse_on_pool(HTML, URL)['title'] == 'Pooled page'
+
+
+def test_full_queue_parses_inline():
+    assert parse_pool._slots.acquire(blocking=False)
+    try:
+        assert parse_pool._parse_on_pool(HTML, URL) is None
+        assert parse_pool.parse(HTML, URL)['title'] == 'Pooled page'
+    finally:
+        parse_pool._slots.release()
+
+
+def test_submit_to_a_replaced_pool_parses_inline():
+    executor = parse_pool.get_executor()
+    executor.shutdown()
+    assert parse_pool.parse(HTML, URL)['title'] == 'Pooled page'
+    assert parse_pool.get_executor() is not executor
+    # The slot was given back
+    assert parse_pool._slots.acquire(blocking=False)
+    parse_pool._slots.release()
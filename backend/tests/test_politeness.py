@@ -0,0 +1,51 @@
+import pytest
+import requests
+
+import app
+import http_client
+import politeness
+from politeness import HostThrottle, HostThrottled
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(politeness.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_idle_buckets_are_dropped(clock):
+    throttle = HostThrottle(rate=2, burst=4)
+    for n in range(1000):
+        throttle.acquire(f'host{n}.example')
+    throttle.back_off('blocked.example', 300)
+    assert len(throttle) == 1001
+
+    clock[0] += politeness.IDLE_SWEEP_INTERVAL + 1
+    assert throttle.ready_in('other.example') == 0
+    assert len(throttle) == 2
+    assert throttle.ready_in('blocked.example') > 0
+
+
+def test_transport_does_not_retry_backoff_statuses():
+    retry = http_client.build_session().get_adapter('https://example.com').max_retries
+    assert not set(politeness.BACKOFF_STATUSES) & set(retry.status_forcelist)
+
+
+def test_throttled_extraction_is_not_cached(monkeypatch):
+    cached = []
+    monkeypatch.setattr(app.metadata_cache, 'set', lambda url, value: cached.append(url))
+
+    def throttled(url, **kwargs):
+        raise HostThrottled('example.com is rate limited, retry in 30s')
+
+    monkeypatch.setattr(http_client, 'get', throttled)
+    assert app.extract_and_cache('https://example.com/a') is None
+    assert cached == []
+
+    def refused(url, **kwargs):
+        raise requests.ConnectionError('refused')
+
+    monkeypatch.setattr(http_client, 'get', refused)
+    assert app.extract_and_cache('https://example.com/b') is None
+    assert cached == ['https://example.com/b']
@@ -0,0 +1,72 @@
+"""
+SQL statement budgets for the bibliography endpoints. Each endpoint must
+issue the same small number of queries whatever the data size; going over
+means an N+1 query crept in.
+"""
+import time
+
+import pytest
+
+import repository
+from app import app
+from auth import generate_token
+from models import db, User, Bibliography, Citation
+
+BIBLIOGRAPHIES = 60
+CITATIONS_PER_BIBLIOGRAPHY = 10
+PAGE = 20
+
+
+@pytest.fixture(scope='module')
+def seeded():
+    with app.app_context():
+        user = User(email=f'queries-{time.time_ns()}@example.com', password='x')
+        db.session.add(user)
+        db.session.commit()
+        db.session.execute(Bibliography.__table__.insert(), [
+            {'name': f'Bibliography {i}', 'user_id': user.id} for i in range(BIBLIOGRAPHIES)
+        ])
+        ids = [row.id for row in db.session.query(Bibliography.id).filter_by(user_id=user.id)]
+        for bibliography_id in ids:
+            db.session.execute(Citation.__table__.insert(), [
+                {'source_type': 'book', 'style': 'APA', 'citation_text': f'Citation {i}',
+                 'source_data': {'title': f'Book {i}'}, 'bibliography_id': bibliography_id}
+                for i in range(CITATIONS_PER_BIBLIOGRAPHY)
+            ])
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {generate_token(user.id)}'}
+    client = app.test_client()
+    # Warm the token cache so only the endpoint's own queries are counted
+    assert client.get('/auth/profile', headers=headers).status_code == 200
+    return client, headers, ids
+
+
+def queries(client, headers, path, **query):
+    with repository.count_queries() as counter:
+        response = client.get(path, headers=headers, query_string=query)
+        response.get_data()
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return counter['queries'], response
+
+
+def test_list_bibliographies(seeded):
+    client, headers, _ = seeded
+    count, response = queries(client, headers, '/api/bibliography', limit=PAGE)
+    assert count <= 1
+    cursor = response.headers['X-Next-Cursor']
+    count, _ = queries(client, headers, '/api/bibliography', limit=PAGE, cursor=cursor)
+    assert count <= 1
+
+
+def test_list_bibliographies_with_citations(seeded):
+    client, headers, _ = seeded
+    count, response = queries(client, headers, '/api/bibliography', limit=PAGE, include='citations')
+    assert count <= 2
+    assert len(response.get_json()) == PAGE
+
+
+def test_list_citations(seeded):
+    client, headers, ids = seeded
+    count, response = queries(client, headers, f'/api/bibliography/{ids[-1]}/citations', limit=5)
+    assert count <= 2
+    assert len(response.get_json()) == 5
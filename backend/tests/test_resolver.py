@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+import resolver
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('0-306-40615-2', ('isbn', '9780306406157')),
+    ('ISBN 080442957X', ('isbn', '9780804429573')),
+    ('isbn:978-0-306-40615-7', ('isbn', '9780306406157')),
+    ('0-306-40615-3', None),
+    ('9780306406158', None),
+    ('10.1000/XYZ123', ('doi', '10.1000/xyz123')),
+    ('https://doi.org/10.1000/xyz123', ('doi', '10.1000/xyz123')),
+    ('http://dx.doi.org/10.1000/xyz123', ('doi', '10.1000/xyz123')),
+    ('doi: 10.1000/xyz123', ('doi', '10.1000/xyz123')),
+    ('  DOI:10.1000/xyz123  ', ('doi', '10.1000/xyz123')),
+    ('https://example.com/10.1000/xyz123', None),
+    ('hello', None),
+    (12345, None),
+])
+def test_parse_identifier(value, expected):
+    assert resolver.parse_identifier(value) == expected
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(resolver, 'RESOLVER_DB_PATH', str(tmp_path / 'identifiers.db'))
+    monkeypatch.setattr(resolver, '_local', threading.local())
+    monkeypatch.setattr(resolver, '_schema_ready', False)
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    calls = []
+
+    def stub(kind, known):
+        def lookup(values):
+            calls.append((kind, list(values)))
+            return {value: {'sourceType': 'book', 'title': known[value]} for value in values if value in known}
+        return lookup
+
+    monkeypatch.setitem(resolver.REMOTE_BACKENDS, 'doi', stub('doi', {'10.1000/a': 'A', '10.1000/b': 'B'}))
+    monkeypatch.setitem(resolver.REMOTE_BACKENDS, 'isbn', stub('isbn', {'9780306406157': 'Book'}))
+    return calls
+
+
+def test_resolve_many_asks_each_backend_once(index, backends):
+    results = resolver.resolve_many([
+        '10.1000/a', '0-306-40615-2', 'https://doi.org/10.1000/A', '10.1000/b', 'nonsense', '10.1000/missing',
+    ], remote=True)
+
+    assert sorted(backends) == [('doi', ['10.1000/a', '10.1000/b', '10.1000/missing']), ('isbn', ['9780306406157'])]
+    assert [record and record['title'] for record, _ in results] == ['A', 'Book', 'A', 'B', None, None]
+    assert [error for _, error in results] == [None, None, None, None, resolver.NOT_AN_IDENTIFIER, resolver.NOT_FOUND]
+
+
+def test_remote_answers_are_cached_including_not_found(index, backends):
+    resolver.resolve_many(['10.1000/a', '10.1000/missing'], remote=True)
+    backends.clear()
+
+    assert resolver.resolve('10.1000/missing', remote=True) == (None, resolver.NOT_FOUND)
+    assert resolver.resolve('10.1000/a', remote=True)[0]['title'] == 'A'
+    assert backends == []
+
+
+def test_expired_not_found_is_asked_again(index, backends, monkeypatch):
+    resolver.resolve('10.1000/missing', remote=True)
+    monkeypatch.setattr(resolver, 'NEGATIVE_TTL', 0)
+    backends.clear()
+
+    resolver.resolve('10.1000/missing', remote=True)
+    assert backends == [('doi', ['10.1000/missing'])]
+
+
+def test_failed_backend_is_not_cached(index, backends, monkeypatch):
+    working = resolver.REMOTE_BACKENDS['doi']
+
+    def broken(values):
+        raise OSError('unreachable')
+
+    monkeypatch.setitem(resolver.REMOTE_BACKENDS, 'doi', broken)
+    assert resolver.resolve('10.1000/a', remote=True) == (None, resolver.NOT_FOUND)
+
+    monkeypatch.setitem(resolver.REMOTE_BACKENDS, 'doi', working)
+    assert resolver.resolve('10.1000/a', remote=True)[0]['title'] == 'A'
+    assert backends == [('doi', ['10.1000/a'])]
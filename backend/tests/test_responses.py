@@ -0,0 +1,102 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, Response, jsonify
+
+import responses
+
+ROWS = [{'url': f'https://example.com/{i}', 'success': True, 'cached': False} for i in range(100)]
+DECODERS = {'gzip': gzip.decompress}
+if responses.brotli is not None:
+    DECODERS['br'] = responses.brotli.decompress
+if responses.zstandard is not None:
+    DECODERS['zstd'] = lambda data: responses.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    responses.init_app(app)
+
+    @app.route('/big')
+    def big():
+        return jsonify(ROWS)
+
+    @app.route('/small')
+    def small():
+        return jsonify(ROWS[:1])
+
+    @app.route('/export')
+    def export():
+        return Response((f'Citation {i}\n' for i in range(500)), mimetype='text/plain')
+
+    @app.route('/events')
+    def events():
+        return Response((f'data: {i}\n\n' for i in range(500)), mimetype='text/event-stream')
+
+    @app.route('/ndjson')
+    def ndjson():
+        return Response((json.dumps(row) + '\n' for row in ROWS), mimetype='application/x-ndjson')
+
+    @app.route('/batch')
+    def batch():
+        return responses.batch_response([{'url': 'a', 'success': True, 'metadata': {'title': 'A'}},
+                                         {'url': 'b', 'success': False, 'error': 'Failed'}])
+
+    return app.test_client()
+
+
+@pytest.mark.parametrize('accept, expected', [
+    ('gzip', 'gzip'),
+    ('gzip, br', 'br'),
+    ('gzip, br, zstd', 'zstd'),
+    ('*', 'zstd'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('zstd;q=0, br;q=0.2, gzip;q=0.1', 'br'),
+    ('zstd;q=0, br;q=0, gzip;q=0', None),
+    ('identity', None),
+    ('', None),
+])
+def test_encoding_follows_accept_encoding(client, accept, expected):
+    if set(responses.ENCODINGS) != {'gzip', 'br', 'zstd'}:
+        pytest.skip('needs brotli and zstandard installed')
+    response = client.get('/big', headers={'Accept-Encoding': accept})
+    assert response.headers.get('Content-Encoding') == expected
+    data = DECODERS[expected](response.data) if expected else response.data
+    assert json.loads(data) == ROWS
+
+
+def test_small_responses_are_not_compressed(client):
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert len(response.data) < responses.COMPRESS_MIN_SIZE
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_vary_set_on_compressed_and_uncompressed(client):
+    for accept in ('gzip', 'identity'):
+        assert 'Accept-Encoding' in client.get('/big', headers={'Accept-Encoding': accept}).headers['Vary']
+
+
+def test_streamed_export_is_compressed(client):
+    response = client.get('/export', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(response.data).decode() == ''.join(f'Citation {i}\n' for i in range(500))
+
+
+@pytest.mark.parametrize('path', ['/events', '/ndjson'])
+def test_event_streams_are_left_alone(client, path):
+    response = client.get(path, headers={'Accept-Encoding': 'gzip, br, zstd'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.data.startswith(b'data: 0' if path == '/events' else b'{')
+
+
+def test_columnar_round_trips_to_rows(client):
+    rows = client.get('/batch').get_json()
+    table = client.get('/batch?format=columnar').get_json()
+    assert table['count'] == 2
+    keys = [key for key in table if key != 'count']
+    rebuilt = [{key: table[key][i] for key in keys if table[key][i] is not None} for i in range(table['count'])]
+    assert rebuilt == rows
@@ -0,0 +1,33 @@
+from metadata_parser import parse_metadata
+
+import structured_data
+
+
+def nested(depth):
+    return '{"name": ' * depth + '"x"' + '}' * depth
+
+
+def test_deeply_nested_block_is_skipped():
+    html = (
+        '<html><head><title>Fallback title</title>'
+        '<meta property="og:site_name" content="Example">'
+        f'<script type="application/ld+json">{nested(5000)}</script>'
+        '</head></html>'
+    )
+    metadata = parse_metadata(html, 'https://example.com/page')
+    assert metadata['title'] == 'Fallback title'
+    assert metadata['publisher'] == 'Example'
+
+
+def test_deep_graph_is_bounded():
+    # Parses as JSON but nests deeper than MAX_JSON_LD_DEPTH
+    depth = 500
+    payload = '{"@type": "Article", "headline": "Top", "about": ' + nested(depth) + '}'
+    fields = structured_data.resolve([payload])
+    assert fields['title'] == 'Top'
+
+
+def test_other_blocks_still_used():
+    good = '{"@type": "Article", "headline": "Good headline"}'
+    fields = structured_data.resolve([nested(5000), good])
+    assert fields['title'] == 'Good headline'
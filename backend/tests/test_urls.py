@@ -0,0 +1,67 @@
+import pytest
+
+import app as app_module
+from app import app
+from urls import cache_key, canonicalize, dedupe
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://example.com/a?utm_source=x&id=1&fbclid=y', 'https://example.com/a?id=1'),
+    ('https://example.com/a?gclid=1', 'https://example.com/a'),
+    ('https://example.com/a/', 'https://example.com/a'),
+    ('https://example.com/', 'https://example.com/'),
+    ('https://example.com', 'https://example.com/'),
+    ('HTTPS://Example.COM:443/a#section', 'https://example.com/a'),
+    ('https://example.com/a?b=2&a=1', 'https://example.com/a?a=1&b=2'),
+    ('https://example.com/%7euser/%2f', 'https://example.com/~user/%2F'),
+    ('https://bücher.example/a', 'https://xn--bcher-kva.example/a'),
+    ('  https://example.com/a  ', 'https://example.com/a'),
+    ('not a url', 'not a url'),
+])
+def test_canonicalize(url, expected):
+    assert canonicalize(url) == expected
+
+
+def test_http_and_https_share_a_cache_key():
+    assert cache_key('http://example.com/a/') == cache_key('https://example.com/a')
+    assert cache_key('http://example.com:80/a') == cache_key('https://example.com:443/a')
+
+
+def test_idn_host_matches_its_punycode_form():
+    assert cache_key('https://BÜCHER.example/a') == cache_key('https://xn--bcher-kva.example/a')
+
+
+def test_dedupe_keeps_first_form_and_every_position():
+    urls = ['http://example.com/a', 'https://example.com/b', 'https://example.com/a/?utm_medium=x',
+            5, 'https://example.com/b', 5]
+    unique, positions = dedupe(urls)
+    assert unique == ['http://example.com/a', 'https://example.com/b', 5]
+    assert positions == [[0, 2], [1, 4], [3, 5]]
+
+
+def test_batch_fans_results_out_to_original_positions(monkeypatch):
+    fetched = []
+
+    def fake_extract(url):
+        fetched.append(url)
+        return {'title': url}, 'success'
+
+    monkeypatch.setattr(app_module, '_extract_metadata', fake_extract)
+    urls = ['https://example.com/a', 'https://example.com/b', 'http://example.com/a/?utm_source=x', 7,
+            'https://example.com/b']
+    response = app.test_client().post('/api/batch-extract-metadata', json={'urls': urls})
+    assert response.status_code == 200
+    results = response.get_json()
+
+    assert sorted(fetched) == ['https://example.com/a', 'https://example.com/b']
+    assert [result['url'] for result in results] == urls
+    assert [result['success'] for result in results] == [True, True, True, False, True]
+    assert results[2]['metadata'] == {'title': 'https://example.com/a'}
+    assert results[4]['metadata'] == {'title': 'https://example.com/b'}
+    assert results[3]['error'] == 'Failed to extract metadata'
+
+
+def test_single_extraction_rejects_non_string_url():
+    response = app.test_client().post('/api/extract-metadata', json={'url': 12})
+    assert response.status_code == 400
+    assert response.get_json()['error'].startswith('Failed to extract metadata')
@@ -0,0 +1,101 @@
+"""
+URL canonicalization.
+
+canonicalize() rewrites a URL into the form we fetch: lower-cased scheme and
+host, no default port, fragment or tracking parameters, normalized percent
+escapes, sorted query parameters and no trailing slash. cache_key() goes one
+step further and ignores http vs https, so both schemes share cached and
+stored metadata. dedupe() collapses a batch to one entry per cache key.
+"""
+import re
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = frozenset({
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'oly_anon_id', 'oly_enc_id',
+    'vero_id', 'spm', 'ref_src',
+})
+TRACKING_PREFIXES = ('utm_', 'pk_', 'mtm_')
+
+_ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+_UNRESERVED = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def _normalize_escapes(value):
+    """Decode escaped unreserved characters and upper-case the rest (RFC 3986 6.2.2)."""
+    def replace(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in _UNRESERVED else '%' + match.group(1).upper()
+    return _ESCAPE.sub(replace, value)
+
+
+def _host(parts, scheme):
+    host = (parts.hostname or '').lower().rstrip('.')
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    if ':' in host:
+        host = f'[{host}]'
+    port = parts.port
+    if port and port != _DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{port}'
+    return host
+
+
+def canonicalize(url):
+    """Return the canonical form of url, or url stripped of whitespace if it cannot be parsed."""
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        host = _host(parts, scheme)
+    except ValueError:
+        return url
+    if scheme not in _DEFAULT_PORTS or not host:
+        return url
+
+    path = _normalize_escapes(parts.path) or '/'
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+    # Parameters are kept as written; sorting by name is stable, so repeated
+    # names keep their relative order
+    params = [_normalize_escapes(param) for param in parts.query.split('&') if param]
+    params = [param for param in params if not _is_tracking(unquote_plus(param.partition('=')[0]))]
+    query = '&'.join(sorted(params, key=lambda param: param.partition('=')[0]))
+    userinfo = parts.netloc.rpartition('@')[0]
+    netloc = f'{userinfo}@{host}' if userinfo else host
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def cache_key(url):
+    """Key for caching metadata about url; http and https share it."""
+    canonical = canonicalize(url)
+    if canonical.startswith('http://'):
+        return 'https://' + canonical[len('http://'):]
+    return canonical
+
+
+def dedupe(urls):
+    """
+    Return (unique, positions): the canonical form of the first URL seen for
+    each cache key, and for each of those the indexes in urls it stands for.
+    """
+    unique, positions, seen = [], [], {}
+    for index, url in enumerate(urls):
+        key = cache_key(url) if isinstance(url, str) else repr(url)
+        slot = seen.get(key)
+        if slot is None:
+            slot = seen[key] = len(unique)
+            unique.append(canonicalize(url) if isinstance(url, str) else url)
+            positions.append([])
+        positions[slot].append(index)
+    return unique, positions